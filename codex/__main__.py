@@ -5,6 +5,7 @@ import os
 import click
 
 import codex.debug
+import codex.perf
 from codex.app import db_client as prisma_client
 from codex.common.logging_config import setup_logging
 from codex.tests.frontend_gen_test import generate_user_interface
@@ -18,6 +19,7 @@ def cli():
 
 
 cli.add_command(cmd=codex.debug.debug)  # type: ignore
+cli.add_command(cmd=codex.perf.perf)  # type: ignore
 
 
 @cli.command()
@@ -60,7 +62,14 @@ def populate_db(database):
 @click.option(
     "-c", "--count", default=0, help="Number of examples to run from the benchmark"
 )
-def benchmark(base_url: str, requirements_only: bool, count: int):
+@click.option(
+    "-b",
+    "--batch",
+    type=click.Choice(["openai", "local"]),
+    default=None,
+    help="Run the benchmark in this process, sending the LLM calls in batch jobs",
+)
+def benchmark(base_url: str, requirements_only: bool, count: int, batch: str | None):
     """Run the benchmark tests"""
 
     import codex.common.test_const
@@ -81,7 +90,13 @@ def benchmark(base_url: str, requirements_only: bool, count: int):
         click.echo("Running requirements generation only")
 
     async def run_tasks():
-        user = await codex.runner.create_benchmark_user(prisma_client, base_url)
+        if batch:
+            # The calls wait hours for their batch jobs, longer than any HTTP
+            # timeout: the API is called in this process instead of the server
+            await setup_batches(batch)
+        user = await codex.runner.create_benchmark_user(
+            prisma_client, base_url, local=bool(batch)
+        )
 
         awaitables = [
             codex.runner.run_task(
@@ -91,11 +106,14 @@ def benchmark(base_url: str, requirements_only: bool, count: int):
                 prisma_client=prisma_client,
                 base_url=base_url,
                 requirements_only=requirements_only,
+                local=bool(batch),
             )
             for task in tasks
         ]
         # Run all tasks concurrently
-        await asyncio.gather(*awaitables)
+        results = await asyncio.gather(*awaitables)
+        if not all(results):
+            click.echo(f"{results.count(False)} of {len(tasks)} tasks failed")
 
     loop = asyncio.new_event_loop()
     asyncio.set_event_loop(loop)
@@ -105,6 +123,21 @@ def benchmark(base_url: str, requirements_only: bool, count: int):
     loop.run_until_complete(prisma_client.disconnect())
 
 
+async def setup_batches(batch: str):
+    """
+    Send the LLM calls of this process in jobs of the given batch backend.
+    """
+    from codex.common.ai_model import OpenAIChatClient
+    from codex.common.batch import create_batch_backend
+    from codex.common.exec_external_tool import setup_if_required
+
+    OpenAIChatClient.configure({})
+    OpenAIChatClient.use_batches(
+        create_batch_backend(batch, OpenAIChatClient.get_instance().openai)
+    )
+    await setup_if_required()
+
+
 @cli.command()
 @click.option(
     "-u",
@@ -242,6 +275,22 @@ def analytics():
     )
 
 
+@cli.command()
+def index_functions():
+    """
+    Index the existing functions by signature, so they can be reused by new apps.
+    """
+    from codex.develop.reuse import index_functions
+
+    async def run_tasks():
+        await prisma_client.connect()
+        indexed = await index_functions()
+        await prisma_client.disconnect()
+        print(f"Indexed {indexed} functions")
+
+    asyncio.run(run_tasks())
+
+
 @cli.command()
 def costs():
     import codex.analytics
@@ -290,6 +339,10 @@ def resume(base_url: str):
         valid_options.add("s")
         valid_options.add("S")
     if selected_resume_point.completedAppId:
+        # Running from the functions developed so far
+        resume_options.append("Development checkpoint (r)")
+        valid_options.add("r")
+        valid_options.add("R")
         # Running from a completed App
         resume_options.append("Completed App (c)")
         valid_options.add("c")
@@ -317,6 +370,11 @@ def resume(base_url: str):
         print("Resuming from specification...")
         step = codex.runner.ResumeStep.DEVELOPMENT
 
+    from_checkpoint = selection in set(["r", "R"])
+    if from_checkpoint:
+        print("Resuming from the functions developed so far...")
+        step = codex.runner.ResumeStep.DEVELOPMENT
+
     if selection in set(["c", "C"]):
         print("Resuming from the developed (completed) app...")
         step = codex.runner.ResumeStep.COMPILE
@@ -331,6 +389,7 @@ def resume(base_url: str):
             resume_point=selected_resume_point,
             prisma_client=prisma_client,
             base_url=base_url,
+            from_checkpoint=from_checkpoint,
         )
     )
     loop.run_until_complete(prisma_client.disconnect())
@@ -339,7 +398,14 @@ def resume(base_url: str):
 @cli.command()
 @click.option("-g", "--groq", is_flag=True, default=False, help="Run a GROQ query")
 @click.option("-m", "--model", default=None, help="Override LLM to use")
-def serve(groq: bool, model: str) -> None:
+@click.option(
+    "-b",
+    "--batch",
+    type=click.Choice(["openai", "local"]),
+    default=None,
+    help="Send the LLM calls in batch jobs, for non-interactive runs",
+)
+def serve(groq: bool, model: str, batch: str | None) -> None:
     import uvicorn
 
     from codex.common.ai_model import OpenAIChatClient
@@ -360,6 +426,12 @@ def serve(groq: bool, model: str) -> None:
         )
     else:
         OpenAIChatClient.configure(config)
+    if batch:
+        from codex.common.batch import create_batch_backend
+
+        OpenAIChatClient.use_batches(
+            create_batch_backend(batch, OpenAIChatClient.get_instance().openai)
+        )
 
     logger.info("Setting up code analysis tools...")
     initial_setup = setup_if_required()
@@ -111,6 +111,10 @@ async def get_costs():
 
     calls = await prisma.models.LLMCallAttempt.prisma().find_many()
     calls_data = pd.DataFrame([d.model_dump() for d in calls])
+    # The prompt tokens read from the provider cache are billed at half price
+    calls_data["billedPromptTokens"] = (
+        calls_data["promptTokens"] - calls_data["cachedPromptTokens"] / 2
+    )
 
     # Merge calls with templates
     result = calls_data.merge(
@@ -120,12 +124,12 @@ async def get_costs():
 
     # Calculate total cost
     per_app = result.groupby(["applicationId", "developmentPhase"])[
-        ["completionTokens", "promptTokens"]
+        ["completionTokens", "billedPromptTokens"]
     ].sum()
     # Adjusted section for calculating total cost
     per_app = per_app.assign(
         completionCost=per_app["completionTokens"] * 30 / 1_000_000,
-        promptCost=per_app["promptTokens"] * 10 / 1_000_000,
+        promptCost=per_app["billedPromptTokens"] * 10 / 1_000_000,
     )
     per_app["total_cost"] = per_app["completionCost"] + per_app["promptCost"]
 
@@ -145,13 +149,13 @@ async def get_costs():
 
     # # Calculate retries cost
     retries_result = (
-        retries_result[["applicationId", "completionTokens", "promptTokens"]]
+        retries_result[["applicationId", "completionTokens", "billedPromptTokens"]]
         .groupby(["applicationId"])
         .sum()
     )
     retries_cost = retries_result.assign(
         completionCost=retries_result["completionTokens"] * 30 / 1_000_000,
-        promptCost=retries_result["promptTokens"] * 10 / 1_000_000,
+        promptCost=retries_result["billedPromptTokens"] * 10 / 1_000_000,
     )
     retries_cost["total_cost"] = (
         retries_cost["completionCost"] + retries_cost["promptCost"]
@@ -160,6 +164,9 @@ async def get_costs():
     retries_cost = retries_cost["total_cost"].median()
 
     retries_percentage = (retries_cost / per_app_cost) * 100
+    cached_percentage = (
+        result["cachedPromptTokens"].sum() / max(result["promptTokens"].sum(), 1) * 100
+    )
 
     await db.disconnect()
 
@@ -170,6 +177,8 @@ Median Requirements phase cost: {click.style(f'${req_cost:.2f}', fg='blue', bold
 Median Development phase cost: {click.style(f'${dev_cost:.2f}', fg='blue', bold=True)}
 
 Median Cost due to retries: {click.style(f'${retries_cost:.2f}', fg='red', bold=True)} = {click.style(f'{retries_percentage:.0f}%', fg='red', bold=True)} of cost is due to needing to retry
+
+Prompt tokens read from the cache: {click.style(f'{cached_percentage:.0f}%', fg='green', bold=True)}
 """
 
     click.echo(output_message)
@@ -8,14 +8,16 @@ from typing import Any, Callable, Optional, Type
 
 import prisma
 from dotenv import load_dotenv
-from jinja2 import Environment, FileSystemLoader
+from jinja2 import Environment, FileSystemLoader, TemplateNotFound
 from prisma.enums import DevelopmentPhase
 from prisma.fields import Json
 from prisma.models import LLMCallAttempt, LLMCallTemplate
 from pydantic import BaseModel, ConfigDict
 
 from codex.api_model import Identifiers
-from codex.common.ai_model import OpenAIChatClient
+from codex.common.ai_model import MAX_COMPLETION_TOKENS, OpenAIChatClient
+from codex.common.cascade import get_first_model
+from codex.common.completion_stats import get_max_tokens
 
 load_dotenv()
 logger = logging.getLogger(__name__)
@@ -115,6 +117,7 @@ class ValidatedResponse(BaseModel):
     response: Any
     usage_statistics: CompletionUsage
     message: str
+    finish_reason: str | None = None
 
     class config:
         arbitrary_types_allowed = True
@@ -124,6 +127,14 @@ class ValidatedResponse(BaseModel):
 MOCK_RESPONSE = ""
 
 
+def get_cached_tokens(usage: CompletionUsage) -> int:
+    """
+    The number of prompt tokens read from the provider prompt cache.
+    """
+    details = getattr(usage, "prompt_tokens_details", None)
+    return (details.cached_tokens or 0) if details else 0
+
+
 class AIBlock:
     """
     The AI BLock is a base class for all AI Blocks. It provides a common interface for
@@ -152,6 +163,8 @@ class AIBlock:
     prompt_template_name = ""
     language = None
     model = ""
+    # Cheaper model called first, escalating to `model` on validation errors
+    cascade_model: str | None = None
     is_json_response = False
     pydantic_object = None
     template_base_path = "prompts"
@@ -211,9 +224,9 @@ class AIBlock:
         if self.language:
             lang_str = f"{self.language}."
 
-        prompts = {"system": "", "user": "", "retry": ""}
+        prompts = {"system": "", "context": "", "user": "", "retry": ""}
 
-        for key in ["system", "user", "retry"]:
+        for key in ["system", "context", "user", "retry"]:
             # Pattern to match the files
             pattern = (
                 f"{self.templates_dir}/{self.prompt_template_name}/{lang_str}{key}*.j2"
@@ -252,7 +265,7 @@ class AIBlock:
                     "fileHash": self.template_hash,
                     "model": self.model,
                     "systemPrompt": prompts["system"],
-                    "userPrompt": prompts["user"],
+                    "userPrompt": prompts["context"] + prompts["user"],
                     "retryPrompt": prompts["retry"],
                     "developmentPhase": self.developement_phase,
                 }
@@ -270,15 +283,17 @@ class AIBlock:
         attempt: int,
         prompt: Json,
         first_call_id: str | None = None,
+        model: str | None = None,
     ):
         if not self.call_template_id:
             raise AssertionError("Call template ID not set")
 
         data = prisma.types.LLMCallAttemptCreateInput(
-            model=self.model,
+            model=model or self.model,
             completionTokens=response.usage_statistics.completion_tokens,
             promptTokens=response.usage_statistics.prompt_tokens,
             totalTokens=response.usage_statistics.total_tokens,
+            cachedPromptTokens=get_cached_tokens(response.usage_statistics),
             attempt=attempt,
             prompt=prompt,
             response=response.message,
@@ -304,7 +319,9 @@ class AIBlock:
         call_attempt = await LLMCallAttempt.prisma().create(data=data)
         return call_attempt
 
-    def load_template(self, template: str, invoke_params: dict) -> str:
+    def load_template(
+        self, template: str, invoke_params: dict, optional: bool = False
+    ) -> str:
         try:
             lang_str = ""
             if self.language:
@@ -314,10 +331,37 @@ class AIBlock:
                 f"{self.prompt_template_name}/{lang_str}{template}.j2"
             )
             return prompt_template.render(**invoke_params)
+        except TemplateNotFound as e:
+            if optional:
+                return ""
+            logger.error(f"Error loading template: {e}")
+            raise PromptTemplateInvocationError(f"Error loading template: {e}")
         except Exception as e:
             logger.error(f"Error loading template: {e}")
             raise PromptTemplateInvocationError(f"Error loading template: {e}")
 
+    def load_retry_prompt(self, invoke_params: dict, error: ValidationError) -> str:
+        """
+        The prompt of a retry after the validation error of the previous generation,
+        the `generation`, `error` and `enhancements` are set in the invoke params.
+        """
+        return self.load_template("retry", invoke_params)
+
+    @staticmethod
+    def get_messages(system_prompt: str, context_prompt: str, prompt: str) -> list:
+        """
+        The providers cache the longest prompt prefix shared with the previous calls,
+        so the prompt segments are ordered from the most to the least shared:
+        the system template (static), the context template (per application) and
+        the user or retry template (per call).
+        """
+        if context_prompt:
+            prompt = f"{context_prompt}\n\n{prompt}"
+        return [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": prompt},
+        ]
+
     @staticmethod
     def messages_to_prompt_string(messages: list) -> str:
         prompt = ""
@@ -344,6 +388,7 @@ class AIBlock:
             response=message.content,
             usage_statistics=usage_statistics,
             message=message.content,
+            finish_reason=response.choices[0].finish_reason,
         )
 
     async def validate(
@@ -385,15 +430,28 @@ class AIBlock:
             if self.is_json_response:
                 invoke_params["format_instructions"] = self.get_format_instructions()
             system_prompt = self.load_template("system", invoke_params)
+            context_prompt = self.load_template("context", invoke_params, optional=True)
             user_prompt = self.load_template("user", invoke_params)
 
+            # A model set for the whole client (`codex serve --model`) replaces
+            # the models of the blocks, including their cascade
+            first_model = self.model
+            if not OpenAIChatClient.chat_model:
+                first_model = await get_first_model(
+                    self.prompt_template_name,
+                    self.model,
+                    self.language,
+                    self.cascade_model,
+                )
+
             request_params = {
-                "model": self.model,
-                "messages": [
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt},
-                ],
-                "max_tokens": 4095,
+                "model": first_model,
+                "messages": self.get_messages(
+                    system_prompt, context_prompt, user_prompt
+                ),
+                "max_tokens": await get_max_tokens(
+                    self.prompt_template_name, self.model, self.language
+                ),
             }
 
             if self.is_json_response:
@@ -402,7 +460,7 @@ class AIBlock:
             logger.error(f"Error creating request params: {e}")
             raise LLMFailure(f"Error creating request params: {e}")
         try:
-            presponse = await self.call_llm(request_params)
+            presponse = await self.call_llm_untruncated(request_params)
 
             first_llm_call_id = (
                 await self.store_call_attempt(
@@ -410,6 +468,7 @@ class AIBlock:
                     presponse,
                     retry_attempt,
                     Json(request_params["messages"]),
+                    model=request_params["model"],
                 )
             ).id
 
@@ -423,6 +482,12 @@ class AIBlock:
                 f"Failed initial generation attempt: {validation_error}, LLM Call ID: {first_llm_call_id}"
             )
             error_message = validation_error
+            if first_model != self.model:
+                logger.info(
+                    f"[{self.prompt_template_name}] Escalating from "
+                    f"{first_model} to {self.model}"
+                )
+                request_params["model"] = self.model
             while retry_attempt <= max_retries:
                 try:
                     if presponse:
@@ -443,12 +508,11 @@ class AIBlock:
                         all_enhancements = [error_message.enhancements]
                     invoke_params["enhancements"] = all_enhancements
 
-                    retry_prompt = self.load_template("retry", invoke_params)
-                    request_params["messages"] = [
-                        {"role": "system", "content": system_prompt},
-                        {"role": "user", "content": retry_prompt},
-                    ]
-                    presponse = await self.call_llm(request_params)
+                    retry_prompt = self.load_retry_prompt(invoke_params, error_message)
+                    request_params["messages"] = self.get_messages(
+                        system_prompt, context_prompt, retry_prompt
+                    )
+                    presponse = await self.call_llm_untruncated(request_params)
                     if not request_params["messages"]:
                         raise AssertionError("Messages not set")
 
@@ -458,6 +522,7 @@ class AIBlock:
                         retry_attempt,
                         Json(request_params["messages"]),
                         first_llm_call_id,
+                        model=request_params["model"],
                     )
                     validated_response = await self.validate(invoke_params, presponse)
                     break
@@ -481,6 +546,28 @@ class AIBlock:
         stored_obj = await self.create_item(ids, validated_response)
         return stored_obj if stored_obj else validated_response.response
 
+    async def call_llm_untruncated(self, request_params: dict) -> ValidatedResponse:
+        """
+        Call the LLM, and call it again right away with the maximum completion
+        size when the completion was truncated by an adaptive max_tokens: the
+        truncated completion is neither stored nor validated.
+        """
+        response = await self.call_llm(request_params)
+        max_tokens = request_params["max_tokens"]
+        if (
+            response.finish_reason == "length"
+            and max_tokens < MAX_COMPLETION_TOKENS
+            # A max_tokens set for the whole client is not adaptive
+            and not OpenAIChatClient.max_tokens
+        ):
+            logger.warning(
+                f"[{self.prompt_template_name}] Completion truncated at {max_tokens} "
+                "tokens, calling again with the maximum completion size"
+            )
+            request_params["max_tokens"] = MAX_COMPLETION_TOKENS
+            response = await self.call_llm(request_params)
+        return response
+
     async def call_llm(self, request_params: dict) -> ValidatedResponse:
         if MOCK_RESPONSE:
             return ValidatedResponse(
@@ -495,9 +582,17 @@ class AIBlock:
             logger.info(
                 f"📤 Calling LLM {request_params['model']} with the following input:\n {request_params['messages']}"
             )
-        response = await self.oai_client.chat(request_params)
+        response = await self.oai_client.chat(
+            request_params,
+            template=f"{self.prompt_template_name}/{self.language or 'default'}",
+        )
         if self.verbose and response:
             logger.info(f"📥 LLM response: {response}")
+            if response.usage:
+                logger.info(
+                    f"🗄️ Cached prompt tokens: {get_cached_tokens(response.usage)}"
+                    f"/{response.usage.prompt_tokens}"
+                )
         return self.parse(response)
 
     async def on_failed(self, ids: Identifiers, invoke_params: dict):
@@ -1,5 +1,10 @@
 import asyncio
+import functools
+import hashlib
 import logging
+import os
+import re
+from collections import OrderedDict
 from typing import Optional
 
 import tiktoken
@@ -10,15 +15,68 @@ logger = logging.getLogger(__name__)
 
 from openai import AsyncOpenAI  # noqa
 
+from codex.common.batch import BatchBackend, LLMBatcher  # noqa
+from codex.common.hedging import HEDGING, Hedger  # noqa
+from codex.common.llm_router import (  # noqa
+    LLM_ENDPOINTS,
+    LLMEndpoint,
+    LLMRouter,
+    load_endpoints,
+)
 
-def num_tokens_from_messages(messages):
-    """Just a rough estimate here."""
+# Maximum number of tokens of a completion
+MAX_COMPLETION_TOKENS = 4095
+TOKEN_COUNT_CACHE_SIZE = int(os.environ.get("TOKEN_COUNT_CACHE_SIZE", 65536))
+
+_token_counts: OrderedDict[bytes, int] = OrderedDict()
+# The tokenizer words never span a blank line followed by a non-blank character,
+# except the punctuation runs which can end with a slash
+PARAGRAPH_END = re.compile(r"(?<=\n\n)(?=[^\s/])")
+
+
+@functools.cache
+def get_encoding() -> tiktoken.Encoding:
     try:
-        encoding = tiktoken.encoding_for_model("gpt-4o")
+        return tiktoken.encoding_for_model("gpt-4o")
     except KeyError:
-        print("Warning: model not found. Using cl100k_base encoding.")
-        encoding = tiktoken.get_encoding("cl100k_base")
+        logger.warning("Model not found. Using cl100k_base encoding.")
+        return tiktoken.get_encoding("cl100k_base")
+
+
+def count_segment_tokens(segment: str) -> int:
+    """
+    Number of tokens of a prompt segment, memoized by content hash.
+    """
+    key = hashlib.blake2b(segment.encode(), digest_size=16).digest()
+    count = _token_counts.get(key)
+    if count is not None:
+        _token_counts.move_to_end(key)
+        return count
+
+    count = len(get_encoding().encode(segment, disallowed_special=()))
+    _token_counts[key] = count
+    if len(_token_counts) > TOKEN_COUNT_CACHE_SIZE:
+        _token_counts.popitem(last=False)
+    return count
+
+
+def count_tokens(text: str) -> int:
+    """
+    Number of tokens of a prompt, counted by paragraph: the paragraphs of the
+    static template segments are the same for every call, so only the variable
+    paragraphs are encoded. The paragraphs keep their trailing blank lines and
+    end before a non-blank character, where the tokenizer starts a new word
+    anyway, so the count is the one of the whole prompt.
+    """
+    return sum(count_segment_tokens(p) for p in PARAGRAPH_END.split(text))
+
+
+def clear_token_counts():
+    _token_counts.clear()
 
+
+def num_tokens_from_messages(messages):
+    """Just a rough estimate here."""
     tokens_per_message = 3
     tokens_per_name = 1
 
@@ -26,7 +84,7 @@ def num_tokens_from_messages(messages):
     for message in messages:
         num_tokens += tokens_per_message
         for key, value in message.items():
-            num_tokens += len(encoding.encode(value))
+            num_tokens += count_tokens(value)
             if key == "name":
                 num_tokens += tokens_per_name
     num_tokens += 3
@@ -43,6 +101,11 @@ class OpenAIChatClient:
     max_requests_per_min: int = 300
     max_tokens_per_min: int = 1_500_000
     _semaphore: asyncio.Semaphore
+    # Router over several endpoints, replacing the single client and rate limits
+    _router: LLMRouter | None = None
+    _hedger: Hedger | None = Hedger() if HEDGING else None
+    # Batch jobs replacing the real-time calls, for the non-interactive runs
+    _batcher: LLMBatcher | None = None
     _request_count: int = 0
     _last_request_time: float = 0
     _total_tokens_count: int = 0
@@ -54,6 +117,7 @@ class OpenAIChatClient:
         max_concurrent_ops=100,
         max_requests_per_min=10_000,
         max_tokens_per_min=1_500_000,
+        endpoints: list[LLMEndpoint] | None = None,
     ):
         if cls._instance is None:
             if "model" in openai_config:
@@ -68,9 +132,24 @@ class OpenAIChatClient:
             cls._instance = cls(openai_config)
             cls._configured = True
             cls._semaphore = asyncio.Semaphore(max_concurrent_ops)
+            if endpoints is None and LLM_ENDPOINTS:
+                endpoints = load_endpoints(LLM_ENDPOINTS)
+            if endpoints:
+                cls._router = LLMRouter(endpoints)
+                logger.info(
+                    f"Routing the LLM calls over {', '.join(e.name for e in endpoints)}"
+                )
         else:
             logger.warning("OpenAIChatClient instance has already been configured")
 
+    @classmethod
+    def use_batches(cls, backend: BatchBackend):
+        """
+        Send the chat completions in batch jobs of the given backend.
+        """
+        cls._batcher = LLMBatcher(backend)
+        logger.info(f"Sending the LLM calls in {type(backend).__name__} jobs")
+
     @classmethod
     def get_instance(cls) -> "OpenAIChatClient":
         if not cls._configured or cls._instance is None:
@@ -78,14 +157,46 @@ class OpenAIChatClient:
         return cls._instance
 
     @classmethod
-    async def chat(cls, req_params):
-        client = cls.get_instance()
-        MAX_COMPLETION_TOKENS = 4095
-        num_of_tokens_needed = (
-            num_tokens_from_messages(req_params["messages"]) + MAX_COMPLETION_TOKENS
-        )
+    async def chat(cls, req_params, template: str | None = None):
+        """
+        Create a chat completion within the rate limits.
+
+        Args:
+            req_params (dict): The chat completion parameters.
+            template (str | None): The prompt template of the call, the calls
+                                   slower than usual for their template are
+                                   hedged when HEDGING is enabled. It also
+                                   identifies the calls of the batch jobs.
+        """
+        if cls.chat_model:
+            req_params["model"] = cls.chat_model
+        if cls.max_tokens:
+            req_params["max_tokens"] = cls.max_tokens
+
+        # The completion can use up to max_tokens
+        num_of_tokens_needed = num_tokens_from_messages(
+            req_params["messages"]
+        ) + req_params.get("max_tokens", MAX_COMPLETION_TOKENS)
+
+        if cls._batcher:
+            # The batch jobs have their own rate limits
+            return await cls._batcher.chat(req_params, template)
+        if cls._hedger and template:
+            return await cls._hedger.run(
+                f"{template} ({req_params['model']})",
+                num_of_tokens_needed,
+                lambda: cls._create(req_params, num_of_tokens_needed),
+            )
+        return await cls._create(req_params, num_of_tokens_needed)
 
+    @classmethod
+    async def _create(cls, req_params, num_of_tokens_needed: int):
+        client = cls.get_instance()
         async with cls._semaphore:
+            if cls._router:
+                # The endpoints have their own rate limits
+                return await cls._router.chat(req_params, num_of_tokens_needed)
+
             current_time = asyncio.get_running_loop().time()
 
             # Check if the token limit per minute has been reached
@@ -99,11 +210,6 @@ class OpenAIChatClient:
                 cls._total_tokens_count = 0
                 cls._last_request_time = current_time
 
-            if cls.chat_model:
-                req_params["model"] = cls.chat_model
-            if cls.max_tokens:
-                req_params["max_tokens"] = cls.max_tokens
-
             response = await client.openai.chat.completions.create(**req_params)
             if response.usage and response.usage.total_tokens:
                 cls._total_tokens_count += response.usage.total_tokens
@@ -0,0 +1,370 @@
+"""
+Batch execution of the LLM calls, for the runs nobody is waiting on.
+
+The chat completions are collected for a while into batch jobs (JSONL requests
+in, JSONL responses out) and submitted to a batch backend: the OpenAI Batch API,
+with its own rate limits, or local files for testing. Each call waits until the
+results of its job land.
+
+The submitted jobs are saved in the batch directory: when the server restarts,
+their polling resumes, and the calls made again with the same messages of the same
+prompt template (e.g. by `codex resume`) get the results of the jobs submitted
+before the restart, whatever their model and max_tokens are this time.
+"""
+
+import abc
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import uuid
+from pathlib import Path
+from typing import Awaitable, Callable
+
+from openai import AsyncOpenAI
+from openai.types.chat import ChatCompletion
+
+logger = logging.getLogger(__name__)
+
+LLM_BATCH_DIR = os.environ.get("LLM_BATCH_DIR", ".batches")
+# Maximum number of calls of a batch job
+LLM_BATCH_SIZE = int(os.environ.get("LLM_BATCH_SIZE", 1000))
+# Time collecting the calls of a batch job before submitting it
+LLM_BATCH_FLUSH_SECONDS = float(os.environ.get("LLM_BATCH_FLUSH_SECONDS", 30))
+LLM_BATCH_POLL_SECONDS = float(os.environ.get("LLM_BATCH_POLL_SECONDS", 30))
+# Time the results of the jobs submitted before a restart wait to be asked for again
+LLM_BATCH_RECOVERY_SECONDS = float(os.environ.get("LLM_BATCH_RECOVERY_SECONDS", 3600))
+CHAT_COMPLETIONS_URL = "/v1/chat/completions"
+
+
+class BatchError(Exception):
+    pass
+
+
+def get_custom_id(req_params: dict, template: str | None = None) -> str:
+    """
+    The id of a call in the batch jobs, the same for the same messages of the same
+    prompt template. The model and max_tokens are left out: they are picked again
+    when a call is made again, from the statistics of the calls recorded since.
+    """
+    call = json.dumps(
+        {"template": template, "messages": req_params["messages"]},
+        sort_keys=True,
+        default=str,
+    )
+    return hashlib.sha256(call.encode()).hexdigest()
+
+
+def read_jsonl(text: str) -> list[dict]:
+    return [json.loads(line) for line in text.splitlines() if line.strip()]
+
+
+def write_jsonl(lines: list[dict]) -> str:
+    return "".join(json.dumps(line) + "\n" for line in lines)
+
+
+class BatchBackend(abc.ABC):
+    """
+    Runs batch jobs of chat completion requests, in the OpenAI Batch API format.
+    """
+
+    @abc.abstractmethod
+    async def submit(self, requests: list[dict]) -> str:
+        """
+        Submit the requests lines of a job.
+
+        Returns:
+            str: The id of the job.
+        """
+        pass
+
+    @abc.abstractmethod
+    async def poll(self, job_id: str) -> list[dict] | None:
+        """
+        The response lines of a job, None while it's running.
+
+        Raises:
+            BatchError: If the job failed.
+        """
+        pass
+
+
+class OpenAIBatchBackend(BatchBackend):
+    def __init__(self, client: AsyncOpenAI, completion_window: str = "24h"):
+        self.client = client
+        self.completion_window = completion_window
+
+    async def submit(self, requests: list[dict]) -> str:
+        input_file = await self.client.files.create(
+            file=("requests.jsonl", write_jsonl(requests).encode()),
+            purpose="batch",
+        )
+        batch = await self.client.batches.create(
+            input_file_id=input_file.id,
+            endpoint=CHAT_COMPLETIONS_URL,
+            completion_window=self.completion_window,  # type: ignore
+        )
+        return batch.id
+
+    async def poll(self, job_id: str) -> list[dict] | None:
+        batch = await self.client.batches.retrieve(job_id)
+        if batch.status == "failed":
+            raise BatchError(f"Batch job {job_id} failed: {batch.errors}")
+        # The expired and cancelled jobs have the results of their completed calls
+        if batch.status not in ("completed", "expired", "cancelled"):
+            return None
+
+        lines = []
+        for file_id in [batch.output_file_id, batch.error_file_id]:
+            if file_id:
+                content = await self.client.files.content(file_id)
+                lines.extend(read_jsonl(content.text))
+        return lines
+
+
+class LocalBatchBackend(BatchBackend):
+    """
+    Stand-in backend running the jobs from files of a local directory: the
+    requests are written to `<job>.input.jsonl`, and the job completes when
+    `<job>.output.jsonl` is written, by the given responder or another process.
+    """
+
+    def __init__(
+        self,
+        directory: str | Path,
+        respond: Callable[[dict], Awaitable[dict]] | None = None,
+    ):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.respond = respond
+        self._jobs: set[asyncio.Task] = set()
+
+    async def submit(self, requests: list[dict]) -> str:
+        job_id = f"batch_{uuid.uuid4().hex}"
+        (self.directory / f"{job_id}.input.jsonl").write_text(write_jsonl(requests))
+        if self.respond:
+            task = asyncio.create_task(self.run(job_id, requests))
+            self._jobs.add(task)
+            task.add_done_callback(self._jobs.discard)
+        return job_id
+
+    async def run(self, job_id: str, requests: list[dict]):
+        async def run_request(request: dict) -> dict:
+            line = {"id": uuid.uuid4().hex, "custom_id": request["custom_id"]}
+            try:
+                assert self.respond
+                body = await self.respond(request["body"])
+                line["response"] = {"status_code": 200, "body": body}
+            except Exception as e:
+                line["error"] = {"message": str(e)}
+            return line
+
+        lines = await asyncio.gather(*[run_request(r) for r in requests])
+        output = self.directory / f"{job_id}.output.jsonl"
+        # Write the results at once, a poll never reads a partial file
+        output.with_suffix(".tmp").write_text(write_jsonl(lines))
+        output.with_suffix(".tmp").rename(output)
+
+    async def poll(self, job_id: str) -> list[dict] | None:
+        output = self.directory / f"{job_id}.output.jsonl"
+        if not output.exists():
+            return None
+        return read_jsonl(output.read_text())
+
+
+class LLMBatcher:
+    """
+    Collects the chat completions into batch jobs, and resolves them when
+    the results of the jobs land.
+    """
+
+    def __init__(
+        self,
+        backend: BatchBackend,
+        directory: str | Path = LLM_BATCH_DIR,
+        batch_size: int = LLM_BATCH_SIZE,
+        flush_seconds: float = LLM_BATCH_FLUSH_SECONDS,
+        poll_seconds: float = LLM_BATCH_POLL_SECONDS,
+        recovery_seconds: float = LLM_BATCH_RECOVERY_SECONDS,
+    ):
+        self.backend = backend
+        self.state_file = Path(directory) / "jobs.json"
+        self.state_file.parent.mkdir(parents=True, exist_ok=True)
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.poll_seconds = poll_seconds
+        self.recovery_seconds = recovery_seconds
+        # The calls waiting to be submitted, and the calls waiting for their job
+        self._queue: list[tuple[str, dict]] = []
+        self._futures: dict[str, asyncio.Future[ChatCompletion]] = {}
+        # Calls of the jobs submitted before a restart not made again yet,
+        # and their results until they are
+        self._unclaimed: set[str] = set()
+        self._recovered: dict[str, asyncio.Future[ChatCompletion]] = {}
+        self._jobs: dict[str, list[str]] = {}
+        self._tasks: set[asyncio.Task] = set()
+        self._flush_task: asyncio.Task | None = None
+        self._started = False
+
+    def _spawn(self, coroutine):
+        task = asyncio.create_task(coroutine)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def _save_state(self):
+        self.state_file.write_text(json.dumps(self._jobs))
+
+    def _start(self):
+        """
+        Resume the polling of the jobs submitted before a restart.
+        """
+        self._started = True
+        if not self.state_file.exists():
+            return
+        self._jobs = json.loads(self.state_file.read_text())
+        loop = asyncio.get_running_loop()
+        for job_id, custom_ids in self._jobs.items():
+            for custom_id in custom_ids:
+                self._futures[custom_id] = loop.create_future()
+            self._unclaimed.update(custom_ids)
+            logger.info(f"Resuming batch job {job_id} of {len(custom_ids)} calls")
+            self._spawn(self._poll(job_id))
+
+    async def chat(
+        self, req_params: dict, template: str | None = None
+    ) -> ChatCompletion:
+        """
+        Create a chat completion in the next batch job, waiting for its result.
+        """
+        if not self._started:
+            self._start()
+
+        custom_id = get_custom_id(req_params, template)
+        if custom_id in self._recovered:
+            return await self._recovered.pop(custom_id)
+        if custom_id not in self._futures:
+            self._futures[custom_id] = asyncio.get_running_loop().create_future()
+            self._queue.append((custom_id, req_params))
+            if len(self._queue) >= self.batch_size:
+                await self.flush()
+            elif self._flush_task is None:
+                self._flush_task = asyncio.create_task(self._flush_later())
+        self._unclaimed.discard(custom_id)
+        # Identical calls share their result
+        return await asyncio.shield(self._futures[custom_id])
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.flush_seconds)
+        self._flush_task = None
+        await self.flush()
+
+    async def flush(self):
+        """
+        Submit the calls collected so far as a batch job.
+        """
+        calls, self._queue = (
+            self._queue[: self.batch_size],
+            self._queue[self.batch_size :],
+        )
+        if not calls:
+            return
+
+        requests = [
+            {
+                "custom_id": custom_id,
+                "method": "POST",
+                "url": CHAT_COMPLETIONS_URL,
+                "body": req_params,
+            }
+            for custom_id, req_params in calls
+        ]
+        try:
+            job_id = await self.backend.submit(requests)
+        except Exception as e:
+            logger.exception(f"Failed to submit a batch job of {len(calls)} calls")
+            for custom_id, _ in calls:
+                self._resolve(custom_id, error=BatchError(f"Submission failed: {e}"))
+            return
+
+        logger.info(f"Submitted batch job {job_id} of {len(calls)} calls")
+        self._jobs[job_id] = [custom_id for custom_id, _ in calls]
+        self._save_state()
+        self._spawn(self._poll(job_id))
+
+    def _resolve(
+        self,
+        custom_id: str,
+        response: ChatCompletion | None = None,
+        error: Exception | None = None,
+    ):
+        future = self._futures.pop(custom_id, None)
+        if future is None or future.done():
+            return
+        if response is not None:
+            future.set_result(response)
+        else:
+            future.set_exception(error or BatchError("No result"))
+        if custom_id in self._unclaimed:
+            self._unclaimed.discard(custom_id)
+            self._recovered[custom_id] = future
+            # The result may never be asked for again
+            future.exception()
+            asyncio.get_running_loop().call_later(
+                self.recovery_seconds, self._recovered.pop, custom_id, None
+            )
+
+    async def _poll(self, job_id: str):
+        custom_ids = self._jobs[job_id]
+        while True:
+            await asyncio.sleep(self.poll_seconds)
+            try:
+                lines = await self.backend.poll(job_id)
+            except BatchError as e:
+                logger.error(str(e))
+                lines = []
+            except Exception as e:
+                logger.warning(f"Failed to poll batch job {job_id}: {e}")
+                continue
+            if lines is not None:
+                break
+
+        logger.info(f"Batch job {job_id} completed")
+        for line in lines:
+            response = line.get("response") or {}
+            if response.get("status_code") == 200:
+                self._resolve(
+                    line["custom_id"],
+                    ChatCompletion.model_validate(response["body"]),
+                )
+            else:
+                error = line.get("error") or response.get("body")
+                self._resolve(
+                    line["custom_id"],
+                    error=BatchError(f"Batch call failed: {error}"),
+                )
+        # The calls without result line, e.g. of an expired or failed job
+        for custom_id in custom_ids:
+            self._resolve(
+                custom_id,
+                error=BatchError(f"No result in batch job {job_id}"),
+            )
+
+        del self._jobs[job_id]
+        self._save_state()
+
+
+def create_batch_backend(kind: str, client: AsyncOpenAI) -> BatchBackend:
+    """
+    The batch backend of the `--batch` option of the CLI: the OpenAI Batch API,
+    or local files with the jobs run by real-time calls.
+    """
+    if kind == "openai":
+        return OpenAIBatchBackend(client)
+    if kind == "local":
+
+        async def respond(body: dict) -> dict:
+            return (await client.chat.completions.create(**body)).model_dump()
+
+        return LocalBatchBackend(Path(LLM_BATCH_DIR) / "local", respond)
+    raise ValueError(f"Unknown batch backend: {kind}")
@@ -0,0 +1,112 @@
+"""
+Cheap-model cascade of the AI blocks.
+
+A block with a `cascade_model` calls this faster and cheaper model first, and
+escalates to its own model when the response fails the validation: the retries
+are sent to the strong model. The prompts are the ones of the strong model.
+
+The escalation rate of each template is learnt from the recorded call attempts:
+when the cheap model fails too often, the strong model is called directly, except
+for a few calls that keep measuring the cheap model.
+"""
+
+import logging
+import os
+import random
+import time
+
+import prisma
+from prisma.errors import PrismaError
+
+logger = logging.getLogger(__name__)
+
+# Cheap model tried first by the blocks using the cascade, empty to disable it
+CASCADE_MODEL = os.environ.get("CASCADE_MODEL", "gpt-4o-mini")
+CASCADE_MAX_ESCALATION_RATE = float(os.environ.get("CASCADE_MAX_ESCALATION_RATE", 0.3))
+# Below this number of recorded calls of the cheap model, it is always tried
+CASCADE_MIN_SAMPLES = int(os.environ.get("CASCADE_MIN_SAMPLES", 20))
+# Share of the calls still trying the cheap model when it escalates too often
+CASCADE_EXPLORATION_RATE = float(os.environ.get("CASCADE_EXPLORATION_RATE", 0.05))
+CASCADE_SAMPLES = 200
+CASCADE_REFRESH_SECONDS = 3600
+
+_escalations: dict[tuple[str, str, str | None, str], tuple[float, tuple[int, int]]] = {}
+
+
+def should_cascade(calls: int, escalated: int, draw: float | None = None) -> bool:
+    """
+    Whether to try the cheap model first, given its recent first calls of a
+    template and how many of them were escalated to the strong model.
+    """
+    if calls < CASCADE_MIN_SAMPLES or escalated / calls <= CASCADE_MAX_ESCALATION_RATE:
+        return True
+    # The prompts and models change: keep measuring the cheap model on a few calls
+    return (random.random() if draw is None else draw) < CASCADE_EXPLORATION_RATE
+
+
+async def load_escalations(
+    template_name: str, model: str, language: str | None, cascade_model: str
+) -> tuple[int, int]:
+    """
+    The number of recent first calls of a template to the cheap model, and the
+    number of them that were retried with the strong model.
+    """
+    # The call templates store the prompt files, e.g. `develop/python.system.j2`
+    prompt_file = f"%{template_name}/{language}.system%" if language else "%"
+    rows = await prisma.get_client().query_raw(
+        """
+        SELECT COUNT(*) AS calls, COUNT(*) FILTER (WHERE escalated) AS escalated
+        FROM (
+            SELECT EXISTS (
+                SELECT 1 FROM "LLMCallAttempt" r WHERE r."firstCallId" = a.id
+            ) AS escalated
+            FROM "LLMCallAttempt" a
+            JOIN "LLMCallTemplate" t ON t.id = a."llmCallTemplateId"
+            WHERE t."templateName" = $1 AND t.model = $2
+                AND t."systemPrompt" LIKE $3 AND a.model = $4 AND a.attempt = 0
+            ORDER BY a."createdAt" DESC
+            LIMIT $5
+        ) first_calls
+        """,
+        template_name,
+        model,
+        prompt_file,
+        cascade_model,
+        CASCADE_SAMPLES,
+    )
+    return int(rows[0]["calls"]), int(rows[0]["escalated"])
+
+
+async def get_first_model(
+    template_name: str, model: str, language: str | None, cascade_model: str | None
+) -> str:
+    """
+    The model of the first call of a block: its cascade model unless it was
+    escalated too often for this template, refreshed every hour.
+    """
+    if not cascade_model or cascade_model == model:
+        return model
+
+    key = (template_name, model, language, cascade_model)
+    cached = _escalations.get(key)
+    if cached and cached[0] > time.monotonic():
+        calls, escalated = cached[1]
+    else:
+        try:
+            calls, escalated = await load_escalations(
+                template_name, model, language, cascade_model
+            )
+        except PrismaError as e:
+            logger.warning(f"Failed to load the escalations of {template_name}: {e}")
+            calls, escalated = 0, 0
+        _escalations[key] = (
+            time.monotonic() + CASCADE_REFRESH_SECONDS,
+            (calls, escalated),
+        )
+        if calls:
+            logger.info(
+                f"Escalation rate of {cascade_model} for {template_name} "
+                f"({language or 'default'}): {escalated}/{calls} calls"
+            )
+
+    return cascade_model if should_cascade(calls, escalated) else model
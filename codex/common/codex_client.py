@@ -1,8 +1,10 @@
+import base64
 import logging
 from datetime import datetime
 from typing import Optional, Tuple
 
 import aiohttp
+from fastapi import Response
 from prisma import Prisma
 from pydantic import BaseModel, ValidationError
 
@@ -343,6 +345,38 @@ class CodexClient:
             )
             raise e
 
+    async def resume_deliverable(self) -> DeliverableResponse:
+        """
+        Resume the development of the deliverable, from the functions already written.
+
+        Returns:
+            DeliverableResponse: The response from the server after resuming the app deliverable.
+        """
+        if not self.app_id or not self.specification_id or not self.deliverable_id:
+            raise ValueError("You must generate a deliverable before resuming it")
+        url = f"{self.base_url}/user/{self.codex_user_id}/apps/{self.app_id}/specs/{self.specification_id}/deliverables/{self.deliverable_id}/resume"
+
+        try:
+            async with aiohttp.ClientSession() as session:
+                async with session.post(
+                    url, headers=self.headers, timeout=3000
+                ) as response:
+                    response.raise_for_status()
+                    return DeliverableResponse(**await response.json())
+
+        except aiohttp.ClientError as e:
+            logger.exception(f"Error resuming app deliverable: {e}")
+            raise e
+        except ValidationError as e:
+            logger.exception(f"Error parsing app deliverable: {e}")
+            raise e
+
+        except Exception as e:
+            logger.exception(
+                f"Unknown Error when trying to resume the deliverable: {e}"
+            )
+            raise e
+
     async def create_deployment(self) -> DeploymentResponse:
         """
         Create a deployment for the app based on the deliverable.
@@ -482,6 +516,148 @@ class CodexClient:
         return codex
 
 
+class LocalCodexClient(CodexClient):
+    """
+    Codex client calling the route handlers of the Codex API in this process
+    instead of over HTTP. A request sending its LLM calls in batch jobs takes
+    hours, longer than any HTTP timeout.
+    """
+
+    def __init__(self, client: Prisma):
+        super().__init__(client=client, base_url="local")
+
+    @staticmethod
+    def _raise_for_error(result, action: str):
+        # The handlers return a JSON response instead of raising when not found
+        if isinstance(result, Response):
+            raise ValueError(
+                f"Error {action}: {result.status_code} {result.body.decode()}"
+            )
+        return result
+
+    async def create_or_get_codex_user(
+        self, discord_id: str, cloud_services_id: str = ""
+    ) -> UserResponse:
+        from codex.api import get_or_create_user
+
+        return await get_or_create_user(
+            cloud_services_id=cloud_services_id, discord_id=discord_id
+        )
+
+    async def create_app(
+        self, app_name: str, app_description: str
+    ) -> ApplicationResponse:
+        from codex.api import create_app
+
+        app_response = await create_app(
+            self.codex_user_id,
+            ApplicationCreate(name=app_name, description=app_description),
+        )
+        self.app_id = app_response.id
+        return app_response
+
+    async def get_app(self, app_id: Optional[str] = None) -> ApplicationResponse:
+        from codex.api import get_app
+
+        if not app_id and not self.app_id:
+            raise ValueError("You must provide an app_id to get the app")
+        result = await get_app(self.codex_user_id, app_id or self.app_id)  # type: ignore
+        return self._raise_for_error(result, "getting app")
+
+    async def start_interview(self, name: str, task: str) -> InterviewResponse:
+        from codex.interview.routes import start_interview
+
+        if not self.app_id:
+            raise ValueError("You must create an app before starting an interview")
+        result = await start_interview(self.codex_user_id, self.app_id)
+        interview_response = self._raise_for_error(result, "starting interview")
+        self.interview_id = interview_response.id
+        return interview_response
+
+    async def interview_next(self, user_message: str) -> InterviewResponse:
+        from codex.interview.routes import take_next_step
+
+        if not self.app_id or not self.interview_id:
+            raise ValueError(
+                "You must create an app and participate in an interview before answering the next question"
+            )
+        result = await take_next_step(
+            self.codex_user_id,
+            self.app_id,
+            self.interview_id,
+            InterviewNextRequest(msg=user_message),
+        )
+        return self._raise_for_error(result, "answering next question")
+
+    async def generate_spec(self) -> SpecificationResponse:
+        from codex.requirements.routes import create_spec
+
+        if not self.app_id or not self.interview_id:
+            raise ValueError(
+                "You must create an app and participate in an interview before generating a spec"
+            )
+        result = await create_spec(self.codex_user_id, self.app_id, self.interview_id)
+        spec_response = self._raise_for_error(result, "generating app spec")
+        self.specification_id = spec_response.id
+        return spec_response
+
+    async def generate_deliverable(self) -> DeliverableResponse:
+        from codex.develop.routes import create_deliverable
+
+        if not self.app_id or not self.specification_id:
+            raise ValueError(
+                "You must create an app and generate a spec before generating a deliverable"
+            )
+        result = await create_deliverable(
+            self.codex_user_id, self.app_id, self.specification_id
+        )
+        deliverable_response = self._raise_for_error(
+            result, "generating app deliverable"
+        )
+        self.deliverable_id = deliverable_response.id
+        return deliverable_response
+
+    async def resume_deliverable(self) -> DeliverableResponse:
+        from codex.develop.routes import resume_deliverable
+
+        if not self.app_id or not self.specification_id or not self.deliverable_id:
+            raise ValueError("You must generate a deliverable before resuming it")
+        result = await resume_deliverable(
+            self.codex_user_id,
+            self.app_id,
+            self.specification_id,
+            self.deliverable_id,
+        )
+        return self._raise_for_error(result, "resuming app deliverable")
+
+    async def create_deployment(self) -> DeploymentResponse:
+        from codex.deploy.routes import create_deployment
+
+        if not self.app_id or not self.specification_id or not self.deliverable_id:
+            raise ValueError(
+                "You must create an app, generate a spec, and generate a deliverable before creating a deployment"
+            )
+        deployment_response = await create_deployment(
+            self.codex_user_id,
+            self.app_id,
+            self.specification_id,
+            self.deliverable_id,
+        )
+        self.deployment_id = deployment_response.id
+        return deployment_response
+
+    async def download_zip(self) -> Tuple[bytes, str]:
+        import codex.deploy.database
+
+        if not self.deployment_id:
+            raise ValueError("You must create a deployment before downloading a zip")
+        deployment = await codex.deploy.database.get_deployment(
+            deployment_id=self.deployment_id
+        )
+        filename = deployment.fileName or f"{self.deployment_id}.zip"
+        return base64.b64decode(str(deployment.fileBytes)), filename
+
+
 class TestModel(BaseModel):
     content: bytes
     filename: str
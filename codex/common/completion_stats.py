@@ -0,0 +1,101 @@
+"""
+Completion size statistics of the LLM call templates.
+
+The `max_tokens` of an AI block is a high percentile of the completion tokens of
+its recent calls plus some headroom, instead of the maximum completion size.
+It also sets the tokens reserved by the rate limiter for each request.
+"""
+
+import logging
+import math
+import os
+import time
+
+import prisma
+from prisma.errors import PrismaError
+
+from codex.common.ai_model import MAX_COMPLETION_TOKENS
+
+logger = logging.getLogger(__name__)
+
+MAX_TOKENS_PERCENTILE = float(os.environ.get("MAX_TOKENS_PERCENTILE", 99))
+MAX_TOKENS_HEADROOM = float(os.environ.get("MAX_TOKENS_HEADROOM", 1.25))
+# Below this number of recorded calls, the maximum completion size is used
+MAX_TOKENS_MIN_SAMPLES = int(os.environ.get("MAX_TOKENS_MIN_SAMPLES", 50))
+MAX_TOKENS_SAMPLES = 1000
+MAX_TOKENS_REFRESH_SECONDS = 3600
+MIN_COMPLETION_TOKENS = 256
+
+_max_tokens: dict[tuple[str, str, str | None], tuple[float, int]] = {}
+
+
+def get_percentile(values: list[int], percentile: float) -> int:
+    """
+    The nearest-rank percentile of a non-empty list of values.
+    """
+    ranked = sorted(values)
+    rank = math.ceil(percentile / 100 * len(ranked))
+    return ranked[min(max(rank, 1), len(ranked)) - 1]
+
+
+def get_adaptive_max_tokens(completion_tokens: list[int]) -> int:
+    """
+    The max_tokens covering the given completion sizes: their percentile with
+    headroom, bounded by the maximum completion size.
+    """
+    if len(completion_tokens) < MAX_TOKENS_MIN_SAMPLES:
+        return MAX_COMPLETION_TOKENS
+
+    percentile = get_percentile(completion_tokens, MAX_TOKENS_PERCENTILE)
+    max_tokens = math.ceil(percentile * MAX_TOKENS_HEADROOM)
+    return min(max(max_tokens, MIN_COMPLETION_TOKENS), MAX_COMPLETION_TOKENS)
+
+
+async def load_completion_tokens(
+    template_name: str, model: str, language: str | None
+) -> list[int]:
+    """
+    The completion tokens of the recent calls of a template, in all its versions.
+    """
+    # The call templates store the prompt files, e.g. `develop/python.system.j2`
+    prompt_file = f"%{template_name}/{language}.system%" if language else "%"
+    rows = await prisma.get_client().query_raw(
+        """
+        SELECT a."completionTokens" AS tokens
+        FROM "LLMCallAttempt" a
+        JOIN "LLMCallTemplate" t ON t.id = a."llmCallTemplateId"
+        WHERE t."templateName" = $1 AND t.model = $2 AND t."systemPrompt" LIKE $3
+        ORDER BY a."createdAt" DESC
+        LIMIT $4
+        """,
+        template_name,
+        model,
+        prompt_file,
+        MAX_TOKENS_SAMPLES,
+    )
+    return [int(row["tokens"]) for row in rows]
+
+
+async def get_max_tokens(template_name: str, model: str, language: str | None) -> int:
+    """
+    The max_tokens of the calls of a template, refreshed every hour.
+    """
+    key = (template_name, model, language)
+    cached = _max_tokens.get(key)
+    if cached and cached[0] > time.monotonic():
+        return cached[1]
+
+    try:
+        completion_tokens = await load_completion_tokens(template_name, model, language)
+    except PrismaError as e:
+        logger.warning(f"Failed to load the completion sizes of {template_name}: {e}")
+        completion_tokens = []
+
+    max_tokens = get_adaptive_max_tokens(completion_tokens)
+    _max_tokens[key] = (time.monotonic() + MAX_TOKENS_REFRESH_SECONDS, max_tokens)
+    if max_tokens < MAX_COMPLETION_TOKENS:
+        logger.info(
+            f"max_tokens of {template_name} ({language or 'default'}): {max_tokens}, "
+            f"P{MAX_TOKENS_PERCENTILE:g} of {len(completion_tokens)} calls"
+        )
+    return max_tokens
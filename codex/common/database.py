@@ -11,6 +11,13 @@ INCLUDE_API_ROUTE = {
     }
 }
 
+INCLUDE_FUNC_SIGNATURE = {
+    "include": {
+        "FunctionArgs": INCLUDE_TYPE,
+        "FunctionReturn": INCLUDE_TYPE,
+    }
+}
+
 INCLUDE_FUNC = {
     "include": {
         "FunctionArgs": INCLUDE_TYPE,
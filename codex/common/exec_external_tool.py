@@ -1,12 +1,18 @@
 import asyncio
 import enum
+import errno
+import fcntl
 import logging
 import os
+import shutil
 import subprocess
 import tempfile
+import time
 from asyncio.subprocess import Process
 from pathlib import Path
 
+from pydantic import BaseModel
+
 from codex.common.ai_block import ValidationError, ValidationErrorWithContent
 
 logger = logging.getLogger(__name__)
@@ -18,6 +24,21 @@ class OutputType(enum.Enum):
     BOTH = "both"
 
 
+async def communicate(process: Process) -> tuple[bytes, bytes]:
+    """
+    Wait for the output of a process, killing the process
+    if the waiting task gets cancelled.
+    """
+    try:
+        return await process.communicate()
+    except asyncio.CancelledError:
+        if process.returncode is None:
+            logger.debug(f"Killing process {process.pid} of a cancelled task")
+            process.kill()
+            await asyncio.shield(process.wait())
+        raise
+
+
 async def exec_external_on_contents(
     command_arguments: list[str],
     file_contents,
@@ -64,7 +85,7 @@ async def exec_external_on_contents(
                 stdout=subprocess.PIPE,
                 stderr=subprocess.PIPE,
             )
-            result = await r.communicate()
+            result = await communicate(r)
             stdout, stderr = result[0].decode("utf-8"), result[1].decode("utf-8")
             logger.debug(f"Output: {stdout}")
             if temp_file_path in stdout:
@@ -130,11 +151,8 @@ async def setup_if_required(
     if copy_from_parent and cwd != PROJECT_PARENT_DIR:
         if (cwd / "venv").exists():
             await execute_command(["rm", "-rf", str(cwd / "venv")], cwd, None)
-        await execute_command(
-            ["virtualenv-clone", str(PROJECT_PARENT_DIR / "venv"), str(cwd / "venv")],
-            cwd,
-            await setup_if_required(PROJECT_PARENT_DIR),
-        )
+        parent_path = await setup_if_required(PROJECT_PARENT_DIR)
+        await clone_virtual_env(PROJECT_PARENT_DIR / "venv", cwd / "venv", parent_path)
         return path
 
     # Create a virtual environment
@@ -182,7 +200,7 @@ async def execute_command(
             cwd=str(cwd),
             env=venv,
         )
-        stdout, stderr = await r.communicate()
+        stdout, stderr = await communicate(r)
         stdout, stderr = stdout.decode("utf-8"), stderr.decode("utf-8")
 
         if r.returncode == 0:
@@ -196,3 +214,183 @@ async def execute_command(
     except Exception as e:
         logger.error(f"Exception during command execution: {e}")
         raise
+
+
+class VenvCloneMode(enum.Enum):
+    REFLINK = "reflink"
+    HARDLINK = "hardlink"
+    COPY = "copy"
+    VIRTUALENV_CLONE = "virtualenv-clone"
+
+
+VENV_CLONE_MODE = VenvCloneMode(os.environ.get("VENV_CLONE_MODE", "reflink"))
+
+# Packages that get rewritten in place inside a cloned environment
+# (`prisma generate` regenerates the client), these must never share
+# inodes with the parent environment.
+VENV_MUTABLE_PACKAGES = ["prisma"]
+
+# Linux ioctl request to share the extents of a file (copy-on-write clone).
+FICLONE = 0x40049409
+
+# Errors meaning "this link method is not available here", not a real failure.
+LINK_UNSUPPORTED_ERRNOS = {
+    errno.EXDEV,
+    errno.EPERM,
+    errno.EMLINK,
+    errno.EINVAL,
+    errno.ENOTTY,
+    errno.ENOSYS,
+    errno.EOPNOTSUPP,
+}
+
+
+class VenvCloneStats(BaseModel):
+    mode: VenvCloneMode
+    reflinked: int = 0
+    hardlinked: int = 0
+    copied: int = 0
+    rewritten: int = 0
+    duration: float = 0.0
+
+
+class VenvCloner:
+    """
+    Clones a virtual environment by sharing the immutable site-packages content
+    with the source environment and only copying the mutable bits:
+        - bin/ scripts, with shebangs and activate scripts pointing to the clone
+        - pyvenv.cfg, *.pth and *.egg-link files, rewritten the same way
+        - packages listed in VENV_MUTABLE_PACKAGES
+
+    Each file is reflinked, hardlinked, or copied, in that order of preference,
+    starting from the requested mode. A method that turns out not to be supported
+    (e.g. a cross-device link) is dropped for the rest of the clone.
+    """
+
+    def __init__(self, src: Path, dst: Path, mode: VenvCloneMode = VENV_CLONE_MODE):
+        if mode == VenvCloneMode.VIRTUALENV_CLONE:
+            raise ValueError("virtualenv-clone is run as an external command")
+        self.src = src.resolve()
+        self.dst = dst.resolve()
+        self.src_bytes = str(self.src).encode()
+        self.dst_bytes = str(self.dst).encode()
+        chain = [VenvCloneMode.REFLINK, VenvCloneMode.HARDLINK, VenvCloneMode.COPY]
+        self.methods = chain[chain.index(mode) :]
+        self.stats = VenvCloneStats(mode=mode)
+
+    def clone(self) -> VenvCloneStats:
+        start = time.perf_counter()
+        for root, dirs, files in os.walk(self.src):
+            rel_root = Path(root).relative_to(self.src)
+            (self.dst / rel_root).mkdir(parents=True, exist_ok=True)
+            shutil.copymode(root, self.dst / rel_root)
+
+            for name in list(dirs):
+                if os.path.islink(os.path.join(root, name)):
+                    # Symlinked directories are re-created as links, not walked
+                    dirs.remove(name)
+                    files.append(name)
+
+            for name in files:
+                rel_path = rel_root / name
+                src_file = self.src / rel_path
+                dst_file = self.dst / rel_path
+                if src_file.is_symlink():
+                    self._clone_symlink(src_file, dst_file)
+                elif self._needs_rewrite(rel_path):
+                    self._copy_and_rewrite(src_file, dst_file)
+                else:
+                    self._link_file(
+                        src_file, dst_file, allow_shared=not self._is_mutable(rel_path)
+                    )
+        self.stats.duration = time.perf_counter() - start
+        return self.stats
+
+    def _needs_rewrite(self, rel_path: Path) -> bool:
+        return (
+            rel_path.parts[0] == "bin"
+            or rel_path.name == "pyvenv.cfg"
+            or rel_path.suffix in (".pth", ".egg-link")
+        )
+
+    def _is_mutable(self, rel_path: Path) -> bool:
+        parts = rel_path.parts
+        if "site-packages" not in parts:
+            return False
+        index = parts.index("site-packages")
+        return len(parts) > index + 2 and parts[index + 1] in VENV_MUTABLE_PACKAGES
+
+    def _clone_symlink(self, src_file: Path, dst_file: Path):
+        target = os.readlink(src_file)
+        if target.startswith(str(self.src)):
+            target = str(self.dst) + target[len(str(self.src)) :]
+        os.symlink(target, dst_file)
+
+    def _copy_and_rewrite(self, src_file: Path, dst_file: Path):
+        content = src_file.read_bytes()
+        # Only rewrite text files, a compiled binary can't have its paths resized
+        if b"\0" not in content[:1024] and self.src_bytes in content:
+            dst_file.write_bytes(content.replace(self.src_bytes, self.dst_bytes))
+            shutil.copymode(src_file, dst_file)
+            self.stats.rewritten += 1
+        else:
+            shutil.copy2(src_file, dst_file)
+            self.stats.copied += 1
+
+    def _link_file(self, src_file: Path, dst_file: Path, allow_shared: bool):
+        for method in list(self.methods):
+            if method == VenvCloneMode.HARDLINK and not allow_shared:
+                continue
+            try:
+                if method == VenvCloneMode.REFLINK:
+                    with open(src_file, "rb") as fsrc, open(dst_file, "wb") as fdst:
+                        fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+                    shutil.copystat(src_file, dst_file)
+                    self.stats.reflinked += 1
+                elif method == VenvCloneMode.HARDLINK:
+                    os.link(src_file, dst_file)
+                    self.stats.hardlinked += 1
+                else:
+                    shutil.copy2(src_file, dst_file)
+                    self.stats.copied += 1
+                return
+            except OSError as e:
+                if (
+                    method == VenvCloneMode.COPY
+                    or e.errno not in LINK_UNSUPPORTED_ERRNOS
+                ):
+                    raise
+                logger.info(
+                    f"[Setup] Can't {method.value} {src_file}: {e}, falling back"
+                )
+                self.methods.remove(method)
+                dst_file.unlink(missing_ok=True)
+
+
+async def clone_virtual_env(
+    src: Path,
+    dst: Path,
+    python_path: str | Path | None = None,
+    mode: VenvCloneMode = VENV_CLONE_MODE,
+) -> VenvCloneStats:
+    """
+    Clone the virtual environment `src` into `dst`
+    Args:
+        src (Path): The virtual environment to clone
+        dst (Path): The path of the new virtual environment, must not exist yet
+        python_path (str | Path): The python executable path, used by virtualenv-clone
+        mode (VenvCloneMode): The preferred cloning method
+    Returns:
+        VenvCloneStats: How the files were cloned and how long it took
+    """
+    if mode != VenvCloneMode.VIRTUALENV_CLONE:
+        cloner = VenvCloner(src, dst, mode)
+        stats = await asyncio.to_thread(cloner.clone)
+        logger.debug(f"[Setup] Cloned virtual environment: {stats}")
+        return stats
+
+    start = time.perf_counter()
+    await execute_command(
+        ["virtualenv-clone", str(src), str(dst)], dst.parent, python_path
+    )
+    return VenvCloneStats(mode=mode, duration=time.perf_counter() - start)
@@ -0,0 +1,140 @@
+"""
+Hedged LLM calls.
+
+A call still running after the observed P95 latency of its template is sent a
+second time, and the first response wins: a few slow completions no longer hold
+up the whole route being developed. The extra tokens of the duplicate calls are
+bounded by a share of the tokens of all the calls.
+
+The completions are not streamed, the latency is the one of the whole response.
+"""
+
+import asyncio
+import collections
+import logging
+import math
+import os
+from typing import Awaitable, Callable
+
+from openai.types.chat import ChatCompletion
+
+logger = logging.getLogger(__name__)
+
+HEDGING = os.getenv("HEDGING", "false").lower() in ("true", "1", "t")
+HEDGE_PERCENTILE = float(os.environ.get("HEDGE_PERCENTILE", 95))
+# Extra tokens of the duplicate calls, as a share of the tokens of all the calls
+HEDGE_BUDGET = float(os.environ.get("HEDGE_BUDGET", 0.05))
+# Below this number of observed calls of a template, its calls are not hedged
+HEDGE_MIN_SAMPLES = int(os.environ.get("HEDGE_MIN_SAMPLES", 20))
+HEDGE_LATENCY_SAMPLES = 200
+
+
+class Hedger:
+    """
+    Observes the latency of the calls by template, and hedges the slow ones
+    within the tokens budget.
+    """
+
+    def __init__(
+        self,
+        percentile: float = HEDGE_PERCENTILE,
+        budget: float = HEDGE_BUDGET,
+        min_samples: int = HEDGE_MIN_SAMPLES,
+    ):
+        self.percentile = percentile
+        self.budget = budget
+        self.min_samples = min_samples
+        self.latencies: dict[str, collections.deque[float]] = {}
+        self.total_tokens = 0
+        self.hedged_tokens = 0
+        self.hedged = 0
+        self.hedges_won = 0
+
+    def get_hedge_delay(self, key: str) -> float | None:
+        """
+        The percentile latency of the recent calls of a template, None when
+        too few calls were observed.
+        """
+        latencies = self.latencies.get(key)
+        if not latencies or len(latencies) < self.min_samples:
+            return None
+        ranked = sorted(latencies)
+        rank = math.ceil(self.percentile / 100 * len(ranked))
+        return ranked[min(max(rank, 1), len(ranked)) - 1]
+
+    def record(self, key: str, latency: float, tokens: int):
+        latencies = self.latencies.setdefault(
+            key, collections.deque(maxlen=HEDGE_LATENCY_SAMPLES)
+        )
+        latencies.append(latency)
+        self.total_tokens += tokens
+
+    def can_hedge(self, tokens: int) -> bool:
+        return self.hedged_tokens + tokens <= self.budget * self.total_tokens
+
+    async def run(
+        self,
+        key: str,
+        tokens: int,
+        call: Callable[[], Awaitable[ChatCompletion]],
+    ) -> ChatCompletion:
+        """
+        Make a call, and a duplicate call if it's slower than the percentile
+        latency of its template.
+
+        Args:
+            key (str): The template and model of the call.
+            tokens (int): The tokens reserved for the call.
+            call (Callable[[], Awaitable[ChatCompletion]]): Makes the call.
+
+        Returns:
+            ChatCompletion: The first successful response.
+        """
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        first = asyncio.ensure_future(call())
+        pending = {first}
+        hedged = False
+        try:
+            delay = self.get_hedge_delay(key)
+            if delay is not None:
+                done, _ = await asyncio.wait(pending, timeout=delay)
+                if not done and self.can_hedge(tokens):
+                    # The tokens of the duplicate call are reserved until it ends
+                    self.hedged_tokens += tokens
+                    self.hedged += 1
+                    hedged = True
+                    logger.info(f"Hedging a call of {key} slower than {delay:.1f}s")
+                    pending.add(asyncio.ensure_future(call()))
+
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    if task.exception() is not None:
+                        error = error or task.exception()
+                        continue
+                    response = task.result()
+                    response_tokens = (
+                        response.usage.total_tokens if response.usage else tokens
+                    )
+                    # The latency of the call as seen by the caller: the hedged
+                    # calls are slow calls, even when the duplicate wins
+                    self.record(key, loop.time() - start, response_tokens)
+                    if hedged:
+                        # The duplicate call used about as many tokens as the winner
+                        self.hedged_tokens += response_tokens - tokens
+                        if task is not first:
+                            self.hedges_won += 1
+                    return response
+            if hedged:
+                # No tokens were used by the failed calls
+                self.hedged_tokens -= tokens
+            if error is None:
+                raise RuntimeError(f"No response for the call of {key}")
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
@@ -0,0 +1,305 @@
+"""
+Routing of the LLM calls over several OpenAI-compatible endpoints.
+
+Each endpoint has its own client, key and rate limits. A call is sent to the
+available endpoint with the lowest observed latency, weighted by its in-flight
+calls and by the share of its token budget still free in the current minute.
+
+Rate limited (429) calls are sent to another endpoint, and the endpoint is not
+used until its `Retry-After` delay, or a jittered exponential backoff, is over.
+Server errors (5xx) and connection errors also count towards the circuit
+breaker of the endpoint: after a few consecutive failures, the endpoint is not
+used for a while, then a single call probes it before it is used again.
+"""
+
+import asyncio
+import collections
+import email.utils
+import json
+import logging
+import os
+import random
+import time
+from pathlib import Path
+
+import openai
+from openai import AsyncOpenAI
+from openai.types.chat import ChatCompletion
+
+logger = logging.getLogger(__name__)
+
+# JSON file listing the endpoints, see `load_endpoints`
+LLM_ENDPOINTS = os.environ.get("LLM_ENDPOINTS", "")
+# Consecutive failures of an endpoint opening its circuit breaker
+CIRCUIT_FAILURE_THRESHOLD = int(os.environ.get("CIRCUIT_FAILURE_THRESHOLD", 5))
+CIRCUIT_OPEN_SECONDS = float(os.environ.get("CIRCUIT_OPEN_SECONDS", 30))
+# Failed attempts of a call, over all the endpoints, before giving up
+LLM_ROUTER_MAX_ATTEMPTS = int(os.environ.get("LLM_ROUTER_MAX_ATTEMPTS", 6))
+BACKOFF_BASE_SECONDS = 1.0
+BACKOFF_MAX_SECONDS = 60.0
+# Weight of the last call in the latency moving average
+LATENCY_SMOOTHING = 0.2
+
+
+def get_retry_after(error: openai.APIStatusError) -> float | None:
+    """
+    The delay requested by the `Retry-After` headers of an error response.
+    The malformed headers are ignored, falling back to the backoff.
+    """
+    headers = error.response.headers
+    try:
+        return max(float(headers["retry-after-ms"]) / 1000, 0)
+    except (KeyError, ValueError):
+        pass
+    try:
+        return max(float(headers["retry-after"]), 0)
+    except (KeyError, ValueError):
+        pass
+    try:
+        retry_date = email.utils.parsedate_to_datetime(headers["retry-after"])
+        return max(retry_date.timestamp() - time.time(), 0)
+    except (KeyError, TypeError, ValueError, IndexError, OverflowError):
+        return None
+
+
+def get_backoff(failures: int) -> float:
+    """
+    Exponential backoff with full jitter after the given consecutive failures.
+    """
+    ceiling = min(BACKOFF_BASE_SECONDS * 2 ** max(failures - 1, 0), BACKOFF_MAX_SECONDS)
+    return random.uniform(0, ceiling)
+
+
+class LLMEndpoint:
+    """
+    An OpenAI-compatible endpoint with its rate limits, latency and health.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        client: AsyncOpenAI,
+        model: str | None = None,
+        max_requests_per_min: int = 10_000,
+        max_tokens_per_min: int = 1_500_000,
+    ):
+        self.name = name
+        self.client = client
+        # Model replacing the requested one, e.g. for the endpoints of other providers
+        self.model = model
+        self.max_requests_per_min = max_requests_per_min
+        self.max_tokens_per_min = max_tokens_per_min
+        self.latency: float | None = None
+        self.in_flight = 0
+        # Consecutive failed calls: all of them, and those counting for the circuit
+        self.errors = 0
+        self.failures = 0
+        self.available_at = 0.0
+        self.probing = False
+        # Start time and tokens of the calls of the last minute
+        self._calls: collections.deque[list[float]] = collections.deque()
+
+    def _expire_calls(self, now: float):
+        while self._calls and self._calls[0][0] <= now - 60:
+            self._calls.popleft()
+
+    def free_budget(self, now: float) -> float:
+        """
+        The share of the requests and tokens budget of the minute still free.
+        """
+        self._expire_calls(now)
+        tokens = sum(tokens for _, tokens in self._calls)
+        return min(
+            1 - len(self._calls) / self.max_requests_per_min,
+            1 - tokens / self.max_tokens_per_min,
+        )
+
+    @property
+    def circuit_open(self) -> bool:
+        return self.failures >= CIRCUIT_FAILURE_THRESHOLD
+
+    def wait_time(self, tokens: int, now: float) -> float:
+        """
+        Seconds until the endpoint can take a call of the given tokens, 0 if now.
+        """
+        wait = max(self.available_at - now, 0)
+        if self.circuit_open and self.probing:
+            # A single call probes an endpoint after its circuit breaker opened
+            return max(wait, CIRCUIT_OPEN_SECONDS)
+
+        self._expire_calls(now)
+        used = sum(t for _, t in self._calls)
+        if len(self._calls) >= self.max_requests_per_min or (
+            self._calls and used + tokens > self.max_tokens_per_min
+        ):
+            wait = max(wait, self._calls[0][0] + 60 - now)
+        return wait
+
+    def score(self, now: float) -> float:
+        """
+        The routing cost of the endpoint, lower is better. The endpoints without
+        observed latency are tried first.
+        """
+        latency = self.latency or 0.0
+        return latency * (1 + self.in_flight) / max(self.free_budget(now), 0.05)
+
+    def reserve(self, tokens: int, now: float) -> list[float]:
+        self.in_flight += 1
+        if self.circuit_open:
+            self.probing = True
+        call = [now, float(tokens)]
+        self._calls.append(call)
+        return call
+
+    def release(self, call: list[float]):
+        """
+        End a call that did not complete, its tokens were not used.
+        """
+        self.in_flight -= 1
+        self.probing = False
+        call[1] = 0
+
+    def on_success(self, call: list[float], response: ChatCompletion, now: float):
+        self.in_flight -= 1
+        self.probing = False
+        if self.failures >= CIRCUIT_FAILURE_THRESHOLD:
+            logger.info(f"Closing the circuit breaker of the LLM endpoint {self.name}")
+        self.errors = 0
+        self.failures = 0
+        if response.usage and response.usage.total_tokens:
+            call[1] = response.usage.total_tokens
+
+        latency = now - call[0]
+        self.latency = (
+            latency
+            if self.latency is None
+            else LATENCY_SMOOTHING * latency + (1 - LATENCY_SMOOTHING) * self.latency
+        )
+
+    def on_failure(self, call: list[float], error: Exception, now: float):
+        """
+        Back off after a rate limit, server or connection error. Only the server
+        and connection errors count towards the circuit breaker.
+        """
+        self.release(call)
+        self.errors += 1
+        delay = None
+        if isinstance(error, openai.APIStatusError):
+            delay = get_retry_after(error)
+        if not isinstance(error, openai.RateLimitError):
+            self.failures += 1
+            if self.failures == CIRCUIT_FAILURE_THRESHOLD:
+                logger.warning(
+                    f"Opening the circuit breaker of the LLM endpoint {self.name} "
+                    f"for {CIRCUIT_OPEN_SECONDS}s after {self.failures} failures"
+                )
+            if self.circuit_open:
+                delay = max(delay or 0, CIRCUIT_OPEN_SECONDS)
+        if delay is None:
+            delay = get_backoff(self.errors)
+        self.available_at = max(self.available_at, now + delay)
+
+
+def is_retryable(error: Exception) -> bool:
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code == 429 or error.status_code >= 500
+    return isinstance(error, openai.APIConnectionError)
+
+
+class LLMRouter:
+    """
+    Sends the chat completions to the best available endpoint,
+    failing over to the other endpoints.
+    """
+
+    def __init__(self, endpoints: list[LLMEndpoint]):
+        if not endpoints:
+            raise ValueError("No LLM endpoint configured")
+        self.endpoints = endpoints
+
+    def pick(self, tokens: int) -> tuple[LLMEndpoint | None, float]:
+        """
+        The best endpoint available now, or None and the seconds to wait for one.
+        """
+        now = time.monotonic()
+        waits = [(e.wait_time(tokens, now), e) for e in self.endpoints]
+        available = [e for wait, e in waits if wait == 0]
+        if not available:
+            return None, min(wait for wait, _ in waits)
+        return min(available, key=lambda e: e.score(now)), 0
+
+    async def chat(self, req_params: dict, tokens: int) -> ChatCompletion:
+        """
+        Create a chat completion on the best endpoint.
+
+        Args:
+            req_params (dict): The chat completion parameters.
+            tokens (int): The tokens reserved for the call.
+
+        Raises:
+            openai.APIError: The error of the last attempt, after
+                             `LLM_ROUTER_MAX_ATTEMPTS` failed attempts,
+                             or a non retryable error.
+        """
+        attempt = 0
+        while True:
+            endpoint, wait = self.pick(tokens)
+            if endpoint is None:
+                # The endpoints are checked again when a probing call completes
+                await asyncio.sleep(min(wait, 1.0))
+                continue
+
+            params = req_params
+            if endpoint.model:
+                params = {**req_params, "model": endpoint.model}
+            call = endpoint.reserve(tokens, time.monotonic())
+            try:
+                response = await endpoint.client.chat.completions.create(**params)
+            except Exception as e:
+                if not is_retryable(e):
+                    endpoint.release(call)
+                    raise
+                endpoint.on_failure(call, e, time.monotonic())
+                attempt += 1
+                logger.warning(
+                    f"LLM endpoint {endpoint.name} failed "
+                    f"({attempt}/{LLM_ROUTER_MAX_ATTEMPTS}): {e}"
+                )
+                if attempt >= LLM_ROUTER_MAX_ATTEMPTS:
+                    raise
+                continue
+            except BaseException:
+                # Cancelled call
+                endpoint.release(call)
+                raise
+
+            endpoint.on_success(call, response, time.monotonic())
+            return response
+
+
+def load_endpoints(path: str | Path) -> list[LLMEndpoint]:
+    """
+    Load the endpoints of a JSON file, a list of objects with the fields:
+        - name: The name of the endpoint in the logs.
+        - base_url: The OpenAI-compatible API URL, the OpenAI API if omitted.
+        - api_key_env: The environment variable holding the API key.
+        - model: The model replacing the requested models, optional.
+        - max_requests_per_min, max_tokens_per_min: The rate limits, optional.
+    """
+    endpoints = []
+    for config in json.loads(Path(path).read_text()):
+        client = AsyncOpenAI(
+            base_url=config.get("base_url"),
+            api_key=os.environ[config.get("api_key_env", "OPENAI_API_KEY")],
+            # The router retries the calls on the other endpoints
+            max_retries=0,
+        )
+        limits = {
+            key: config[key]
+            for key in ["max_requests_per_min", "max_tokens_per_min"]
+            if key in config
+        }
+        endpoints.append(
+            LLMEndpoint(config["name"], client, model=config.get("model"), **limits)
+        )
+    return endpoints
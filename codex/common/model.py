@@ -1,12 +1,13 @@
 import datetime
+import uuid
 from typing import List, Optional, __all__
 
+import prisma
 import prisma.enums
 from prisma.models import Function, ObjectField, ObjectType
 from pydantic import BaseModel, Field
 
 from codex.api_model import ObjectTypeModel, Pagination
-from codex.common.database import INCLUDE_FIELD, INCLUDE_TYPE
 from codex.common.types import (
     extract_field_type,
     get_related_types,
@@ -95,6 +96,37 @@ class FunctionDef(BaseModel):
 PYTHON_TYPES = set(__all__)
 
 
+class ObjectTypeRegistry(dict[str, ObjectType]):
+    """
+    The available object types by name, along with a reverse index from a type
+    name to the fields referring to it. It lets newly created object types be
+    linked to the fields already referring to them without scanning all the fields.
+    """
+
+    def __init__(self, objects: dict[str, ObjectType] = {}):
+        super().__init__()
+        self.references: dict[str, dict[str, ObjectField]] = {}
+        self.update(objects)
+
+    def __setitem__(self, name: str, obj: ObjectType) -> None:
+        if name in self:
+            del self[name]
+        super().__setitem__(name, obj)
+        for field in obj.Fields or []:
+            for type_name in extract_field_type(field.typeName):
+                self.references.setdefault(type_name, {})[field.id] = field
+
+    def __delitem__(self, name: str) -> None:
+        for field in self[name].Fields or []:
+            for type_name in extract_field_type(field.typeName):
+                self.references.get(type_name, {}).pop(field.id, None)
+        super().__delitem__(name)
+
+    def update(self, *args, **kwargs) -> None:  # type: ignore
+        for name, obj in dict(*args, **kwargs).items():
+            self[name] = obj
+
+
 async def create_object_type(
     object: ObjectTypeModel,
     available_objects: dict[str, ObjectType],
@@ -111,88 +143,159 @@ async def create_object_type(
     Returns:
         dict[str, ObjectType]: Updated available_objects with the newly created objects.
     """
-    if object.name in available_objects:
-        return available_objects
+    return await create_object_types([object], available_objects)
 
-    if object.Fields is None:
-        print(f"Fields is None and should be an array. \n {object}")
-        raise AssertionError(f"Fields is None and should be an array. \n {object}")
-    fields = object.Fields
-
-    field_inputs = []
-    for field in fields:
-        for related_type in field.related_types or []:
-            if related_type.name in available_objects:
-                continue
-            available_objects = await create_object_type(
-                related_type, available_objects
-            )
 
-        field.type = normalize_type(field.type)
-        if field.value is None and field.type.startswith("Optional"):
-            field.value = "None"
-
-        field_inputs.append(
-            {
-                "name": field.name,
-                "description": field.description,
-                "typeName": field.type,
-                "value": field.value,
-                "RelatedTypes": {
-                    "connect": [
-                        {"id": t.id}
-                        for t in get_related_types(field.type, available_objects)
-                    ]
-                },
-            }
-        )
+def flatten_object_types(
+    objects: list[ObjectTypeModel], available_objects: dict[str, ObjectType]
+) -> list[ObjectTypeModel]:
+    """
+    List the objects and their related types that are not available yet,
+    related types first.
+    """
+    flattened: dict[str, ObjectTypeModel] = {}
+
+    def visit(object: ObjectTypeModel):
+        if object.name in available_objects or object.name in flattened:
+            return
+        if object.Fields is None:
+            print(f"Fields is None and should be an array. \n {object}")
+            raise AssertionError(f"Fields is None and should be an array. \n {object}")
+        for field in object.Fields:
+            for related_type in field.related_types or []:
+                visit(related_type)
+        flattened[object.name] = object
+
+    for object in objects:
+        visit(object)
+    return list(flattened.values())
+
+
+async def create_object_types(
+    objects: list[ObjectTypeModel],
+    available_objects: dict[str, ObjectType],
+) -> dict[str, ObjectType]:
+    """
+    Creates and store object types, and their related types, in the database.
+    The IDs are generated client-side so all the rows and relations are written
+    in a single batch.
 
-    typing_imports = []
-    if object.is_pydantic:
-        typing_imports.append("from pydantic import BaseModel")
-    if object.is_enum:
-        typing_imports.append("from enum import Enum")
-
-    created_object_type = await ObjectType.prisma().create(
-        data={
-            "name": object.name,
-            "code": object.code,
-            "description": object.description,
-            "Fields": {"create": field_inputs},
-            "importStatements": typing_imports,
-            "isPydantic": object.is_pydantic,
-            "isEnum": object.is_enum,
-        },
-        **INCLUDE_FIELD,  # type: ignore
-    )
-    available_objects[object.name] = created_object_type
+    Args:
+    objects (list[ObjectTypeModel]): The objects to create.
+    available_objects (dict[str, ObjectType]):
+        The set of object definitions that have already been created.
+        This will be used to link the related object fields and avoid duplicates.
 
-    # Connect the fields of available objects to the newly created object.
-    # Naively check each available object if it has a related field to the new object.
-    # TODO(majdyz): Optimize this step if needed.
-    for obj in available_objects.values():
-        if obj.Fields is None:
-            raise AssertionError("Fields should be an array")
+    Returns:
+        dict[str, ObjectType]: Updated available_objects with the newly created objects,
+            the same registry when available_objects is an ObjectTypeRegistry.
+    """
+    if not isinstance(available_objects, ObjectTypeRegistry):
+        available_objects = ObjectTypeRegistry(available_objects)
+
+    new_objects = flatten_object_types(objects, available_objects)
+    if not new_objects:
+        return available_objects
 
-        for field in obj.Fields:
-            if object.name not in extract_field_type(field.typeName):
-                continue
+    now = datetime.datetime.now(datetime.timezone.utc)
+    created_objects: list[ObjectType] = []
+    for object in new_objects:
+        typing_imports = []
+        if object.is_pydantic:
+            typing_imports.append("from pydantic import BaseModel")
+        if object.is_enum:
+            typing_imports.append("from enum import Enum")
+
+        object_id = str(uuid.uuid4())
+        fields = []
+        for field in object.Fields:
+            field.type = normalize_type(field.type)
+            if field.value is None and field.type.startswith("Optional"):
+                field.value = "None"
+            fields.append(
+                ObjectField(
+                    id=str(uuid.uuid4()),
+                    createdAt=now,
+                    name=field.name,
+                    description=field.description,
+                    typeName=field.type,
+                    value=field.value,
+                    RelatedTypes=[],
+                    referredObjectTypeId=object_id,
+                )
+            )
 
+        created_object = ObjectType(
+            id=object_id,
+            createdAt=now,
+            name=object.name,
+            code=object.code,
+            description=object.description,
+            isPydantic=object.is_pydantic,
+            isEnum=object.is_enum,
+            importStatements=typing_imports,
+            Fields=fields,
+        )
+        available_objects[object.name] = created_object
+        created_objects.append(created_object)
+
+    # Link the fields of the new objects, and the available fields referring
+    # to the new objects, to their related types.
+    links: dict[str, dict[str, ObjectField]] = {}
+    for obj in created_objects:
+        for field in obj.Fields or []:
+            for related_type in get_related_types(field.typeName, available_objects):
+                links.setdefault(related_type.id, {})[field.id] = field
+    for obj in created_objects:
+        for field in available_objects.references.get(obj.name, {}).values():
             if field.RelatedTypes is None:
                 raise AssertionError("RelatedTypes should be an array")
-
-            if object.name in [f.name for f in field.RelatedTypes]:
-                continue
-
-            # Link created_object_type.id to the field.RelatedTypes
-            reltypes = get_related_types(field.typeName, available_objects)
-            updated_object_field = await ObjectField.prisma().update(
-                where={"id": field.id},
-                data={"RelatedTypes": {"connect": [{"id": t.id} for t in reltypes]}},
-                **INCLUDE_TYPE,  # type: ignore
+            if obj.name not in [t.name for t in field.RelatedTypes]:
+                links.setdefault(obj.id, {})[field.id] = field
+
+    objects_by_id = {obj.id: obj for obj in available_objects.values()}
+    for type_id, fields in links.items():
+        # Related types don't include their fields, like when loaded from the DB
+        related_type = objects_by_id[type_id].model_copy(update={"Fields": None})
+        for field in fields.values():
+            field.RelatedTypes = (field.RelatedTypes or []) + [related_type]
+
+    async with prisma.get_client().batch_() as batcher:
+        batcher.objecttype.create_many(
+            [
+                {
+                    "id": obj.id,
+                    "createdAt": now,
+                    "name": obj.name,
+                    "code": obj.code,
+                    "description": obj.description,
+                    "importStatements": obj.importStatements,
+                    "isPydantic": obj.isPydantic,
+                    "isEnum": obj.isEnum,
+                }
+                for obj in created_objects
+            ]  # type: ignore
+        )
+        batcher.objectfield.create_many(
+            [
+                {
+                    "id": field.id,
+                    "createdAt": now,
+                    "name": field.name,
+                    "description": field.description,
+                    "typeName": field.typeName,
+                    "value": field.value,
+                    "referredObjectTypeId": field.referredObjectTypeId,
+                }
+                for obj in created_objects
+                for field in obj.Fields or []
+            ]  # type: ignore
+        )
+        for type_id, fields in links.items():
+            batcher.objecttype.update(
+                where={"id": type_id},
+                data={"ReferredObjectFields": {"connect": [{"id": f} for f in fields]}},
             )
-            if updated_object_field:
-                field.RelatedTypes = updated_object_field.RelatedTypes
 
     return available_objects
 
@@ -1,3 +1,5 @@
+import functools
+import weakref
 from typing import List, Tuple
 
 from prisma.models import ObjectType
@@ -15,48 +17,81 @@ RENAMED_TYPES = {
 }
 
 
-def unwrap_object_type(type: str) -> Tuple[str, List[str]]:
+TYPE_CACHE_SIZE = 8192
+
+
+class TypeExpr:
     """
-    Get the type and children of a composite type.
-    Args:
-        type (str): The type to parse.
-    Returns:
-        str: The type.
-        [str]: The children types.
+    Parsed type expression, e.g. `Dict[str, List[int]]` is
+    `TypeExpr("Dict", (TypeExpr("str"), TypeExpr("List", (TypeExpr("int"),))))`.
+
+    Type expressions are immutable and interned: there's a single instance for each
+    name & children, so they are compared and hashed by identity. They must be built
+    with `TypeExpr.get` or `parse_type`.
     """
-    type = type.replace(" ", "")
-    if not type:
-        return "", []
 
-    def split_outer_level(type: str, separator: str) -> List[str]:
-        brace_count = 0
-        last_index = 0
-        splits = []
+    __slots__ = ("name", "children", "__weakref__")
+    _interned: "weakref.WeakValueDictionary[tuple, TypeExpr]" = (
+        weakref.WeakValueDictionary()
+    )
+
+    name: str
+    children: tuple["TypeExpr", ...]
+
+    @classmethod
+    def get(cls, name: str, children: tuple["TypeExpr", ...] = ()) -> "TypeExpr":
+        key = (name, children)
+        expr = cls._interned.get(key)
+        if expr is None:
+            expr = object.__new__(cls)
+            object.__setattr__(expr, "name", name)
+            object.__setattr__(expr, "children", children)
+            cls._interned[key] = expr
+        return expr
+
+    def __setattr__(self, name: str, value) -> None:
+        raise AttributeError("TypeExpr is immutable")
+
+    def __repr__(self) -> str:
+        return f"TypeExpr({format_type(self)!r})"
+
 
-        for i, c in enumerate(type):
-            if c in OPEN_BRACES:
-                brace_count += 1
-            elif c in CLOSE_BRACES:
-                brace_count -= 1
-            elif c == separator and brace_count == 0:
-                splits.append(type[last_index:i])
-                last_index = i + 1
+def split_outer_level(type: str, separator: str) -> List[str]:
+    brace_count = 0
+    last_index = 0
+    splits = []
 
-        splits.append(type[last_index:])
-        return splits
+    for i, c in enumerate(type):
+        if c in OPEN_BRACES:
+            brace_count += 1
+        elif c in CLOSE_BRACES:
+            brace_count -= 1
+        elif c == separator and brace_count == 0:
+            splits.append(type[last_index:i])
+            last_index = i + 1
+
+    splits.append(type[last_index:])
+    return splits
+
+
+@functools.lru_cache(maxsize=TYPE_CACHE_SIZE)
+def _unwrap_object_type(type: str) -> Tuple[str, Tuple[str, ...]]:
+    type = type.replace(" ", "")
+    if not type:
+        return "", ()
 
     # Unwrap primitive union types
     union_split = split_outer_level(type, "|")
     if len(union_split) > 1:
         if len(union_split) == 2 and "None" in union_split:
-            return "Optional", [v for v in union_split if v != "None"]
-        return "Union", union_split
+            return "Optional", tuple(v for v in union_split if v != "None")
+        return "Union", tuple(union_split)
 
     # Unwrap primitive dict/list/tuple types
     if type[0] in OPEN_BRACES and type[-1] in CLOSE_BRACES:
         type_name = OPEN_BRACES[type[0]]
         type_children = split_outer_level(type[1:-1], ",")
-        return type_name, type_children
+        return type_name, tuple(type_children)
 
     brace_pos = type.find("[")
     if brace_pos != -1 and type[-1] == "]":
@@ -68,40 +103,76 @@ def unwrap_object_type(type: str) -> Tuple[str, List[str]]:
         type_name = type
         type_children = []
 
-    return RENAMED_TYPES.get(type_name, type_name), type_children
+    return RENAMED_TYPES.get(type_name, type_name), tuple(type_children)
 
 
-def is_type_equal(type1: str | None, type2: str | None) -> bool:
+def unwrap_object_type(type: str) -> Tuple[str, List[str]]:
     """
-    Check if two types are equal.
-    This function handle composite types like list, dict, and tuple.
-    group similar types like list[str], List[str], and [str] as equal.
+    Get the type and children of a composite type.
+    Args:
+        type (str): The type to parse.
+    Returns:
+        str: The type.
+        [str]: The children types.
     """
-    if type1 is None and type2 is None:
-        return True
-    if type1 is None or type2 is None:
-        return False
+    type_name, type_children = _unwrap_object_type(type)
+    return type_name, list(type_children)
 
-    evaluated_type1, children1 = unwrap_object_type(type1)
-    evaluated_type2, children2 = unwrap_object_type(type2)
+
+@functools.lru_cache(maxsize=TYPE_CACHE_SIZE)
+def parse_type(type: str) -> TypeExpr:
+    """
+    Parse a type into its interned type expression.
+    e.g. list[str], List[str], and [str] are parsed into the same expression.
+
+    Args:
+        type (str): The type to parse.
+    Returns:
+        TypeExpr: The type expression.
+    """
+    type_name, type_children = _unwrap_object_type(type)
+    return TypeExpr.get(type_name, tuple(parse_type(c) for c in type_children))
+
+
+@functools.lru_cache(maxsize=TYPE_CACHE_SIZE)
+def _is_type_expr_equal(type1: TypeExpr, type2: TypeExpr) -> bool:
+    if type1 is type2:
+        return True
 
     # Compare the class name of the types (ignoring the module)
     # TODO(majdyz): compare the module name as well.
-    t_len = min(len(evaluated_type1), len(evaluated_type2))
-    if evaluated_type1.split(".")[-t_len:] != evaluated_type2.split(".")[-t_len:]:
+    t_len = min(len(type1.name), len(type2.name))
+    if type1.name.split(".")[-t_len:] != type2.name.split(".")[-t_len:]:
         return False
 
-    if len(children1) != len(children2):
+    if len(type1.children) != len(type2.children):
         return False
 
-    if len(children1) == len(children2) == 0:
+    return all(
+        _is_type_expr_equal(c1, c2) for c1, c2 in zip(type1.children, type2.children)
+    )
+
+
+def is_type_equal(type1: str | None, type2: str | None) -> bool:
+    """
+    Check if two types are equal.
+    This function handle composite types like list, dict, and tuple.
+    group similar types like list[str], List[str], and [str] as equal.
+    """
+    if type1 is None and type2 is None:
         return True
+    if type1 is None or type2 is None:
+        return False
 
-    for c1, c2 in zip(children1, children2):
-        if not is_type_equal(c1, c2):
-            return False
+    return _is_type_expr_equal(parse_type(type1), parse_type(type2))
 
-    return True
+
+@functools.lru_cache(maxsize=TYPE_CACHE_SIZE)
+def _extract_type_names(type: TypeExpr) -> frozenset[str]:
+    result = {type.name}
+    for child in type.children:
+        result |= _extract_type_names(child)
+    return frozenset(result)
 
 
 def extract_field_type(field_type: str | None) -> set[str]:
@@ -116,12 +187,28 @@ def extract_field_type(field_type: str | None) -> set[str]:
     """
     if field_type is None:
         return set()
-    parent_type, children = unwrap_object_type(field_type)
+    return set(_extract_type_names(parse_type(field_type)))
 
-    result = {parent_type}
-    for child in children:
-        result |= extract_field_type(child)
-    return result
+
+def format_type(type: TypeExpr, renamed_types: dict[str, str] = {}) -> str:
+    """
+    Format a type expression, renaming the types in `renamed_types`.
+    """
+    if not renamed_types:
+        return _format_type(type)
+
+    type_name = renamed_types.get(type.name, type.name)
+    if not type.children:
+        return type_name
+    children = ", ".join(format_type(c, renamed_types) for c in type.children)
+    return f"{type_name}[{children}]"
+
+
+@functools.lru_cache(maxsize=TYPE_CACHE_SIZE)
+def _format_type(type: TypeExpr) -> str:
+    if not type.children:
+        return type.name
+    return f"{type.name}[{', '.join(_format_type(c) for c in type.children)}]"
 
 
 def normalize_type(type: str, renamed_types: dict[str, str] = {}) -> str:
@@ -134,15 +221,21 @@ def normalize_type(type: str, renamed_types: dict[str, str] = {}) -> str:
     Returns:
         str: The normalized type.
     """
-    parent_type, children = unwrap_object_type(type)
-
-    if parent_type in renamed_types:
-        parent_type = renamed_types[parent_type]
+    return format_type(parse_type(type), renamed_types)
 
-    if len(children) == 0:
-        return parent_type
 
-    return f"{parent_type}[{', '.join([normalize_type(c, renamed_types) for c in children])}]"
+def clear_type_caches() -> None:
+    """
+    Clear the memoized type parsing, e.g. to benchmark the cold parsing.
+    """
+    for cached in [
+        _unwrap_object_type,
+        parse_type,
+        _is_type_expr_equal,
+        _extract_type_names,
+        _format_type,
+    ]:
+        cached.cache_clear()
 
 
 def get_related_types(
@@ -16,22 +16,32 @@ from prisma.models import (
 )
 from prisma.types import CompiledRouteCreateInput
 
-import codex
-import codex.common
-import codex.common.database
 from codex.api_model import Identifiers
 from codex.common.ai_block import LLMFailure
-from codex.common.database import INCLUDE_FUNC
+from codex.common.database import INCLUDE_FUNC, get_database_schema
 from codex.common.model import APIRouteSpec, FunctionDef, FunctionSpec
 from codex.database import create_completed_app
 from codex.develop.compile import (
+    ObjectTypeLoader,
     compile_route,
     get_object_field_deps,
     get_object_type_deps,
 )
-from codex.develop.database import get_compiled_route, get_deliverable
+from codex.develop.context import CompiledRouteContext, select_provided_functions
+from codex.develop.database import get_compiled_route_functions, get_deliverable
 from codex.develop.develop import DevelopAIBlock, NiceGUIDevelopAIBlock
+from codex.develop.embedding import (
+    get_similar_route_examples,
+    schedule_route_embedding,
+)
 from codex.develop.function import construct_function, generate_object_template
+from codex.develop.incremental import (
+    copy_compiled_route,
+    get_previous_compiled_routes,
+    get_route_spec_hashes,
+)
+from codex.develop.reuse import SharedFunctions, find_reusable_function
+from codex.develop.scheduler import WorkScheduler
 from codex.requirements.blocks.ai_page_decompose import PageDecompositionBlock
 from codex.requirements.database import create_single_function_spec, get_specification
 
@@ -84,6 +94,9 @@ async def process_api_route(
     completed_app: prisma.models.CompletedApp,
     extra_functions: list[Function] = [],
     lang: str = "python",
+    scheduler: WorkScheduler | None = None,
+    spec_hash: str | None = None,
+    shared_functions: SharedFunctions | None = None,
 ) -> CompiledRoute:
     if not api_route.RequestObject:
         types = []
@@ -114,11 +127,15 @@ async def process_api_route(
         function_code="",
     )
     object_type_ids = set()
+    route_objects = [
+        obj for obj in [api_route.RequestObject, api_route.ResponseObject] if obj
+    ]
+    loader = ObjectTypeLoader()
+    await loader.load(obj.id for obj in route_objects)
     available_types = {
         dep_type.name: dep_type
-        for obj in [api_route.RequestObject, api_route.ResponseObject]
-        if obj
-        for dep_type in await get_object_type_deps(obj.id, object_type_ids)
+        for obj in route_objects
+        for dep_type in await get_object_type_deps(obj.id, object_type_ids, loader)
     }
     if api_route.RequestObject and api_route.RequestObject.Fields:
         # RequestObject is unwrapped, so remove it from the available types
@@ -141,6 +158,7 @@ async def process_api_route(
             },
             CompletedApp={"connect": {"id": completed_app.id}},
             ApiRouteSpec={"connect": {"id": api_route.id}},
+            specHash=spec_hash,
         ),
         include={"RootFunction": INCLUDE_FUNC},  # type: ignore
     )
@@ -152,6 +170,7 @@ async def process_api_route(
     ids.compiled_route_id = compiled_route.id
     ids.function_id = compiled_route.RootFunction.id
 
+    scheduler = scheduler or WorkScheduler()
     route_root_func = await develop_route(
         ids=ids,
         goal_description=completed_app.description or "",
@@ -159,13 +178,123 @@ async def process_api_route(
         spec=spec,
         lang=lang,
         extra_functions=extra_functions,
+        scheduler=scheduler,
+        shared_functions=shared_functions,
     )
     logger.info(f"Route function id: {route_root_func.id}")
+    return await finish_api_route(
+        compiled_route.id, route_root_func, spec, extra_functions, lang, scheduler
+    )
+
+
+async def finish_api_route(
+    compiled_route_id: str,
+    route_root_func: Function,
+    spec: Specification,
+    extra_functions: list[Function],
+    lang: str,
+    scheduler: WorkScheduler,
+) -> CompiledRoute:
+    """
+    Compile a route whose functions have all been developed.
+    """
     available_funcs, available_objs = await populate_available_functions_objects(
         extra_functions
     )
-    return await compile_route(
-        compiled_route.id, route_root_func, spec, available_funcs, available_objs
+    # Compiling is the last step of the route, nothing else depends on it
+    async with scheduler.slot(priority=0):
+        compiled_route = await compile_route(
+            compiled_route_id, route_root_func, spec, available_funcs, available_objs
+        )
+    if lang == "python":
+        schedule_route_embedding(compiled_route.id)
+    return compiled_route
+
+
+async def resume_api_route(
+    compiled_route: CompiledRoute,
+    ids: Identifiers,
+    spec: Specification,
+    completed_app: CompletedApp,
+    extra_functions: list[Function] = [],
+    lang: str = "python",
+    scheduler: WorkScheduler | None = None,
+    shared_functions: SharedFunctions | None = None,
+) -> CompiledRoute:
+    """
+    Resume the development of a route from the state of its functions:
+    only the functions still in DEFINITION or FAILED are developed,
+    then the route is compiled again.
+
+    Args:
+        compiled_route (CompiledRoute): The route to resume.
+        ids (Identifiers): The identifiers for the route.
+        spec (Specification): The specification of the application.
+        completed_app (CompletedApp): The deliverable the route belongs to.
+
+    Returns:
+        CompiledRoute: The compiled route.
+    """
+    functions = await get_compiled_route_functions(
+        compiled_route.id, compiled_route.rootFunctionId
+    )
+    child_functions: dict[str, list[Function]] = {}
+    for func in functions.values():
+        if func.parentFunctionId:
+            child_functions.setdefault(func.parentFunctionId, []).append(func)
+
+    # The functions left to develop, their own child functions are written again
+    pending: list[tuple[Function, int]] = []
+    queue = [(functions[compiled_route.rootFunctionId], 0)]
+    while queue:
+        func, depth = queue.pop(0)
+        if func.state in [FunctionState.DEFINITION, FunctionState.FAILED]:
+            pending.append((func, depth))
+        else:
+            queue.extend(
+                (child, depth + 1) for child in child_functions.get(func.id, [])
+            )
+
+    route_root_func = functions[compiled_route.rootFunctionId]
+    if compiled_route.compiledCode and not pending:
+        logger.info(f"Compiled route {compiled_route.id} is already complete")
+        return compiled_route
+    logger.info(
+        f"Resuming compiled route {compiled_route.id}: "
+        f"{len(pending)} of {len(functions)} functions left to develop"
+    )
+
+    ids.spec_id = spec.id
+    ids.compiled_route_id = compiled_route.id
+    scheduler = scheduler or WorkScheduler()
+    if pending:
+        context = await CompiledRouteContext.load(
+            compiled_route.id, spec, extra_functions
+        )
+        developed = await asyncio.gather(
+            *[
+                scheduler.spawn(
+                    develop_route(
+                        ids=ids,
+                        goal_description=completed_app.description or "",
+                        function=func,
+                        spec=spec,
+                        lang=lang,
+                        extra_functions=extra_functions,
+                        depth=depth,
+                        context=context,
+                        scheduler=scheduler,
+                        shared_functions=shared_functions,
+                    )
+                )
+                for func, depth in pending
+            ]
+        )
+        if pending[0][0].id == route_root_func.id:
+            route_root_func = developed[0]
+
+    return await finish_api_route(
+        compiled_route.id, route_root_func, spec, extra_functions, lang, scheduler
     )
 
 
@@ -251,6 +380,8 @@ async def develop_application(
         extra_functions = []
 
     tasks = []
+    scheduler = WorkScheduler()
+    shared_functions = SharedFunctions()
 
     if spec.Modules:
         api_routes = []
@@ -258,36 +389,177 @@ async def develop_application(
             if module.ApiRouteSpecs:
                 api_routes.extend(module.ApiRouteSpecs)
 
+        # Only develop the routes that changed since the previous deliverable
+        spec_hashes = await get_route_spec_hashes(api_routes, lang, extra_functions)
+        previous_routes = await get_previous_compiled_routes(
+            completed_app, get_database_schema(spec), lang
+        )
+
         for api_route in api_routes:
+            spec_hash = spec_hashes[api_route.id]
+            if spec_hash in previous_routes:
+                await copy_compiled_route(
+                    previous_routes.pop(spec_hash), api_route, completed_app
+                )
+                continue
+
             # Schedule each API route for processing
-            task = process_api_route(
-                api_route,
-                ids,
+            task = scheduler.spawn(
+                process_api_route(
+                    api_route,
+                    ids,
+                    spec,
+                    completed_app,
+                    extra_functions,
+                    lang,
+                    scheduler,
+                    spec_hash,
+                    shared_functions,
+                )
+            )
+            tasks.append(task)
+        logger.info(
+            f"Developing {len(tasks)} of {len(api_routes)} API routes, "
+            f"{len(api_routes) - len(tasks)} unchanged routes copied"
+        )
+
+        await wait_for_api_routes(ids, tasks, eat_errors, scheduler)
+        logger.info(f"{shared_functions.shared} helper functions shared by routes")
+
+    return completed_app
+
+
+async def wait_for_api_routes(
+    ids: Identifiers,
+    tasks: list[asyncio.Task],
+    eat_errors: bool,
+    scheduler: WorkScheduler,
+) -> None:
+    """
+    Wait for the route tasks to complete. On a fatal error, i.e. any error unless
+    only LLM failures are eaten, the remaining work is cancelled right away
+    instead of being completed for nothing.
+
+    Raises:
+        LLMFailure: If any route failed, and the errors are not eaten.
+    """
+    exceptions: list[BaseException] = []
+    pending = set(tasks)
+    while pending:
+        done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_EXCEPTION)
+        exceptions += [e for t in done if not t.cancelled() and (e := t.exception())]
+        if pending and any(
+            not (eat_errors and isinstance(e, LLMFailure)) for e in exceptions
+        ):
+            logger.error(
+                f"App Id: {ids.app_id} Failing fast, cancelling {len(pending)} "
+                f"of {len(tasks)} API routes: {exceptions}"
+            )
+            scheduler.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+            break
+
+    if exceptions:
+        # if the only exceptions are LLMFailures, we can continue
+        if eat_errors and all(isinstance(r, LLMFailure) for r in exceptions):
+            logger.warning(
+                f"App Id: {ids.app_id} Eating Errors developing API routes: {exceptions}"
+            )
+        else:
+            error_message = "".join(f"\n* {e}" for e in exceptions)
+            raise LLMFailure(
+                f"App Id: {ids.app_id} Error developing API routes: \n{error_message}"
+            )
+    else:
+        logger.info("🚀 All API routes developed successfully")
+
+
+@traceable
+async def resume_application(
+    ids: Identifiers,
+    completed_app_id: str,
+    lang: str | None = None,
+    eat_errors: bool = True,
+) -> CompletedApp:
+    """
+    Resume the development of an application that was interrupted, from the
+    functions and compiled routes already developed. Routes that were never
+    started are developed from scratch.
+
+    Args:
+        ids (Identifiers): The identifiers used for development.
+        completed_app_id (str): The deliverable to resume.
+        lang (str | None): The language of the deliverable, by default "nicegui"
+                           for a user interface (with a companion backend)
+                           and "python" otherwise.
+
+    Returns:
+        CompletedApp: The completed application.
+    """
+    if not ids.user_id or not ids.app_id:
+        raise ValueError("user_id and app_id are required")
+
+    completed_app = await get_deliverable(completed_app_id)
+    if not completed_app.specificationId:
+        raise ValueError(f"Completed app {completed_app_id} has no specification")
+    spec = await get_specification(
+        ids.user_id, ids.app_id, completed_app.specificationId
+    )
+    ids.completed_app_id = completed_app.companionCompletedAppId
+    if lang is None:
+        lang = "nicegui" if completed_app.companionCompletedAppId else "python"
+    if ids.completed_app_id:
+        existing_completed_app = await get_deliverable(ids.completed_app_id)
+        extra_functions = [
+            route.RootFunction
+            for route in existing_completed_app.CompiledRoutes or []
+            if route.RootFunction
+        ]
+    else:
+        extra_functions = []
+
+    compiled_routes = {
+        route.apiRouteSpecId: route
+        for route in completed_app.CompiledRoutes or []
+        if route.apiRouteSpecId
+    }
+    api_routes = [
+        api_route
+        for module in spec.Modules or []
+        for api_route in module.ApiRouteSpecs or []
+    ]
+    spec_hashes = await get_route_spec_hashes(api_routes, lang, extra_functions)
+
+    tasks = []
+    scheduler = WorkScheduler()
+    shared_functions = SharedFunctions()
+    for api_route in api_routes:
+        if api_route.id in compiled_routes:
+            coro = resume_api_route(
+                compiled_routes[api_route.id],
+                ids.model_copy(),
                 spec,
                 completed_app,
                 extra_functions,
                 lang,
+                scheduler,
+                shared_functions,
             )
-            tasks.append(task)
-
-        # Run the tasks concurrently
-        results = await asyncio.gather(*tasks, return_exceptions=True)
-        if any(isinstance(r, Exception) for r in results):
-            exceptions = [r for r in results if isinstance(r, Exception)]
-            # if the only exceptions are LLMFailures, we can continue
-            if eat_errors and all(isinstance(r, LLMFailure) for r in exceptions):
-                logger.warning(
-                    f"App Id: {ids.app_id} Eating Errors developing API routes: {exceptions}"
-                )
-                pass
-            else:
-                error_message = "".join(f"\n* {e}" for e in exceptions)
-                raise LLMFailure(
-                    f"App Id: {ids.app_id} Error developing API routes: \n{error_message}"
-                )
         else:
-            logger.info("🚀 All API routes developed successfully")
+            coro = process_api_route(
+                api_route,
+                ids.model_copy(),
+                spec,
+                completed_app,
+                extra_functions,
+                lang,
+                scheduler,
+                spec_hashes[api_route.id],
+                shared_functions,
+            )
+        tasks.append(scheduler.spawn(coro))
 
+    await wait_for_api_routes(ids, tasks, eat_errors, scheduler)
     return completed_app
 
 
@@ -299,17 +571,30 @@ async def populate_available_functions_objects(
     generated_objs: dict[str, ObjectType] = {}
 
     object_ids = set()
+    # Load the object graph of all the functions at once
+    loader = ObjectTypeLoader()
+    await loader.load_fields(
+        [
+            field
+            for func in functions
+            for field in (func.FunctionArgs or [])
+            + ([func.FunctionReturn] if func.FunctionReturn else [])
+        ]
+    )
+
     for func in functions:
         generated_func[func.functionName] = func
 
         # Populate generated request objects from the LLM
         for arg in func.FunctionArgs or []:
-            for type in await get_object_field_deps(arg, object_ids):
+            for type in await get_object_field_deps(arg, object_ids, loader):
                 generated_objs[type.name] = type
 
         # Populate generated response objects from the LLM
         if func.FunctionReturn:
-            for type in await get_object_field_deps(func.FunctionReturn, object_ids):
+            for type in await get_object_field_deps(
+                func.FunctionReturn, object_ids, loader
+            ):
                 generated_objs[type.name] = type
 
     return generated_func, generated_objs
@@ -324,6 +609,9 @@ async def develop_route(
     lang: str,
     extra_functions: list[Function] = [],
     depth: int = 0,
+    context: CompiledRouteContext | None = None,
+    scheduler: WorkScheduler | None = None,
+    shared_functions: SharedFunctions | None = None,
 ) -> Function:
     """
     Recursively develops a function and its child functions
@@ -334,6 +622,11 @@ async def develop_route(
         goal_description (str): The high-level goal of the function to create.
         function (Function): The function to develop.
         depth (int): The depth of the recursion.
+        context (CompiledRouteContext): The development context of the route,
+                                        shared by the recursive calls.
+        scheduler (WorkScheduler): The scheduler bounding the development work.
+        shared_functions (SharedFunctions): The helper functions shared by the
+                                            routes of the application.
 
     Returns:
         Function: The developed route function.
@@ -351,32 +644,27 @@ async def develop_route(
     if depth > RECURSION_DEPTH_LIMIT:
         raise ValueError("Recursion depth exceeded")
 
-    compiled_route = await get_compiled_route(ids.compiled_route_id)
-    functions = []
-    if compiled_route.Functions:
-        functions += compiled_route.Functions
-    if compiled_route.RootFunction:
-        functions.append(compiled_route.RootFunction)
-    if extra_functions:
-        functions += extra_functions
-
-    generated_func, generated_objs = await populate_available_functions_objects(
-        functions
-    )
-
-    provided_functions = [
-        func.template
-        for func in list(generated_func.values()) + extra_functions
-        if func.functionName != function.functionName
-    ] + [generate_object_template(f) for f in generated_objs.values()]
+    if context is None:
+        context = await CompiledRouteContext.load(
+            ids.compiled_route_id, spec, extra_functions
+        )
+    # Snapshot the context, sibling functions keep updating it concurrently
+    generated_func = dict(context.functions)
+    generated_objs = dict(context.objects)
 
-    database_schema = codex.common.database.get_database_schema(spec)
+    provided_functions, saved_tokens = select_provided_functions(
+        function, list(generated_func.values()) + extra_functions, generated_objs
+    )
+    if saved_tokens:
+        logger.info(
+            f"Provided {len(provided_functions)} functions & classes to "
+            f"{function.functionName}, saved {saved_tokens} tokens",
+            extra=ids.model_dump(),
+        )
 
     dev_invoke_params = {
-        "route_path": compiled_route.ApiRouteSpec.path
-        if compiled_route.ApiRouteSpec
-        else "/",
-        "database_schema": database_schema,
+        "route_path": context.route_path,
+        "database_schema": context.database_schema,
         "function_name": function.functionName,
         "goal": goal_description,
         "function_signature": function.template,
@@ -390,33 +678,81 @@ async def develop_route(
         # compiled_route_id is not used by the prompt, but is used by the function
         "compiled_route_id": ids.compiled_route_id,
         # available_objects is not used by the prompt, but is used by the function
-        "available_objects": generated_objs,
+        # and the objects it creates are added to it
+        "available_objects": context.objects,
         # function_id is used, so we can update the function with the implementation
         "function_id": function.id,
         "available_functions": generated_func,
         "allow_stub": depth < RECURSION_DEPTH_LIMIT,
     }
 
+    if lang == "python" and depth == 0:
+        # The code of similar routes of previous applications, as examples
+        dev_invoke_params["similar_routes"] = await get_similar_route_examples(
+            context.compiled_route
+        )
+
     if lang == "nicegui":
         ai_block = NiceGUIDevelopAIBlock()
     else:
         ai_block = DevelopAIBlock()
 
-    route_function = await ai_block.invoke(ids=ids, invoke_params=dev_invoke_params)
+    # Helpers requested by other routes of the app are only developed once,
+    # wait for them outside of the scheduler slots
+    shared_function = None
+    if shared_functions and depth > 0:
+        shared_function = await shared_functions.acquire(function)
+
+    # The deeper the function, the shorter the path of work remaining after it.
+    # The remaining depth is an upper bound of that path: the child functions are
+    # only known once this call wrote them as stubs, so the size of the subtree
+    # can't rank the calls waiting for a slot.
+    scheduler = scheduler or WorkScheduler()
+    route_function = None
+    try:
+        async with scheduler.slot(priority=RECURSION_DEPTH_LIMIT - depth + 1):
+            if shared_function:
+                route_function = await ai_block.reuse_function(
+                    ids, dev_invoke_params, shared_function
+                )
+            if not route_function and lang == "python":
+                # Helpers are often the same across applications, try reusing one
+                if reusable := await find_reusable_function(
+                    function, context.database_schema, generated_objs
+                ):
+                    route_function = await ai_block.reuse_function(
+                        ids, dev_invoke_params, reusable
+                    )
+            if not route_function:
+                route_function = await ai_block.invoke(
+                    ids=ids, invoke_params=dev_invoke_params
+                )
+    finally:
+        if shared_functions:
+            shared_functions.release(function, route_function)
+    await context.add_functions(
+        [route_function] + (route_function.ChildFunctions or [])
+    )
 
     if route_function.ChildFunctions:
         logger.info(
             f"\tDeveloping {len(route_function.ChildFunctions)} child functions"
         )
         tasks = [
-            develop_route(
-                ids=ids,
-                goal_description=goal_description,
-                function=child,
-                spec=spec,
-                lang=lang,
-                extra_functions=extra_functions,
-                depth=depth + 1,
+            scheduler.spawn(
+                develop_route(
+                    # Each child sets its own function id
+                    ids=ids.model_copy(),
+                    goal_description=goal_description,
+                    function=child,
+                    spec=spec,
+                    lang=lang,
+                    extra_functions=extra_functions,
+                    depth=depth + 1,
+                    context=context,
+                    scheduler=scheduler,
+                    shared_functions=shared_functions,
+                )
             )
             for child in route_function.ChildFunctions
             if child.state == FunctionState.DEFINITION
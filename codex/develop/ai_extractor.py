@@ -2,6 +2,7 @@ from prisma.enums import DevelopmentPhase
 
 from codex.api_model import Identifiers
 from codex.common.ai_block import AIBlock, ValidatedResponse, ValidationError
+from codex.common.cascade import CASCADE_MODEL
 
 
 class DocumentationExtractor(AIBlock):
@@ -14,6 +15,8 @@ class DocumentationExtractor(AIBlock):
     prompt_template_name = "validate/documentation_extractor"
     # Model to use for the LLM
     model = "gpt-4o"
+    # Cheaper model tried first, the extraction rarely needs the strong model
+    cascade_model = CASCADE_MODEL
     # Should we force the LLM to reply in JSON
     is_json_response = False
 
@@ -59,7 +59,9 @@ class CodeValidator:
         self.db_schema: str = database_schema
         self.func_name: str = function_name or ""
         self.available_functions: dict[str, Function] = available_functions or {}
-        self.available_objects: dict[str, ObjectType] = available_objects or {}
+        self.available_objects: dict[str, ObjectType] = (
+            available_objects if available_objects is not None else {}
+        )
         self.use_prisma: bool = use_prisma
         self.use_nicegui: bool = use_nicegui
 
@@ -130,7 +132,7 @@ class CodeValidator:
 
         try:
             tree = ast.parse(raw_code)
-            visitor = FunctionVisitor()
+            visitor = FunctionVisitor(raw_code)
             visitor.visit(tree)
             validation_errors.extend([ValidationError(e) for e in visitor.errors])
         except Exception as e:
@@ -2,7 +2,7 @@ import ast
 import logging
 import re
 from datetime import datetime
-from typing import List, Set
+from typing import Iterable, List, Set
 
 from packaging import version
 from prisma.models import (
@@ -17,12 +17,12 @@ from prisma.models import (
 from prisma.types import CompiledRouteUpdateInput
 from pydantic import BaseModel
 
-from codex.common.database import INCLUDE_FIELD, INCLUDE_FUNC, get_database_schema
+from codex.common.database import INCLUDE_FIELD, get_database_schema
 from codex.common.exec_external_tool import DEFAULT_DEPS
 from codex.common.types import normalize_type
 from codex.deploy.model import Application
 from codex.develop.code_validation import CodeValidator
-from codex.develop.database import get_compiled_route, get_deliverable
+from codex.develop.database import get_compiled_route_functions, get_deliverable
 from codex.develop.function import generate_object_template
 from codex.develop.model import Package as PackageModel
 
@@ -40,6 +40,123 @@ class ComplicationFailure(Exception):
     pass
 
 
+class ObjectTypeLoader:
+    """
+    Loads the object type graph reachable from a set of root types.
+
+    The graph is fetched breadth-first, one `find_many` query per level, and every
+    loaded object type is cached for the lifetime of the loader, so a loader
+    shared across a request only queries each object type once.
+    """
+
+    def __init__(self):
+        self.object_types: dict[str, ObjectType] = {}
+
+    async def load(self, obj_type_ids: Iterable[str]) -> None:
+        """
+        Load the given object types and all the types reachable from their fields.
+
+        Args:
+            obj_type_ids (Iterable[str]): The IDs of the root object types.
+
+        Raises:
+            ValueError: If an object type doesn't exist or has no fields.
+        """
+        pending = {i for i in obj_type_ids if i not in self.object_types}
+        while pending:
+            objs = await ObjectType.prisma().find_many(
+                where={"id": {"in": list(pending)}},
+                **INCLUDE_FIELD,  # type: ignore
+            )
+            for obj in objs:
+                if obj.Fields is None:
+                    raise ValueError(f"ObjectType {obj.name} has no fields.")
+                self.object_types[obj.id] = obj
+
+            if missing := pending - self.object_types.keys():
+                raise ValueError(f"ObjectTypes not found: {missing}")
+
+            pending = {
+                t.id
+                for obj in objs
+                for field in obj.Fields or []
+                for t in field.RelatedTypes or []
+                if t.id not in self.object_types
+            }
+
+    async def load_fields(self, fields: List[ObjectField]) -> List[ObjectField]:
+        """
+        Load the object types related to the given fields.
+        Fields that were fetched without their related types are re-fetched,
+        all in a single query.
+
+        Args:
+            fields (List[ObjectField]): The fields to load.
+
+        Returns:
+            List[ObjectField]: The fields, with their related types included.
+        """
+        missing_ids = [f.id for f in fields if f.RelatedTypes is None]
+        if missing_ids:
+            fetched = await ObjectField.prisma().find_many(
+                where={"id": {"in": missing_ids}},
+                include={"RelatedTypes": True},
+            )
+            fetched_by_id = {f.id: f for f in fetched}
+            fields = [fetched_by_id.get(f.id, f) for f in fields]
+
+        await self.load(t.id for f in fields for t in f.RelatedTypes or [])
+        return fields
+
+    async def get_object_type_deps(
+        self, obj_type_id: str, object_type_ids: Set[str]
+    ) -> List[ObjectType]:
+        await self.load([obj_type_id])
+        return self._object_type_deps(obj_type_id, object_type_ids)
+
+    async def get_object_field_deps(
+        self, field: ObjectField, object_type_ids: Set[str]
+    ) -> List[ObjectType]:
+        [field] = await self.load_fields([field])
+        return self._object_field_deps(field, object_type_ids)
+
+    def _object_type_deps(
+        self, obj_type_id: str, object_type_ids: Set[str]
+    ) -> List[ObjectType]:
+        obj = self.object_types[obj_type_id]
+
+        objects: List[ObjectType] = []
+        for field in obj.Fields or []:
+            if field.RelatedTypes:
+                objects.extend(self._object_field_deps(field, object_type_ids))
+
+        return objects + [obj]
+
+    def _object_field_deps(
+        self, field: ObjectField, object_type_ids: Set[str]
+    ) -> List[ObjectType]:
+        if field.RelatedTypes is None:
+            raise AssertionError("Field RelatedTypes should be an array")
+        types = [t for t in field.RelatedTypes if t.id not in object_type_ids]
+
+        if not types:
+            # If the field is a primitive type or we have already processed this
+            # object, we don't need to do anything
+            logger.debug(
+                f"Skipping field {field.name} as it's a primitive type or already processed"
+            )
+            return []
+
+        logger.debug(f"Processing field {field.name} of type {field.typeName}")
+        object_type_ids.update([t.id for t in types])
+
+        pydantic_classes = []
+        for type in types:
+            pydantic_classes.extend(self._object_type_deps(type.id, object_type_ids))
+
+        return pydantic_classes
+
+
 async def compile_route(
     compiled_route_id: str,
     route_root_func: Function,
@@ -56,7 +173,32 @@ async def compile_route(
     Returns:
         CompiledRoute: The compiled route object.
     """
-    compiled_function = await recursive_compile_route(route_root_func, set())
+    # Load the whole function tree of the route at once, and assemble it in memory
+    functions = await get_compiled_route_functions(
+        compiled_route_id, route_root_func.id
+    )
+    child_functions: dict[str, List[Function]] = {}
+    for function in functions.values():
+        if function.parentFunctionId:
+            child_functions.setdefault(function.parentFunctionId, []).append(function)
+
+    loader = ObjectTypeLoader()
+    await loader.load_fields(
+        [
+            field
+            for function in functions.values()
+            for field in (function.FunctionArgs or [])
+            + ([function.FunctionReturn] if function.FunctionReturn else [])
+        ]
+    )
+    compiled_function = await recursive_compile_route(
+        functions[route_root_func.id],
+        child_functions,
+        set(),
+        loader,
+        CompiledFunction(packages=[], imports=[], code=""),
+    )
+    compiled_function.imports = sorted(set(compiled_function.imports))
 
     unique_packages = {
         package.id: PackageModel(
@@ -72,7 +214,12 @@ async def compile_route(
     code += "\n\n"
     code += compiled_function.code
 
-    compiled_route = await get_compiled_route(compiled_route_id)
+    # Check Code
+    try:
+        ast.parse(code)
+    except Exception as e:
+        raise ValueError(f"Syntax error in function code: {e}, {code}")
+
     database_schema = get_database_schema(spec)
     available_functions[route_root_func.functionName] = route_root_func
     # Run the auto-fixers
@@ -132,15 +279,25 @@ def add_full_import_parth_to_custom_types(module_name: str, arg: ObjectField) ->
 
 
 async def recursive_compile_route(
-    in_function: Function, object_type_ids: Set[str]
+    function: Function,
+    child_functions: dict[str, List[Function]],
+    object_type_ids: Set[str],
+    loader: ObjectTypeLoader,
+    compiled_function: CompiledFunction,
 ) -> CompiledFunction:
     """
     Recursively compiles a function and its child functions
     into a single CompiledFunction object.
+    The function tree is expected to be already loaded in memory.
 
     Args:
-        ids (Identifiers): The identifiers for the function.
         function (Function): The function to compile.
+        child_functions (dict[str, List[Function]]): The child functions
+                                                     by parent function ID.
+        object_type_ids (Set[str]): A set of object type IDs that
+                                    have already been compiled.
+        loader (ObjectTypeLoader): The loader holding the object types.
+        compiled_function (CompiledFunction): The compiled function to append to.
 
     Returns:
         CompiledFunction: The compiled function.
@@ -148,103 +305,75 @@ async def recursive_compile_route(
     Raises:
         ValueError: If the function code is missing.
     """
-    # Can't see how to do recursive lookup with prisma, so I'm checking the next
-    # layer down each time. This is a bit of a hack, can be improved later.
-    function = await Function.prisma().find_unique_or_raise(
-        where={"id": in_function.id},
-        include={
-            **INCLUDE_FUNC["include"],
-            "ParentFunction": INCLUDE_FUNC,
-            "ChildFunctions": INCLUDE_FUNC,
-            "Packages": True,
-        },  # type: ignore
-    )
     logger.info(f"⚙️ Compiling function: {function.functionName}")
 
     if function.functionCode is None:
         raise ValueError(f"Function code is required! {function.functionName}")
 
-    packages = []
-    imports = []
-    code = []
-    model = []
-
-    if function.FunctionArgs is not None:
-        for arg in function.FunctionArgs:
-            obj_types = await get_object_field_deps(arg, object_type_ids)
-            model.extend([generate_object_template(obj_type) for obj_type in obj_types])
-            for obj in obj_types:
-                imports.extend(obj.importStatements)
-
-    if function.FunctionReturn is not None:
-        obj_types = await get_object_field_deps(
-            function.FunctionReturn, object_type_ids
+    # Pydantic models are declared before the functions of the sub-tree using them
+    fields = (function.FunctionArgs or []) + (
+        [function.FunctionReturn] if function.FunctionReturn else []
+    )
+    for field in fields:
+        obj_types = await get_object_field_deps(field, object_type_ids, loader)
+        compiled_function.pydantic_models.extend(
+            [generate_object_template(obj_type) for obj_type in obj_types]
         )
-        model.extend([generate_object_template(obj_type) for obj_type in obj_types])
         for obj in obj_types:
-            imports.extend(obj.importStatements)
+            compiled_function.imports.extend(obj.importStatements)
 
     # Child Functions
-    if function.ChildFunctions is None:
-        raise AssertionError("ChildFunctions should be an array")
-    for child_function in function.ChildFunctions:
-        compiled_function = await recursive_compile_route(
-            child_function, object_type_ids
+    for child_function in child_functions.get(function.id, []):
+        await recursive_compile_route(
+            child_function,
+            child_functions,
+            object_type_ids,
+            loader,
+            compiled_function,
         )
-        packages.extend(compiled_function.packages)
-        imports.extend(compiled_function.imports)
-        model.extend(compiled_function.pydantic_models)
-        code.append(compiled_function.code)
 
     # Package
     if function.Packages:
-        packages.extend(function.Packages)
+        compiled_function.packages.extend(function.Packages)
 
     # Imports
-    imports.extend(function.importStatements)
-    imports = sorted(set(imports))
+    compiled_function.imports.extend(function.importStatements)
 
-    # Code
-    code.append(function.functionCode)
+    # Code, child functions are declared before their parent
+    compiled_function.code += (
+        "\n\n" if compiled_function.code else ""
+    ) + function.functionCode
 
-    # Check Code
-    try:
-        check_code = "\n".join(imports)
-        check_code += "\n\n" + "\n\n".join(model)
-        check_code += "\n\n" + "\n\n".join(code)
-        ast.parse(check_code)
-    except Exception as e:
-        raise ValueError(f"Syntax error in function code: {e}, {code}")
-
-    return CompiledFunction(
-        packages=packages,
-        imports=imports,
-        code="\n\n".join(code),
-        pydantic_models=model,
-    )
+    return compiled_function
 
 
 async def get_object_type_deps(
-    obj_type_id: str, object_type_ids: Set[str]
+    obj_type_id: str,
+    object_type_ids: Set[str],
+    loader: ObjectTypeLoader | None = None,
 ) -> List[ObjectType]:
-    # Lookup the object getting all its subfields
-    obj = await ObjectType.prisma().find_unique_or_raise(
-        where={"id": obj_type_id},
-        **INCLUDE_FIELD,  # type: ignore
-    )
-    if obj.Fields is None:
-        raise ValueError(f"ObjectType {obj.name} has no fields.")
+    """
+    Get an object type and all the object types it depends on,
+    dependencies first.
 
-    objects: List[ObjectType] = []
-    for field in obj.Fields:
-        if field.RelatedTypes:
-            objects.extend(await get_object_field_deps(field, object_type_ids))
+    Args:
+        obj_type_id (str): The ID of the object type.
+        object_type_ids (Set[str]): A set of object type IDs that
+                                    have already been processed.
+        loader (ObjectTypeLoader): The loader caching the object types,
+                                   share it across calls of the same request.
 
-    return objects + [obj]
+    Returns:
+        List[ObjectType]: The object type and its dependencies.
+    """
+    loader = loader or ObjectTypeLoader()
+    return await loader.get_object_type_deps(obj_type_id, object_type_ids)
 
 
 async def get_object_field_deps(
-    field: ObjectField, object_type_ids: Set[str]
+    field: ObjectField,
+    object_type_ids: Set[str],
+    loader: ObjectTypeLoader | None = None,
 ) -> List[ObjectType]:
     """
     Process an object field and return the Pydantic classes
@@ -254,6 +383,8 @@ async def get_object_field_deps(
         field (ObjectField): The object field to process.
         object_type_ids (Set[str]): A set of object type IDs that
                                     have already been processed.
+        loader (ObjectTypeLoader): The loader caching the object types,
+                                   share it across calls of the same request.
 
     Returns:
         List[ObjectType]: The object types generated from the field's type.
@@ -261,33 +392,8 @@ async def get_object_field_deps(
     Raises:
         AssertionError: If the field type is None.
     """
-    # Lookup the field object getting all its subfields
-    field = await ObjectField.prisma().find_unique_or_raise(
-        where={"id": field.id},
-        include={"RelatedTypes": True},
-    )
-
-    if field.RelatedTypes is None:
-        raise AssertionError("Field RelatedTypes should be an array")
-    types = [t for t in field.RelatedTypes if t.id not in object_type_ids]
-
-    if not types:
-        # If the field is a primitive type or we have already processed this object,
-        # we don't need to do anything
-        logger.debug(
-            f"Skipping field {field.name} as it's a primitive type or already processed"
-        )
-        return []
-
-    logger.debug(f"Processing field {field.name} of type {field.typeName}")
-    object_type_ids.update([t.id for t in types])
-
-    # TODO: this can run in parallel
-    pydantic_classes = []
-    for type in types:
-        pydantic_classes.extend(await get_object_type_deps(type.id, object_type_ids))
-
-    return pydantic_classes
+    loader = loader or ObjectTypeLoader()
+    return await loader.get_object_field_deps(field, object_type_ids)
 
 
 def create_server_route_code(compiled_route: CompiledRoute) -> str:
@@ -0,0 +1,234 @@
+import logging
+import os
+import re
+
+from prisma.models import CompiledRoute, Function, ObjectType, Specification
+
+from codex.common.ai_model import num_tokens_from_messages
+from codex.common.database import get_database_schema
+from codex.common.model import ObjectTypeRegistry
+from codex.common.types import extract_field_type
+from codex.develop.compile import ObjectTypeLoader
+from codex.develop.database import get_compiled_route
+from codex.develop.function import generate_object_template
+
+logger = logging.getLogger(__name__)
+
+# Tokens of the functions & classes provided to the develop prompt
+PROVIDED_FUNCTIONS_TOKEN_BUDGET = int(
+    os.environ.get("PROVIDED_FUNCTIONS_TOKEN_BUDGET", 6000)
+)
+
+IDENTIFIER_PATTERN = re.compile(r"[A-Za-z_]\w*")
+
+
+class CompiledRouteContext:
+    """
+    The development context shared by all the functions of a compiled route:
+    the available functions, the object types they use and the database schema.
+
+    It is loaded once per compiled route and updated in memory as functions get
+    developed, so the recursive develop_route calls don't go back to the database.
+    """
+
+    def __init__(self, compiled_route: CompiledRoute, database_schema: str):
+        self.compiled_route = compiled_route
+        self.database_schema = database_schema
+        self.functions: dict[str, Function] = {}
+        # Also updated in place by create_object_types as the functions are stored
+        self.objects = ObjectTypeRegistry()
+        self._object_ids: set[str] = set()
+        self._loader = ObjectTypeLoader()
+
+    @classmethod
+    async def load(
+        cls,
+        compiled_route_id: str,
+        spec: Specification,
+        extra_functions: list[Function] = [],
+    ) -> "CompiledRouteContext":
+        """
+        Load the context of a compiled route from the database.
+
+        Args:
+            compiled_route_id (str): The ID of the compiled route.
+            spec (Specification): The specification the route is developed for.
+            extra_functions (list[Function]): Already implemented functions
+                                              available to the route.
+
+        Returns:
+            CompiledRouteContext: The loaded context.
+        """
+        compiled_route = await get_compiled_route(compiled_route_id)
+        context = cls(compiled_route, get_database_schema(spec))
+
+        functions = list(compiled_route.Functions or [])
+        if compiled_route.RootFunction:
+            functions.append(compiled_route.RootFunction)
+        await context.add_functions(functions + extra_functions)
+        return context
+
+    @property
+    def route_path(self) -> str:
+        if not self.compiled_route.ApiRouteSpec:
+            return "/"
+        return self.compiled_route.ApiRouteSpec.path
+
+    async def add_functions(self, functions: list[Function]) -> None:
+        """
+        Add new or updated functions to the context, along with the object types
+        used by their arguments and return values.
+
+        Args:
+            functions (list[Function]): The functions, including their
+                                        FunctionArgs and FunctionReturn.
+        """
+        fields = await self._loader.load_fields(
+            [
+                field
+                for func in functions
+                for field in (func.FunctionArgs or [])
+                + ([func.FunctionReturn] if func.FunctionReturn else [])
+            ]
+        )
+        for field in fields:
+            for obj in await self._loader.get_object_field_deps(
+                field, self._object_ids
+            ):
+                self.objects[obj.name] = obj
+
+        for func in functions:
+            self.functions[func.functionName] = func
+
+        logger.debug(
+            f"Compiled route {self.compiled_route.id} context: "
+            f"{len(self.functions)} functions, {len(self.objects)} objects"
+        )
+
+
+def get_function_types(function: Function) -> set[str]:
+    fields = (function.FunctionArgs or []) + (
+        [function.FunctionReturn] if function.FunctionReturn else []
+    )
+    return {name for f in fields for name in extract_field_type(f.typeName)}
+
+
+def get_object_closure(names: set[str], objects: dict[str, ObjectType]) -> set[str]:
+    """
+    The object types among `names`, and all the object types their fields use.
+    """
+    closure: set[str] = set()
+    pending = [name for name in names if name in objects]
+    while pending:
+        name = pending.pop()
+        if name in closure:
+            continue
+        closure.add(name)
+        for field in objects[name].Fields or []:
+            pending.extend(
+                n for n in extract_field_type(field.typeName) if n in objects
+            )
+    return closure
+
+
+def count_tokens(text: str) -> int:
+    return num_tokens_from_messages([{"content": text}])
+
+
+def select_provided_functions(
+    function: Function,
+    functions: list[Function],
+    objects: dict[str, ObjectType],
+    token_budget: int = PROVIDED_FUNCTIONS_TOKEN_BUDGET,
+) -> tuple[list[str], int]:
+    """
+    Select the templates of the functions & classes provided to the prompt
+    developing a function, most relevant first, within a token budget.
+
+    The object types used by the function signature are always provided. The
+    other candidates are ranked by how the function refers to them: functions &
+    classes named in its signature or docstring first, then functions sharing
+    its types, then the ones sharing words with it. A function is provided
+    along with the object types of its own signature, within the same budget.
+
+    Args:
+        function (Function): The function to develop.
+        functions (list[Function]): The functions available to it.
+        objects (dict[str, ObjectType]): The object types available to it.
+        token_budget (int): The maximum number of tokens of the templates.
+
+    Returns:
+        list[str]: The selected templates, functions first, in the given order.
+        int: The number of tokens saved by leaving out the other templates.
+    """
+    text = f"{function.template}\n{function.description or ''}"
+    identifiers = set(IDENTIFIER_PATTERN.findall(text))
+    words = {w for i in identifiers for w in i.lower().split("_") if w}
+    types = get_function_types(function)
+    required_objects = get_object_closure(types, objects)
+
+    def function_score(func: Function) -> float:
+        if func.functionName in identifiers:
+            return 3
+        if types & get_function_types(func):
+            return 2
+        name_words = set(func.functionName.lower().split("_"))
+        return len(name_words & words) / len(name_words)
+
+    def object_score(obj: ObjectType) -> float:
+        if obj.name in required_objects:
+            return 4
+        if obj.name in identifiers:
+            return 3
+        return 0
+
+    # The objects are positioned after the functions
+    object_templates = {
+        name: (len(functions) + i, generate_object_template(obj))
+        for i, (name, obj) in enumerate(objects.items())
+    }
+    object_tokens = {
+        name: count_tokens(template) for name, (_, template) in object_templates.items()
+    }
+
+    # (score, position, template, tokens, object types used by the candidate)
+    candidates = [
+        (
+            function_score(func),
+            i,
+            func.template,
+            count_tokens(func.template),
+            get_object_closure(get_function_types(func), objects),
+        )
+        for i, func in enumerate(functions)
+        if func.functionName != function.functionName
+    ]
+    candidates.extend(
+        (object_score(obj), *object_templates[name], object_tokens[name], {name})
+        for name, obj in objects.items()
+    )
+
+    selected: dict[int, str] = {}
+    selected_objects: set[str] = set()
+    used_tokens = 0
+    for score, position, template, tokens, used_objects in sorted(
+        candidates, key=lambda c: (-c[0], c[1])
+    ):
+        new_objects = used_objects - selected_objects
+        if position >= len(functions):
+            if not new_objects:
+                # Already provided along with a function
+                continue
+        else:
+            tokens += sum(object_tokens[name] for name in new_objects)
+        if score < 4 and used_tokens + tokens > token_budget:
+            continue
+        used_tokens += tokens
+        selected[position] = template
+        for name in new_objects:
+            object_position, object_template = object_templates[name]
+            selected[object_position] = object_template
+        selected_objects |= new_objects
+
+    saved_tokens = sum(c[3] for c in candidates) - used_tokens
+    return [selected[position] for position in sorted(selected)], saved_tokens
@@ -87,6 +87,35 @@ async def get_compiled_route(compiled_route_id: str) -> CompiledRoute:
     )
 
 
+async def get_compiled_route_functions(
+    compiled_route_id: str, root_function_id: str
+) -> dict[str, Function]:
+    """
+    Loads all the functions of a compiled route, including the root function,
+    in a single query. The tree can be rebuilt from `parentFunctionId`.
+
+    Args:
+        compiled_route_id (str): The ID of the compiled route.
+        root_function_id (str): The ID of the root function of the route.
+
+    Returns:
+        dict[str, Function]: The functions of the route by ID.
+    """
+    functions = await Function.prisma().find_many(
+        where={
+            "OR": [
+                {"compiledRouteId": compiled_route_id},
+                {"id": root_function_id},
+            ]
+        },
+        include={**INCLUDE_FUNC["include"], "Packages": True},  # type: ignore
+        order={"createdAt": "asc"},
+    )
+    if root_function_id not in [f.id for f in functions]:
+        raise ValueError(f"Root function {root_function_id} not found")
+    return {f.id: f for f in functions}
+
+
 async def get_ids_from_function_id_and_compiled_route(
     function_id: str, compiled_route_id: str
 ) -> Identifiers:
@@ -1,6 +1,8 @@
 import logging
+import re
 from typing import List
 
+from openai.types import CompletionUsage
 from prisma.enums import DevelopmentPhase, FunctionState
 from prisma.errors import PrismaError
 from prisma.models import Function
@@ -18,12 +20,19 @@ from codex.common.ai_block import (
     ValidationError,
 )
 from codex.common.constants import TODO_COMMENT
-from codex.common.database import INCLUDE_FUNC
+from codex.common.database import INCLUDE_FUNC_SIGNATURE
 from codex.common.logging import log_event
-from codex.common.model import create_object_type
+from codex.common.model import create_object_types
 from codex.develop.code_validation import CodeValidator
 from codex.develop.function import construct_function
 from codex.develop.model import GeneratedFunctionResponse, Package
+from codex.develop.nicegui_docs import get_nicegui_docs
+from codex.develop.retry import (
+    COMPACT_RETRY,
+    get_code_block,
+    get_compact_retry,
+    patch_generation,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -75,12 +84,54 @@ class DevelopAIBlock(AIBlock):
     model = "gpt-4o"
     language = "python"
 
+    def load_retry_prompt(self, invoke_params: dict, error: ValidationError) -> str:
+        invoke_params.pop("retry_code", None)
+        generation = invoke_params["generation"]
+        code = get_code_block(generation) if COMPACT_RETRY else None
+        compact_retry = get_compact_retry(code, error) if code else None
+        if not compact_retry:
+            return super().load_retry_prompt(invoke_params, error)
+
+        # The reply patches the code of the previous generation
+        invoke_params["retry_regions"], invoke_params["retry_errors"] = compact_retry
+        invoke_params["retry_code"] = code
+        invoke_params["retry_generation"] = generation
+        prompt = self.load_template("retry.compact", invoke_params)
+        logger.info(
+            f"Compact retry of {invoke_params['function_name']}: "
+            f"{len(prompt)} characters"
+        )
+        if logger.isEnabledFor(logging.DEBUG):
+            # Rendering the full retry prompt is what the compact retry avoids
+            logger.debug(
+                f"Full retry of {invoke_params['function_name']}: "
+                f"{len(super().load_retry_prompt(invoke_params, error))} characters"
+            )
+        return prompt
+
+    def apply_retry_patch(self, invoke_params: dict, response: ValidatedResponse):
+        """
+        Apply the patch replied to a compact retry to the previous generation.
+        """
+        code = invoke_params.pop("retry_code", None)
+        if code is None:
+            return
+        generation = invoke_params["retry_generation"]
+        try:
+            response.response = patch_generation(generation, code, response.response)
+        except ValidationError:
+            # The next retry shows the whole previous generation
+            response.message = generation
+            raise
+        response.message = response.response
+
     async def validate(
         self,
         invoke_params: dict,
         response: ValidatedResponse,
         validation_errors: ListValidationError | None = None,
     ) -> ValidatedResponse:
+        self.apply_retry_patch(invoke_params, response)
         func_name = invoke_params.get("function_name", "")
         validation_errors = validation_errors or ListValidationError(
             f"Error developing `{func_name}`"
@@ -163,10 +214,10 @@ class DevelopAIBlock(AIBlock):
         """
         generated_response: GeneratedFunctionResponse = validated_response.response
 
-        for obj in generated_response.objects:
-            generated_response.available_objects = await create_object_type(
-                obj, generated_response.available_objects
-            )
+        # All the new objects are created at once, and added to the route context
+        generated_response.available_objects = await create_object_types(
+            generated_response.objects, generated_response.available_objects
+        )
 
         function_defs: list[FunctionCreateInput] = []
         if generated_response.functions:
@@ -218,13 +269,15 @@ class DevelopAIBlock(AIBlock):
                 data=f"{generated_response.db_schema}\n#-----#\n{compiled_code}",
             )
 
+        # Only include what the development of the child functions needs
         func: Function | None = await Function.prisma().update(
             where={"id": generated_response.function_id},
             data=update_obj,
             include={
-                **INCLUDE_FUNC["include"],
-                "ParentFunction": INCLUDE_FUNC,
-                "ChildFunctions": INCLUDE_FUNC,  # type: ignore
+                **INCLUDE_FUNC_SIGNATURE["include"],
+                "ChildFunctions": INCLUDE_FUNC_SIGNATURE,  # type: ignore
+                # The packages are needed to share the function with other routes
+                "Packages": True,
             },
         )
         if not func:
@@ -239,6 +292,60 @@ class DevelopAIBlock(AIBlock):
 
         return func
 
+    async def reuse_function(
+        self, ids: Identifiers, invoke_params: dict, function: Function
+    ) -> Function | None:
+        """
+        Implement the requested function with the code of an existing function,
+        skipping the LLM call. The code goes through the same validation as
+        a generated response, against the current route.
+
+        Args:
+            ids (Identifiers): The identifiers of the function to implement.
+            invoke_params (dict): The invoke parameters of the function.
+            function (Function): The existing function to reuse.
+
+        Returns:
+            Function | None: The implemented function,
+                             None if the existing code is not valid for this route.
+        """
+        func_name = invoke_params["function_name"]
+        code = "\n".join(function.importStatements)
+        code += "\n\n" + re.sub(
+            rf"(?<!\.)\b{re.escape(function.functionName)}\b",
+            func_name,
+            function.functionCode or "",
+        )
+        requirements = "\n".join(
+            f"{p.packageName}{p.specifier}{p.version}" for p in function.Packages or []
+        )
+        text = f"```requirements\n{requirements}\n```\n\n```python\n{code}\n```"
+
+        try:
+            validated_response = await self.validate(
+                invoke_params,
+                ValidatedResponse(
+                    response=text,
+                    usage_statistics=CompletionUsage(
+                        completion_tokens=0, prompt_tokens=0, total_tokens=0
+                    ),
+                    message=text,
+                ),
+            )
+        except ValidationError as e:
+            logger.warning(
+                f"Function {function.id} can't be reused for `{func_name}`: {e}",
+                extra=ids.model_dump(),
+            )
+            return None
+
+        logger.info(
+            f"♻️ Reused function {function.functionName} - {function.id} "
+            f"for `{func_name}`",
+            extra=ids.model_dump(),
+        )
+        return await self.create_item(ids, validated_response)
+
     async def on_failed(self, ids: Identifiers, invoke_params: dict):
         function_name = invoke_params.get("function_name", "Unknown")
         function_signature = invoke_params.get("function_signature", "Unknown")
@@ -247,8 +354,9 @@ class DevelopAIBlock(AIBlock):
                 f"AI Failed to write the function {function_name}. Signature of failed function:\n{function_signature}",
                 extra=ids.model_dump(),
             )
+            # The ids may be shared with the functions developed concurrently
             await Function.prisma().update(
-                where={"id": ids.function_id},
+                where={"id": invoke_params["function_id"]},
                 data={"state": FunctionState.FAILED},
             )
         except PrismaError as pe:
@@ -270,12 +378,22 @@ class DevelopAIBlock(AIBlock):
 class NiceGUIDevelopAIBlock(DevelopAIBlock):
     language = "nicegui"
 
+    async def invoke(self, ids: Identifiers, invoke_params: dict, max_retries=5):
+        # Only the documentation & examples relevant to the page are in the prompt
+        query = " ".join(
+            str(invoke_params.get(key) or "")
+            for key in ["route_path", "function_name", "function_signature"]
+        )
+        invoke_params.update(get_nicegui_docs(self.templates_dir, query))
+        return await super().invoke(ids, invoke_params, max_retries)
+
     async def validate(
         self,
         invoke_params: dict,
         response: ValidatedResponse,
         validation_errors: ListValidationError | None = None,
     ) -> ValidatedResponse:
+        self.apply_retry_patch(invoke_params, response)
         function_name = invoke_params.get("function_name")
         route_path = invoke_params.get("route_path")
 
@@ -0,0 +1,453 @@
+"""
+Embeddings of the compiled routes, used to find the routes of previous
+applications that are similar to a new API route spec.
+
+The embedding of a compiled route is computed in the background once the route
+is compiled, and stored in the `CompiledRoute.embedding` pgvector column. When
+the database doesn't have the pgvector extension, the embeddings are kept in an
+in-process numpy index instead, saved to a file so only the routes compiled since
+the last start are embedded again.
+
+The code of the most similar routes can be provided to the prompt developing the
+root function of a route, as examples (`SIMILAR_ROUTE_EXAMPLES`).
+"""
+
+import asyncio
+import hashlib
+import logging
+import os
+import re
+from abc import ABC, abstractmethod
+from pathlib import Path
+
+import numpy as np
+import prisma
+from prisma.errors import PrismaError
+from prisma.models import APIRouteSpec, CompiledRoute, ObjectType
+
+from codex.common.ai_model import OpenAIChatClient
+from codex.common.constants import TODO_COMMENT
+from codex.common.database import INCLUDE_API_ROUTE, INCLUDE_FUNC
+
+logger = logging.getLogger(__name__)
+
+EMBEDDER = os.environ.get("EMBEDDER", "openai")
+EMBEDDING_MODEL = os.environ.get("EMBEDDING_MODEL", "text-embedding-3-small")
+EMBEDDING_DIMENSIONS = 1536
+ROUTE_SEARCH_TOP_K = int(os.environ.get("ROUTE_SEARCH_TOP_K", 5))
+# Number of compiled routes loaded in the in-process index when it's created
+NUMPY_INDEX_MAX_ROUTES = int(os.environ.get("NUMPY_INDEX_MAX_ROUTES", 5000))
+NUMPY_INDEX_PATH = os.environ.get("NUMPY_INDEX_PATH", ".embeddings/routes.npz")
+# Number of similar routes provided as examples to the route development, 0 to disable
+SIMILAR_ROUTE_EXAMPLES = int(os.environ.get("SIMILAR_ROUTE_EXAMPLES", 0))
+SIMILAR_ROUTE_MIN_SIMILARITY = float(
+    os.environ.get("SIMILAR_ROUTE_MIN_SIMILARITY", 0.8)
+)
+
+WORD_PATTERN = re.compile(r"[a-z]+|\d+")
+
+
+def normalize(embeddings: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(embeddings, axis=-1, keepdims=True)
+    return embeddings / np.where(norms == 0, 1, norms)
+
+
+class Embedder(ABC):
+    """
+    Turns texts into unit vectors of `EMBEDDING_DIMENSIONS` dimensions,
+    so the cosine similarity is their dot product.
+    """
+
+    dimensions: int = EMBEDDING_DIMENSIONS
+
+    @property
+    def name(self) -> str:
+        """
+        Identifies the embedder, the embeddings of different embedders
+        aren't comparable.
+        """
+        return f"{type(self).__name__}/{self.dimensions}"
+
+    @abstractmethod
+    async def embed(self, texts: list[str]) -> np.ndarray:
+        pass
+
+
+class OpenAIEmbedder(Embedder):
+    def __init__(self, model: str = EMBEDDING_MODEL):
+        self.model = model
+
+    @property
+    def name(self) -> str:
+        return f"{self.model}/{self.dimensions}"
+
+    async def embed(self, texts: list[str]) -> np.ndarray:
+        client = OpenAIChatClient.get_instance()
+        response = await client.openai.embeddings.create(
+            model=self.model, input=texts, dimensions=self.dimensions
+        )
+        data = sorted(response.data, key=lambda d: d.index)
+        return normalize(np.array([d.embedding for d in data], dtype=np.float32))
+
+
+class HashingEmbedder(Embedder):
+    """
+    Local and deterministic embedder hashing the words and word pairs of the
+    text into the vector dimensions. It needs no provider, so it's used in tests
+    and as a stand-in when no embedding model is available.
+    """
+
+    async def embed(self, texts: list[str]) -> np.ndarray:
+        embeddings = np.zeros((len(texts), self.dimensions), dtype=np.float32)
+        for row, text in enumerate(texts):
+            words = WORD_PATTERN.findall(split_identifiers(text).lower())
+            for feature in words + [f"{a} {b}" for a, b in zip(words, words[1:])]:
+                digest = hashlib.md5(feature.encode()).digest()
+                index = int.from_bytes(digest[:4], "little") % self.dimensions
+                embeddings[row, index] += 1 if digest[4] & 1 else -1
+        return normalize(embeddings)
+
+
+def split_identifiers(text: str) -> str:
+    """
+    Split camelCase and snake_case identifiers into words.
+    """
+    return re.sub(r"([a-z])([A-Z])", r"\1 \2", text).replace("_", " ")
+
+
+class VectorIndex(ABC):
+    @abstractmethod
+    async def add(self, compiled_route_id: str, embedding: np.ndarray) -> None:
+        pass
+
+    @abstractmethod
+    async def search(self, embedding: np.ndarray, k: int) -> list[tuple[str, float]]:
+        """
+        Returns:
+            list[tuple[str, float]]: The ids of the k most similar compiled routes
+                                     and their similarity, most similar first.
+        """
+        pass
+
+
+def to_vector(embedding: np.ndarray) -> str:
+    return "[" + ",".join(f"{x:.6g}" for x in embedding) + "]"
+
+
+class PgVectorIndex(VectorIndex):
+    async def add(self, compiled_route_id: str, embedding: np.ndarray) -> None:
+        await prisma.get_client().execute_raw(
+            'UPDATE "CompiledRoute" SET embedding = $1::vector WHERE id = $2',
+            to_vector(embedding),
+            compiled_route_id,
+        )
+
+    async def search(self, embedding: np.ndarray, k: int) -> list[tuple[str, float]]:
+        rows = await prisma.get_client().query_raw(
+            """
+            SELECT id, 1 - (embedding <=> $1::vector) AS similarity
+            FROM "CompiledRoute"
+            WHERE embedding IS NOT NULL
+            ORDER BY embedding <=> $1::vector
+            LIMIT $2
+            """,
+            to_vector(embedding),
+            k,
+        )
+        return [(row["id"], float(row["similarity"])) for row in rows]
+
+
+class NumpyVectorIndex(VectorIndex):
+    """
+    In-process index doing an exact search over all the embeddings.
+    """
+
+    def __init__(
+        self,
+        dimensions: int = EMBEDDING_DIMENSIONS,
+        path: str | Path | None = NUMPY_INDEX_PATH,
+    ):
+        self.path = Path(path) if path else None
+        self.ids: list[str] = []
+        self._positions: dict[str, int] = {}
+        self._rows: list[np.ndarray] = []
+        self._matrix: np.ndarray | None = np.zeros((0, dimensions), dtype=np.float32)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    async def add(self, compiled_route_id: str, embedding: np.ndarray) -> None:
+        if compiled_route_id in self._positions:
+            self._rows[self._positions[compiled_route_id]] = embedding
+        else:
+            self._positions[compiled_route_id] = len(self.ids)
+            self.ids.append(compiled_route_id)
+            self._rows.append(embedding)
+        # The matrix is rebuilt on the next search
+        self._matrix = None
+
+    async def search(self, embedding: np.ndarray, k: int) -> list[tuple[str, float]]:
+        if not self.ids or k < 1:
+            return []
+        if self._matrix is None:
+            self._matrix = np.vstack(self._rows)
+
+        scores = self._matrix @ embedding
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(self.ids[i], float(scores[i])) for i in top]
+
+    async def load(self, embedder: Embedder, batch_size: int = 100) -> None:
+        """
+        Index the most recent compiled routes of the database.
+        """
+        routes = await CompiledRoute.prisma().find_many(
+            where={"compiledCode": {"not": ""}, "apiRouteSpecId": {"not": None}},  # type: ignore
+            include={"ApiRouteSpec": INCLUDE_API_ROUTE},  # type: ignore
+            order={"createdAt": "desc"},
+            take=NUMPY_INDEX_MAX_ROUTES,
+        )
+        await self.add_routes(routes, embedder, batch_size)
+        logger.info(f"Loaded {len(self)} compiled routes in the numpy index")
+
+    async def add_routes(
+        self, routes: list[CompiledRoute], embedder: Embedder, batch_size: int = 100
+    ) -> None:
+        """
+        Index the compiled routes, only embedding the ones missing from the
+        saved index, and save the index of the routes.
+
+        Args:
+            routes (list[CompiledRoute]): The routes, including their API route spec.
+            embedder (Embedder): The embedder of the routes.
+            batch_size (int): The number of routes embedded per call.
+        """
+        routes = [route for route in routes if route.ApiRouteSpec]
+        saved = self.read(embedder)
+        new_routes = [route for route in routes if route.id not in saved]
+        for route in routes:
+            if route.id in saved:
+                await self.add(route.id, saved[route.id])
+
+        for i in range(0, len(new_routes), batch_size):
+            batch = new_routes[i : i + batch_size]
+            embeddings = await embedder.embed(
+                [get_route_text(r.ApiRouteSpec) for r in batch]  # type: ignore
+            )
+            for route, embedding in zip(batch, embeddings):
+                await self.add(route.id, embedding)
+        logger.info(f"Embedded {len(new_routes)} compiled routes")
+        self.save(embedder)
+
+    def read(self, embedder: Embedder) -> dict[str, np.ndarray]:
+        """
+        The saved embeddings by compiled route id, if saved by the same embedder.
+        """
+        if not self.path or not self.path.exists():
+            return {}
+        try:
+            with np.load(self.path) as saved:
+                if str(saved["embedder"]) != embedder.name:
+                    return {}
+                return dict(zip(saved["ids"].tolist(), saved["embeddings"]))
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Unable to read the numpy index {self.path}: {e}")
+            return {}
+
+    def save(self, embedder: Embedder) -> None:
+        if not self.path or not self.ids:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # Write the index at once, a restart never reads a partial file
+        with open(self.path.with_suffix(".tmp"), "wb") as file:
+            np.savez(
+                file,
+                embedder=np.array(embedder.name),
+                ids=np.array(self.ids),
+                embeddings=np.vstack(self._rows),
+            )
+        self.path.with_suffix(".tmp").replace(self.path)
+
+
+def get_object_text(obj: ObjectType | None) -> str:
+    if not obj:
+        return "None"
+    fields = ", ".join(f"{f.name}: {f.typeName}" for f in obj.Fields or [])
+    return f"{obj.name}({fields}) {obj.description or ''}".strip()
+
+
+def get_route_text(api_route: APIRouteSpec) -> str:
+    """
+    The text embedded for an API route: its signature and its description.
+    """
+    return "\n".join(
+        [
+            f"{api_route.method} {api_route.path} {api_route.functionName}",
+            api_route.description,
+            f"Request: {get_object_text(api_route.RequestObject)}",
+            f"Response: {get_object_text(api_route.ResponseObject)}",
+        ]
+    )
+
+
+_embedder: Embedder | None = None
+_index: VectorIndex | None = None
+_index_lock = asyncio.Lock()
+_background_tasks: set[asyncio.Task] = set()
+
+
+def get_embedder() -> Embedder:
+    global _embedder
+    if _embedder is None:
+        _embedder = HashingEmbedder() if EMBEDDER == "hashing" else OpenAIEmbedder()
+    return _embedder
+
+
+async def get_vector_index() -> VectorIndex:
+    """
+    The pgvector index if the extension is available in the database,
+    an in-process numpy index otherwise.
+    """
+    global _index
+    async with _index_lock:
+        if _index is not None:
+            return _index
+        try:
+            rows = await prisma.get_client().query_raw(
+                "SELECT extname FROM pg_extension WHERE extname = 'vector'"
+            )
+            has_pgvector = bool(rows)
+        except PrismaError as e:
+            logger.warning(f"Unable to check for pgvector: {e}")
+            has_pgvector = False
+
+        # Local embeddings are not stored, they would mix with the provider ones
+        if has_pgvector and not isinstance(get_embedder(), HashingEmbedder):
+            _index = PgVectorIndex()
+        else:
+            logger.warning("Using an in-process numpy index for route embeddings")
+            index = NumpyVectorIndex(get_embedder().dimensions)
+            await index.load(get_embedder())
+            _index = index
+        return _index
+
+
+async def embed_compiled_route(compiled_route_id: str) -> None:
+    """
+    Compute and store the embedding of a compiled route.
+    """
+    compiled_route = await CompiledRoute.prisma().find_unique_or_raise(
+        where={"id": compiled_route_id},
+        include={"ApiRouteSpec": INCLUDE_API_ROUTE},  # type: ignore
+    )
+    if not compiled_route.ApiRouteSpec:
+        logger.debug(f"Compiled route {compiled_route_id} has no API route spec")
+        return
+
+    embeddings = await get_embedder().embed(
+        [get_route_text(compiled_route.ApiRouteSpec)]
+    )
+    index = await get_vector_index()
+    await index.add(compiled_route_id, embeddings[0])
+    logger.debug(f"Embedded compiled route {compiled_route_id}")
+
+
+def schedule_route_embedding(compiled_route_id: str) -> asyncio.Task:
+    """
+    Embed the compiled route in the background, failures are only logged
+    as the embedding is not required to complete the route.
+    """
+
+    async def run():
+        try:
+            await embed_compiled_route(compiled_route_id)
+        except Exception as e:
+            logger.warning(f"Failed to embed compiled route {compiled_route_id}: {e}")
+
+    task = asyncio.create_task(run())
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return task
+
+
+async def find_similar_routes(
+    api_route: APIRouteSpec,
+    k: int = ROUTE_SEARCH_TOP_K,
+    min_similarity: float = 0.0,
+    exclude_completed_app_id: str | None = None,
+) -> list[tuple[CompiledRoute, float]]:
+    """
+    Find the compiled routes of previous applications most similar to a route.
+
+    Args:
+        api_route (APIRouteSpec): The route, including its request and response
+                                  objects with their fields.
+        k (int): The maximum number of routes to return.
+        min_similarity (float): The minimum cosine similarity of the routes.
+        exclude_completed_app_id (str | None): An application whose routes are
+                                               excluded, e.g. the one in progress.
+
+    Returns:
+        list[tuple[CompiledRoute, float]]: The routes, with their root function,
+                                           and their similarity, most similar first.
+    """
+    embeddings = await get_embedder().embed([get_route_text(api_route)])
+    index = await get_vector_index()
+    # Over-fetch, some of the routes may be filtered out
+    matches = [
+        (route_id, similarity)
+        for route_id, similarity in await index.search(embeddings[0], k * 2)
+        if similarity >= min_similarity
+    ]
+    if not matches:
+        return []
+
+    routes = await CompiledRoute.prisma().find_many(
+        where={"id": {"in": [route_id for route_id, _ in matches]}},
+        include={"RootFunction": INCLUDE_FUNC},  # type: ignore
+    )
+    routes_by_id = {
+        route.id: route
+        for route in routes
+        if route.completedAppId != exclude_completed_app_id
+        and route.apiRouteSpecId != api_route.id
+    }
+    return [
+        (routes_by_id[route_id], similarity)
+        for route_id, similarity in matches
+        if route_id in routes_by_id
+    ][:k]
+
+
+async def get_similar_route_examples(compiled_route: CompiledRoute) -> list[str]:
+    """
+    The code of the routes of previous applications most similar to a route,
+    provided as examples to the development of its root function.
+    Failures are only logged, the examples are not required.
+
+    Args:
+        compiled_route (CompiledRoute): The route, including its API route spec.
+
+    Returns:
+        list[str]: The code of the root functions of the similar routes.
+    """
+    if not SIMILAR_ROUTE_EXAMPLES or not compiled_route.ApiRouteSpec:
+        return []
+    try:
+        similar_routes = await find_similar_routes(
+            compiled_route.ApiRouteSpec,
+            k=SIMILAR_ROUTE_EXAMPLES,
+            min_similarity=SIMILAR_ROUTE_MIN_SIMILARITY,
+            exclude_completed_app_id=compiled_route.completedAppId,
+        )
+    except Exception as e:
+        logger.warning(f"Failed to find routes similar to {compiled_route.id}: {e}")
+        return []
+    return [
+        route.RootFunction.functionCode
+        for route, _ in similar_routes
+        if route.RootFunction
+        and route.RootFunction.functionCode
+        and TODO_COMMENT not in route.RootFunction.functionCode
+    ]
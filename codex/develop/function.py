@@ -14,6 +14,7 @@ from codex.common.model import (
     get_related_types,
     normalize_type,
 )
+from codex.develop.reuse import get_signature_hash
 
 logger = logging.getLogger(__name__)
 
@@ -33,6 +34,7 @@ async def construct_function(
         else FunctionState.DEFINITION,
         rawCode=function.function_code,
         functionCode=function.function_code,
+        signatureHash=get_signature_hash(function.arg_types, function.return_type),
     )
 
     if function.return_type:
@@ -1,10 +1,29 @@
 import ast
+import copy
 import re
 
 from codex.api_model import ObjectFieldModel, ObjectTypeModel
 from codex.common.model import PYTHON_TYPES, FunctionDef
 from codex.develop.function import normalize_type
 
+DOC_SECTION_PATTERNS = [
+    [re.compile(f"{keyword}\\s?:") for keyword in keywords]
+    for keywords in [
+        ["Ex", "Usage", "Usages", "Example", "Examples"],
+        ["Error", "Errors", "Raise", "Raises"],
+        ["Return", "Returns"],
+        ["Arg", "Args", "Argument", "Arguments"],
+    ]
+]
+DOC_SPLIT_PATTERN = re.compile(r"\n(\s+.+):")
+
+
+def split_doc(patterns: list[re.Pattern], doc: str) -> tuple[str, str]:
+    for pattern in patterns:
+        if match := pattern.search(doc):
+            return doc[: match.start()], doc[match.end() :]
+    return doc, ""
+
 
 class FunctionVisitor(ast.NodeVisitor):
     """
@@ -14,15 +33,25 @@ class FunctionVisitor(ast.NodeVisitor):
     The extracted function definitions and Pydantic class definitions
     can be accessed from the functions and objects attributes respectively.
 
+    When the source code of the AST is given, the code of the definitions is
+    sliced from it using the line & column offsets of the nodes, instead of
+    being unparsed from the AST.
+
     Example:
     ```
-    visitor = FunctionVisitor()
-    visitor.visit(ast.parse("def foo(x: int) -> int: return x"))
+    code = "def foo(x: int) -> int: return x"
+    visitor = FunctionVisitor(code)
+    visitor.visit(ast.parse(code))
     print(visitor.functions)
     ```
     """
 
-    def __init__(self):
+    def __init__(self, source: str | None = None):
+        # The source lines, encoded as the AST column offsets are in UTF-8 bytes
+        self.lines: list[bytes] | None = None
+        if source is not None:
+            source = source.replace("\r\n", "\n").replace("\r", "\n")
+            self.lines = source.encode().split(b"\n")
         self.functions: list[FunctionDef] = []
         self.functionsIdx: list[int] = []
         self.objects: list[ObjectTypeModel] = []
@@ -32,6 +61,59 @@ class FunctionVisitor(ast.NodeVisitor):
         self.imports: list[str] = []
         self.errors: list[str] = []
 
+    def get_source_lines(
+        self, node: ast.stmt, end_lineno: int, end_col_offset: int
+    ) -> list[str] | None:
+        """
+        The source lines of a top-level statement, from its first line (or its first
+        decorator) up to the given end. None when the source is not available or the
+        statement is indented, as dedenting it could change its multi-line strings.
+        """
+        if not self.lines or node.col_offset != 0:
+            return None
+        decorators = getattr(node, "decorator_list", [])
+        start = min([node.lineno] + [d.lineno for d in decorators])
+
+        lines = self.lines[start - 1 : end_lineno]
+        lines[-1] = lines[-1][:end_col_offset]
+        return [line.decode() for line in lines]
+
+    def get_source(self, node: ast.stmt) -> str:
+        """
+        The source code of a statement, or its unparsed code if the source is not
+        available. Expressions, like the annotations, are always unparsed so types
+        are written in their canonical form.
+        """
+        lines = self.get_source_lines(
+            node, node.end_lineno or node.lineno, node.end_col_offset or 0
+        )
+        return "\n".join(lines) if lines is not None else ast.unparse(node)
+
+    def get_function_template(
+        self, node: ast.FunctionDef, has_doc_string: bool
+    ) -> str | None:
+        """
+        The function signature, with its docstring if any, and a `pass` body.
+        None when the source is not available.
+        """
+        first = node.body[0]
+        if has_doc_string:
+            # The docstring, along with the signature
+            lines = self.get_source_lines(
+                node, first.end_lineno or first.lineno, first.end_col_offset or 0
+            )
+        else:
+            lines = self.get_source_lines(node, first.lineno, first.col_offset)
+            # Drop the comments between the signature and the body
+            while lines and (not lines[-1].strip() or lines[-1].lstrip()[0] == "#"):
+                lines.pop()
+        if not lines or first.lineno == node.lineno:
+            return None
+
+        body_line = self.lines[first.lineno - 1]  # type: ignore
+        body_indent = body_line[: len(body_line) - len(body_line.lstrip())].decode()
+        return "\n".join(lines).rstrip() + f"\n{body_indent}pass"
+
     def visit_Import(self, node):
         for alias in node.names:
             import_line = f"import {alias.name}"
@@ -62,12 +144,13 @@ class FunctionVisitor(ast.NodeVisitor):
         )
 
         # Extract doc_string & function body
-        if (
-            node.body
+        has_doc_string = (
+            bool(node.body)
             and isinstance(node.body[0], ast.Expr)
             and isinstance(node.body[0].value, ast.Constant)
-        ):
-            doc_string = node.body[0].value.s.strip()
+        )
+        if has_doc_string:
+            doc_string = node.body[0].value.s.strip()  # type: ignore
             template_body = [node.body[0], ast.Pass()]
             is_implemented = not isinstance(node.body[1], ast.Pass)
         else:
@@ -75,41 +158,32 @@ class FunctionVisitor(ast.NodeVisitor):
             template_body = [ast.Pass()]
             is_implemented = not isinstance(node.body[0], ast.Pass)
 
-        # Construct function template
-        original_body = node.body.copy()
-        node.body = template_body  # type: ignore
-        function_template = ast.unparse(node)
-        node.body = original_body
+        # Construct function template, without modifying the node
+        function_template = self.get_function_template(node, has_doc_string)
+        if function_template is None:
+            template_node = copy.copy(node)
+            template_node.body = template_body  # type: ignore
+            function_template = ast.unparse(template_node)
 
-        function_code = ast.unparse(node)
+        function_code = self.get_source(node)
         if "await" in function_code and "async def" not in function_code:
             function_code = function_code.replace("def ", "async def ")
             function_template = function_template.replace("def ", "async def ")
 
-        def split_doc(keywords: list[str], doc: str) -> tuple[str, str]:
-            for keyword in keywords:
-                if match := re.search(f"{keyword}\\s?:", doc):
-                    return doc[: match.start()], doc[match.end() :]
-            return doc, ""
-
         # Decompose doc_pattern into func_doc, args_doc, rets_doc, errs_doc, usage_doc by splitting in reverse order
         func_doc = doc_string
-        func_doc, usage_doc = split_doc(
-            ["Ex", "Usage", "Usages", "Example", "Examples"], func_doc
-        )
-        func_doc, errs_doc = split_doc(["Error", "Errors", "Raise", "Raises"], func_doc)
-        func_doc, rets_doc = split_doc(["Return", "Returns"], func_doc)
-        func_doc, args_doc = split_doc(
-            ["Arg", "Args", "Argument", "Arguments"], func_doc
-        )
+        usages, errors, returns, arguments = DOC_SECTION_PATTERNS
+        func_doc, usage_doc = split_doc(usages, func_doc)
+        func_doc, errs_doc = split_doc(errors, func_doc)
+        func_doc, rets_doc = split_doc(returns, func_doc)
+        func_doc, args_doc = split_doc(arguments, func_doc)
 
         # Extract Func
         function_desc = func_doc.strip()
 
         # Extract Args
         args_descs = {}
-        split_pattern = r"\n(\s+.+):"
-        for match in reversed(list(re.finditer(split_pattern, string=args_doc))):
+        for match in reversed(list(DOC_SPLIT_PATTERN.finditer(args_doc))):
             arg = match.group(1).strip().split(" ")[0]
             desc = args_doc.rsplit(match.group(1), 1)[1].strip(": ")
             args_descs[arg] = desc.strip()
@@ -117,7 +191,7 @@ class FunctionVisitor(ast.NodeVisitor):
 
         # Extract Returns
         return_desc = ""
-        if match := re.match(split_pattern, string=rets_doc):
+        if match := DOC_SPLIT_PATTERN.match(rets_doc):
             return_desc = rets_doc[match.end() :].strip()
 
         self.functions.append(
@@ -185,16 +259,17 @@ class FunctionVisitor(ast.NodeVisitor):
                     self.errors.append(
                         f"Class {node.name} has multiple assignments in a single line."
                     )
+                value = ast.unparse(v.value)
                 field = ObjectFieldModel(
                     name=ast.unparse(v.targets[0]),
-                    type=type(ast.unparse(v.value)).__name__,
-                    value=ast.unparse(v.value) if v.value else None,
+                    type=type(value).__name__,
+                    value=value if v.value else None,
                 )
             elif isinstance(v, ast.Expr) and isinstance(v.value, ast.Constant):
                 # skip comments and docstrings
                 continue
             else:
-                methods.append(ast.unparse(v))
+                methods.append(self.get_source(v))
                 continue
             fields.append(field)
 
@@ -224,6 +299,6 @@ class FunctionVisitor(ast.NodeVisitor):
             or isinstance(node, ast.AnnAssign)
             or isinstance(node, ast.AugAssign)
         ) and node.col_offset == 0:
-            self.globals.append(ast.unparse(node))
+            self.globals.append(self.get_source(node))
             self.globalsIdx.append(node.lineno)
         super().visit(node)
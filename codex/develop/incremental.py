@@ -0,0 +1,270 @@
+"""
+Incremental development of an application: the routes whose spec didn't change
+since the previous deliverable of the application are copied from it instead of
+being developed again.
+
+Each compiled route stores the hash of the API route spec it was developed from:
+the route signature, its description, the request/response object graph and,
+for the user interface, the templates of the backend functions it calls.
+A route of the previous deliverable is copied when its hash matches and the
+database models & enums used by its code are defined the same way in both
+specifications.
+"""
+
+import hashlib
+import json
+import logging
+from collections import defaultdict
+
+from prisma.models import (
+    APIRouteSpec,
+    CompiledRoute,
+    CompletedApp,
+    Function,
+    ObjectField,
+    ObjectType,
+)
+from prisma.types import FunctionCreateInput, ObjectFieldCreateInput
+
+from codex.common.database import get_database_schema
+from codex.develop.compile import ObjectTypeLoader
+from codex.develop.database import get_compiled_route_functions
+from codex.develop.reuse import is_schema_compatible
+
+logger = logging.getLogger(__name__)
+
+
+def get_object_type_spec(obj: ObjectType) -> dict:
+    return {
+        "name": obj.name,
+        "description": obj.description,
+        "code": obj.code,
+        "isPydantic": obj.isPydantic,
+        "isEnum": obj.isEnum,
+        "fields": sorted(
+            (f.name, f.typeName, f.description or "", f.value or "")
+            for f in obj.Fields or []
+        ),
+    }
+
+
+def get_route_spec_hash(
+    api_route: APIRouteSpec,
+    object_types: list[ObjectType],
+    lang: str,
+    extra_functions: list[Function] = [],
+) -> str:
+    """
+    Hash of everything a route is developed from.
+
+    Args:
+        api_route (APIRouteSpec): The API route spec.
+        object_types (list[ObjectType]): The request & response objects of the route
+                                         and all the object types they depend on.
+        lang (str): The language the route is developed in.
+        extra_functions (list[Function]): The already implemented functions
+                                          the route can call.
+
+    Returns:
+        str: The spec hash.
+    """
+    spec = {
+        "lang": lang,
+        "method": str(api_route.method),
+        "path": api_route.path,
+        "functionName": api_route.functionName,
+        "description": api_route.description,
+        "accessLevel": str(api_route.AccessLevel),
+        "allowedAccessRoles": sorted(api_route.AllowedAccessRoles or []),
+        "request": api_route.RequestObject.name if api_route.RequestObject else None,
+        "response": api_route.ResponseObject.name if api_route.ResponseObject else None,
+        "objects": sorted(
+            (get_object_type_spec(obj) for obj in object_types),
+            key=lambda obj: json.dumps(obj, sort_keys=True),
+        ),
+    }
+    if lang == "nicegui":
+        # The user interface calls the routes of the backend deliverable
+        spec["extraFunctions"] = sorted(
+            (f.functionName, f.template) for f in extra_functions
+        )
+    return hashlib.md5(json.dumps(spec, sort_keys=True).encode()).hexdigest()
+
+
+async def get_route_spec_hashes(
+    api_routes: list[APIRouteSpec], lang: str, extra_functions: list[Function] = []
+) -> dict[str, str]:
+    """
+    Compute the spec hash of the routes, loading all their object graphs at once.
+
+    Returns:
+        dict[str, str]: The spec hash by API route spec ID.
+    """
+    route_objects = {
+        route.id: [obj for obj in [route.RequestObject, route.ResponseObject] if obj]
+        for route in api_routes
+    }
+    loader = ObjectTypeLoader()
+    await loader.load(obj.id for objs in route_objects.values() for obj in objs)
+
+    hashes = {}
+    for route in api_routes:
+        object_type_ids: set[str] = set()
+        object_types = [
+            dep_type
+            for obj in route_objects[route.id]
+            for dep_type in await loader.get_object_type_deps(obj.id, object_type_ids)
+        ]
+        hashes[route.id] = get_route_spec_hash(
+            route, object_types, lang, extra_functions
+        )
+    return hashes
+
+
+async def get_previous_compiled_routes(
+    completed_app: CompletedApp, database_schema: str, lang: str
+) -> dict[str, CompiledRoute]:
+    """
+    Find the compiled routes of the previous deliverable of the application
+    that can be copied to the new one.
+
+    Args:
+        completed_app (CompletedApp): The new deliverable.
+        database_schema (str): The database schema of the new deliverable.
+        lang (str): The language of the new deliverable.
+
+    Returns:
+        dict[str, CompiledRoute]: The compiled routes by spec hash.
+    """
+    if not completed_app.applicationId:
+        return {}
+
+    previous_app = await CompletedApp.prisma().find_first(
+        where={
+            "id": {"not": completed_app.id},
+            "applicationId": completed_app.applicationId,
+            "deleted": False,
+            # The user interface deliverables have a companion backend deliverable
+            "companionCompletedAppId": None if lang == "python" else {"not": None},  # type: ignore
+            "createdAt": {"lte": completed_app.createdAt},
+        },
+        include={
+            "CompiledRoutes": {
+                "where": {"specHash": {"not": None}},  # type: ignore
+                "include": {"Packages": True},
+            },
+            "Specification": {
+                "include": {"DatabaseSchema": {"include": {"DatabaseTables": True}}}
+            },
+        },
+        order={"createdAt": "desc"},
+    )
+    if not previous_app or not previous_app.CompiledRoutes:
+        return {}
+
+    previous_schema = get_database_schema(previous_app.Specification)  # type: ignore
+    return {
+        route.specHash: route
+        for route in previous_app.CompiledRoutes
+        # Routes that failed to compile are developed again
+        if route.specHash
+        and route.compiledCode
+        and is_schema_compatible(route.compiledCode, database_schema, previous_schema)
+    }
+
+
+def get_field_data(field: ObjectField) -> ObjectFieldCreateInput:
+    data = ObjectFieldCreateInput(name=field.name, typeName=field.typeName)
+    if field.description is not None:
+        data["description"] = field.description
+    if field.value is not None:
+        data["value"] = field.value
+    if field.RelatedTypes:
+        data["RelatedTypes"] = {"connect": [{"id": t.id} for t in field.RelatedTypes]}
+    return data
+
+
+def get_function_data(function: Function) -> FunctionCreateInput:
+    data = FunctionCreateInput(
+        functionName=function.functionName,
+        template=function.template,
+        state=function.state,
+        importStatements=function.importStatements,
+        FunctionArgs={
+            "create": [get_field_data(f) for f in function.FunctionArgs or []]
+        },
+    )
+    for key in ["description", "rawCode", "functionCode", "signatureHash"]:
+        if getattr(function, key) is not None:
+            data[key] = getattr(function, key)
+    if function.FunctionReturn:
+        data["FunctionReturn"] = {"create": get_field_data(function.FunctionReturn)}
+    if function.Packages:
+        data["Packages"] = {"connect": [{"id": p.id} for p in function.Packages]}
+    if function.databaseSchemaId:
+        data["DatabaseSchema"] = {"connect": {"id": function.databaseSchemaId}}
+    return data
+
+
+async def copy_compiled_route(
+    compiled_route: CompiledRoute,
+    api_route: APIRouteSpec,
+    completed_app: CompletedApp,
+) -> CompiledRoute:
+    """
+    Copy a compiled route, with its function tree, to another deliverable.
+
+    Args:
+        compiled_route (CompiledRoute): The compiled route to copy,
+                                        including its packages.
+        api_route (APIRouteSpec): The API route spec of the new deliverable.
+        completed_app (CompletedApp): The new deliverable.
+
+    Returns:
+        CompiledRoute: The copied compiled route.
+    """
+    functions = await get_compiled_route_functions(
+        compiled_route.id, compiled_route.rootFunctionId
+    )
+    copied_route = await CompiledRoute.prisma().create(
+        data={
+            "description": compiled_route.description,
+            "fileName": compiled_route.fileName,
+            "mainFunctionName": compiled_route.mainFunctionName,
+            "compiledCode": compiled_route.compiledCode,
+            "specHash": compiled_route.specHash,
+            "RootFunction": {
+                "create": get_function_data(functions[compiled_route.rootFunctionId])
+            },
+            "Packages": {
+                "connect": [{"id": p.id} for p in compiled_route.Packages or []]
+            },
+            "CompletedApp": {"connect": {"id": completed_app.id}},
+            "ApiRouteSpec": {"connect": {"id": api_route.id}},
+        },
+    )
+
+    # Copy the function tree top-down, so the parents exist before their children
+    child_functions = defaultdict(list)
+    for function in functions.values():
+        if function.parentFunctionId:
+            child_functions[function.parentFunctionId].append(function)
+    copied_ids = {compiled_route.rootFunctionId: copied_route.rootFunctionId}
+    queue = [compiled_route.rootFunctionId]
+    while queue:
+        parent_id = queue.pop(0)
+        for function in child_functions[parent_id]:
+            if function.id in copied_ids:
+                continue
+            data = get_function_data(function)
+            data["ParentFunction"] = {"connect": {"id": copied_ids[parent_id]}}
+            data["CompiledRoute"] = {"connect": {"id": copied_route.id}}
+            copied = await Function.prisma().create(data=data)
+            copied_ids[function.id] = copied.id
+            queue.append(function.id)
+
+    logger.info(
+        f"♻️ Copied unchanged route {api_route.path} from compiled route "
+        f"{compiled_route.id} with {len(copied_ids)} functions"
+    )
+    return copied_route
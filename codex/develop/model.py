@@ -3,7 +3,7 @@ from typing import List
 from prisma.models import Function
 from prisma.models import Function as FunctionDBModel
 from prisma.models import ObjectType
-from pydantic import BaseModel
+from pydantic import BaseModel, SkipValidation
 
 from codex.common.model import FunctionDef
 from codex.common.model import ObjectTypeModel as ObjectDef
@@ -34,7 +34,8 @@ class GeneratedFunctionResponse(BaseModel):
 
     function_name: str
     compiled_route_id: str
-    available_objects: dict[str, ObjectType]
+    # Not copied, the object type registry of the route is updated in place
+    available_objects: SkipValidation[dict[str, ObjectType]]
     available_functions: dict[str, Function]
     template: str
 
@@ -0,0 +1,147 @@
+"""
+Retrieval of the parts of the NiceGUI documentation relevant to a page.
+
+The NiceGUI documentation and examples are too large to be sent in every prompt
+developing a page. They are split by component (documentation) and by example,
+and indexed with BM25 once per prompt directory. Only the chunks matching the
+page signature and docstring are included in the prompt.
+"""
+
+import functools
+import math
+import os
+import re
+from collections import Counter
+from pathlib import Path
+
+from jinja2 import Environment, FileSystemLoader
+
+# Number of documentation & example chunks in the prompt, 0 includes them all
+NICEGUI_DOC_CHUNKS = int(os.environ.get("NICEGUI_DOC_CHUNKS", 15))
+NICEGUI_EXAMPLE_CHUNKS = int(os.environ.get("NICEGUI_EXAMPLE_CHUNKS", 3))
+
+WORD_PATTERN = re.compile(r"[a-z]+|\d+")
+# Words of the page queries that match most of the chunks
+STOP_WORDS = {"a", "an", "and", "the", "of", "to", "in", "for", "is", "on", "with"}
+
+
+def tokenize(text: str) -> list[str]:
+    """
+    Lowercase words of a text, splitting camelCase and snake_case identifiers.
+    """
+    text = re.sub(r"([a-z])([A-Z])", r"\1 \2", text).replace("_", " ")
+    return [w for w in WORD_PATTERN.findall(text.lower()) if w not in STOP_WORDS]
+
+
+def split_sections(text: str, level: int) -> list[str]:
+    """
+    Split a markdown text on its headers of the given level, ignoring the lines
+    of the code blocks. The text before the first header is dropped.
+    """
+    prefix = "#" * level + " "
+    sections: list[list[str]] = []
+    in_code = False
+    for line in text.splitlines():
+        if line.startswith("```"):
+            in_code = not in_code
+        if not in_code and line.startswith(prefix):
+            sections.append([])
+        if sections:
+            sections[-1].append(line)
+    return ["\n".join(lines).strip() for lines in sections]
+
+
+def split_doc_components(text: str) -> list[str]:
+    """
+    Split the documentation by component (`##` sections), each chunk starting
+    with its category (`#` section) title.
+    """
+    chunks = []
+    for category in split_sections(text, 1):
+        title = category.splitlines()[0]
+        chunks.extend(
+            f"{title}\n\n{section}" for section in split_sections(category, 2)
+        )
+    return chunks
+
+
+class BM25Index:
+    """
+    Okapi BM25 lexical index over a fixed list of documents.
+    """
+
+    def __init__(self, documents: list[str], k1: float = 1.5, b: float = 0.75):
+        self.documents = documents
+        self.k1 = k1
+        self.b = b
+        self.term_frequencies = [Counter(tokenize(d)) for d in documents]
+        self.lengths = [sum(tf.values()) for tf in self.term_frequencies]
+        self.average_length = sum(self.lengths) / max(len(documents), 1)
+        document_frequencies = Counter(
+            term for tf in self.term_frequencies for term in tf
+        )
+        self.idf = {
+            term: math.log(1 + (len(documents) - df + 0.5) / (df + 0.5))
+            for term, df in document_frequencies.items()
+        }
+
+    def score(self, query_terms: list[str], index: int) -> float:
+        tf = self.term_frequencies[index]
+        norm = self.k1 * (
+            1 - self.b + self.b * self.lengths[index] / self.average_length
+        )
+        return sum(
+            self.idf[term] * tf[term] * (self.k1 + 1) / (tf[term] + norm)
+            for term in query_terms
+            if term in tf
+        )
+
+    def search(self, query: str, k: int) -> list[int]:
+        """
+        Returns:
+            list[int]: The indexes of the k best matching documents with a
+                       positive score, best first.
+        """
+        query_terms = [t for t in set(tokenize(query)) if t in self.idf]
+        scores = [(self.score(query_terms, i), i) for i in range(len(self.documents))]
+        ranked = sorted((s for s in scores if s[0] > 0), key=lambda s: (-s[0], s[1]))
+        return [i for _, i in ranked[:k]]
+
+
+@functools.cache
+def get_nicegui_indexes(templates_dir: Path) -> tuple[BM25Index, BM25Index]:
+    """
+    The documentation and examples indexes of a prompt directory, built once.
+    """
+    env = Environment(loader=FileSystemLoader(templates_dir))
+    docs = env.get_template("develop/nicegui.doc.j2").render()
+    examples = env.get_template("develop/nicegui.examples.j2").render()
+    return BM25Index(split_doc_components(docs)), BM25Index(split_sections(examples, 1))
+
+
+def select_chunks(index: BM25Index, query: str, k: int) -> str:
+    # Keep the documentation order, related components are next to each other
+    return "\n\n".join(index.documents[i] for i in sorted(index.search(query, k)))
+
+
+def get_nicegui_docs(templates_dir: Path, query: str) -> dict[str, str]:
+    """
+    The documentation and examples relevant to a page, as prompt parameters.
+    The parameters are omitted for the parts that are included in full.
+
+    Args:
+        templates_dir (Path): The prompt directory of the model.
+        query (str): The page signature and docstring.
+
+    Returns:
+        dict[str, str]: The `nicegui_docs` and `nicegui_examples` parameters.
+    """
+    doc_index, example_index = get_nicegui_indexes(templates_dir)
+    params = {}
+    if NICEGUI_DOC_CHUNKS > 0:
+        params["nicegui_docs"] = select_chunks(doc_index, query, NICEGUI_DOC_CHUNKS)
+    if NICEGUI_EXAMPLE_CHUNKS > 0:
+        params["nicegui_examples"] = select_chunks(
+            example_index, query, NICEGUI_EXAMPLE_CHUNKS
+        )
+    return params
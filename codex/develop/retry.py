@@ -0,0 +1,178 @@
+"""
+Compact retries of the function development.
+
+Instead of the whole previous generation and every error, a compact retry prompt
+shows the line-numbered regions of the generated code around the failing lines,
+with the errors deduplicated. The LLM replies with replacements of line ranges,
+which are applied to the previous code before validating it again.
+"""
+
+import os
+import re
+
+from codex.common.ai_block import (
+    LineValidationError,
+    ListValidationError,
+    ValidationError,
+)
+
+COMPACT_RETRY = os.getenv("COMPACT_RETRY", "false").lower() in ("true", "1", "t")
+# Number of lines shown before and after each failing line
+COMPACT_RETRY_CONTEXT_LINES = int(os.environ.get("COMPACT_RETRY_CONTEXT_LINES", 3))
+
+REPLACE_BLOCK_PATTERN = re.compile(
+    r"```replace\s+(\d+)\s*-\s*(\d+)[^\n]*\n(.*?)^```", re.M | re.S
+)
+LINE_NUMBER_PATTERN = re.compile(r"^\s*\d+ \| ?")
+
+
+def get_code_block(generation: str, language: str = "python") -> str | None:
+    """
+    The content of the last code block of a generation, as picked by the validation.
+    """
+    blocks = generation.split(f"```{language}")
+    if len(blocks) < 2:
+        return None
+    return blocks[-1].split("```")[0].strip("\n")
+
+
+def get_errors(error: ValidationError) -> list[ValidationError]:
+    if isinstance(error, ListValidationError):
+        return [e for error in error.errors for e in get_errors(error)]
+    return [error]
+
+
+def get_error_message(error: ValidationError) -> str:
+    # The string of a LineValidationError includes its code line
+    return Exception.__str__(error).strip()
+
+
+def locate_error_lines(error: LineValidationError, code_lines: list[str]) -> list[int]:
+    """
+    The line numbers (1-based) of the code matching the failing lines of an error.
+
+    The errors refer to the code as validated, which has the imports and stubs
+    added around the generated code: the failing lines are matched by content,
+    picking the closest line when a line appears several times.
+    """
+    error_lines = error.code.split("\n")
+    located = []
+    for line_number in range(error.line_from, error.line_to):
+        if not 0 < line_number <= len(error_lines):
+            continue
+        text = error_lines[line_number - 1].strip()
+        if not text:
+            continue
+        matches = [i + 1 for i, line in enumerate(code_lines) if line.strip() == text]
+        if matches:
+            located.append(min(matches, key=lambda i: abs(i - line_number)))
+    return located
+
+
+def get_compact_retry(
+    code: str, error: ValidationError, context_lines: int = COMPACT_RETRY_CONTEXT_LINES
+) -> tuple[list[str], list[str]] | None:
+    """
+    The line-numbered regions of the code around the failing lines, and the
+    deduplicated error messages with the lines they occur on.
+
+    Args:
+        code (str): The code of the previous generation.
+        error (ValidationError): The validation error of the previous generation.
+        context_lines (int): The number of lines shown around each failing line.
+
+    Returns:
+        tuple[list[str], list[str]] | None: The regions and the errors, None when
+                                            no error could be located in the code.
+    """
+    code_lines = code.split("\n")
+    error_lines: dict[str, list[int]] = {}
+    for e in get_errors(error):
+        lines = error_lines.setdefault(get_error_message(e), [])
+        if isinstance(e, LineValidationError):
+            lines.extend(
+                line for line in locate_error_lines(e, code_lines) if line not in lines
+            )
+
+    failing_lines = sorted({line for lines in error_lines.values() for line in lines})
+    if not failing_lines:
+        return None
+
+    # Merge the overlapping and adjacent regions
+    ranges: list[list[int]] = []
+    for line in failing_lines:
+        start = max(line - context_lines, 1)
+        end = min(line + context_lines, len(code_lines))
+        if ranges and start <= ranges[-1][1] + 1:
+            ranges[-1][1] = max(ranges[-1][1], end)
+        else:
+            ranges.append([start, end])
+
+    width = len(str(len(code_lines)))
+    regions = [
+        "\n".join(f"{i:>{width}} | {code_lines[i - 1]}" for i in range(start, end + 1))
+        for start, end in ranges
+    ]
+    errors = [
+        f"line {', '.join(map(str, sorted(lines)))}: {message}" if lines else message
+        for message, lines in error_lines.items()
+    ]
+    return regions, errors
+
+
+def apply_patch(code: str, reply: str) -> str | None:
+    """
+    Apply the line range replacements of a reply to the code.
+
+    Returns:
+        str | None: The patched code, None if the reply has no replacement.
+
+    Raises:
+        ValidationError: If the replaced line ranges are invalid or overlapping.
+    """
+    code_lines = code.split("\n")
+    replacements = []
+    for match in REPLACE_BLOCK_PATTERN.finditer(reply):
+        start, end = int(match.group(1)), int(match.group(2))
+        if not 1 <= start <= end <= len(code_lines):
+            raise ValidationError(
+                f"Invalid replaced line range {start}-{end}, "
+                f"the code has {len(code_lines)} lines"
+            )
+        lines = match.group(3).rstrip("\n").split("\n")
+        # The replacement was copied with the line numbers of the regions
+        if all(LINE_NUMBER_PATTERN.match(line) for line in lines if line.strip()):
+            lines = [LINE_NUMBER_PATTERN.sub("", line, count=1) for line in lines]
+        replacements.append((start, end, lines))
+
+    if not replacements:
+        return None
+
+    replacements.sort()
+    for (_, end, _), (start, _, _) in zip(replacements, replacements[1:]):
+        if start <= end:
+            raise ValidationError(f"Overlapping replaced line ranges at line {start}")
+
+    # Apply from the bottom, so the line numbers of the next ranges stay the same
+    for start, end, lines in reversed(replacements):
+        code_lines[start - 1 : end] = lines
+    return "\n".join(code_lines)
+
+
+def patch_generation(generation: str, code: str, reply: str) -> str:
+    """
+    The generation of a compact retry: the previous generation with the code
+    patched by the reply, or the reply itself when it rewrites the whole code.
+    """
+    patched = apply_patch(code, reply)
+    if patched is None:
+        if get_code_block(reply) is None:
+            raise ValidationError(
+                "No ```replace``` or ```python``` block found in the response"
+            )
+        return reply
+
+    requirements = get_code_block(reply, "requirements")
+    if requirements is None:
+        requirements = get_code_block(generation, "requirements") or ""
+    return f"```requirements\n{requirements.strip()}\n```\n\n```python\n{patched}\n```"
@@ -0,0 +1,311 @@
+"""
+Reuse of functions already written for previous applications.
+
+Functions are indexed by the hash of their normalized signature. A function
+being developed can reuse a WRITTEN or VERIFIED function of another application
+when it has the same signature, a similar description, and uses the same
+database models, skipping the LLM call entirely.
+
+Within an application, the helper functions requested by several routes being
+developed concurrently are shared: the first route asking for a function
+develops it, the other routes wait for it and copy its implementation into
+their own function tree, so each compiled route stays self-contained.
+"""
+
+import asyncio
+import hashlib
+import logging
+import os
+import re
+
+from fuzzywuzzy import fuzz
+from prisma.enums import FunctionState
+from prisma.models import Function, ObjectField, ObjectType
+
+from codex.common.constants import TODO_COMMENT
+from codex.common.database import INCLUDE_FUNC
+from codex.common.types import normalize_type
+
+logger = logging.getLogger(__name__)
+
+REUSE_SIMILARITY_THRESHOLD = int(os.environ.get("REUSE_SIMILARITY_THRESHOLD", 85))
+REUSE_MAX_CANDIDATES = 20
+
+PRISMA_ENTITY_PATTERN = re.compile(r"prisma\.(?:models|enums)\.(\w+)")
+PRISMA_IMPORT_PATTERN = re.compile(
+    r"^\s*from\s+prisma\.(?:models|enums)\s+import\s+(\([^)]*\)|[^\n]+)", re.M
+)
+PRISMA_DEFINITION_PATTERN = re.compile(r"^\s*(?:model|enum)\s+(\w+)\s*{", re.M)
+
+
+def get_signature_hash(
+    arg_types: list[tuple[str, str]], return_type: str | None
+) -> str:
+    """
+    Hash of the normalized signature of a function,
+    e.g. `(password: str) -> str` for `def hash_password(password: str) -> str`.
+
+    Args:
+        arg_types (list[tuple[str, str]]): The name and type of the arguments.
+        return_type (str | None): The return type.
+
+    Returns:
+        str: The signature hash.
+    """
+    args = ", ".join(f"{name}: {normalize_type(type)}" for name, type in arg_types)
+    ret = normalize_type(return_type) if return_type else None
+    return hashlib.md5(f"({args}) -> {ret}".encode()).hexdigest()
+
+
+def get_function_signature_hash(function: Function) -> str:
+    return get_signature_hash(
+        [(f.name, f.typeName) for f in function.FunctionArgs or []],
+        function.FunctionReturn.typeName if function.FunctionReturn else None,
+    )
+
+
+def get_database_definitions(database_schema: str) -> dict[str, str]:
+    """
+    Split a prisma schema into the normalized definition of each model and enum.
+    """
+    definitions = {}
+    matches = list(PRISMA_DEFINITION_PATTERN.finditer(database_schema))
+    for match, next_match in zip(matches, matches[1:] + [None]):
+        end = next_match.start() if next_match else len(database_schema)
+        definition = database_schema[match.start() : end]
+        definitions[match.group(1)] = " ".join(definition.split())
+    return definitions
+
+
+def get_database_entities(code: str) -> set[str]:
+    """
+    Names of the database models & enums used by a piece of code.
+    """
+    entities = set(PRISMA_ENTITY_PATTERN.findall(code))
+    for names in PRISMA_IMPORT_PATTERN.findall(code):
+        entities.update(
+            n.split(" as ")[0].strip() for n in names.strip("()").split(",")
+        )
+    return entities - {""}
+
+
+def is_schema_compatible(
+    code: str, database_schema: str, candidate_schema: str
+) -> bool:
+    """
+    Check that all the database models & enums used by the code
+    are defined the same way in both schemas.
+    """
+    used_entities = get_database_entities(code)
+    if not used_entities:
+        return True
+
+    definitions = get_database_definitions(database_schema)
+    candidate_definitions = get_database_definitions(candidate_schema)
+    return all(
+        name in definitions and definitions[name] == candidate_definitions.get(name)
+        for name in used_entities
+    )
+
+
+def is_field_compatible(
+    candidate_field: ObjectField, objects: dict[str, ObjectType]
+) -> bool:
+    """
+    Check that the custom types used by a field of a candidate function
+    are available with the same fields.
+    """
+    for obj in candidate_field.RelatedTypes or []:
+        available = objects.get(obj.name)
+        if not available or {(f.name, f.typeName) for f in obj.Fields or []} != {
+            (f.name, f.typeName) for f in available.Fields or []
+        }:
+            return False
+    return True
+
+
+def get_similarity(function: Function, candidate: Function) -> int:
+    return fuzz.token_set_ratio(
+        f"{function.functionName} {function.description or ''}",
+        f"{candidate.functionName} {candidate.description or ''}",
+    )
+
+
+async def find_reusable_function(
+    function: Function, database_schema: str, objects: dict[str, ObjectType]
+) -> Function | None:
+    """
+    Find a function written for a previous application that can replace
+    the given function without being developed again.
+
+    Only leaf functions (without child functions) that were implemented without
+    errors are considered.
+
+    Args:
+        function (Function): The function to develop.
+        database_schema (str): The database schema of the application.
+        objects (dict[str, ObjectType]): The object types available to the function.
+
+    Returns:
+        Function | None: The best reusable function, if any.
+    """
+    candidates = await Function.prisma().find_many(
+        where={
+            "signatureHash": get_function_signature_hash(function),
+            "state": {"in": [FunctionState.WRITTEN, FunctionState.VERIFIED]},
+            "id": {"not": function.id},
+            "compiledRouteId": {"not": None},  # type: ignore
+            "ChildFunctions": {"none": {}},
+        },
+        include={
+            **INCLUDE_FUNC["include"],
+            "Packages": True,
+            "CompiledRoute": {
+                "include": {
+                    "CompletedApp": {
+                        "include": {
+                            "Specification": {
+                                "include": {
+                                    "DatabaseSchema": {
+                                        "include": {"DatabaseTables": True}
+                                    }
+                                }
+                            }
+                        }
+                    }
+                }
+            },
+        },  # type: ignore
+        order={"updatedAt": "desc"},
+        take=REUSE_MAX_CANDIDATES,
+    )
+
+    best_match, best_score = None, REUSE_SIMILARITY_THRESHOLD - 1
+    for candidate in candidates:
+        if not candidate.functionCode or TODO_COMMENT in candidate.functionCode:
+            continue
+
+        # Verified functions are preferred over the ones only written
+        score = get_similarity(function, candidate)
+        if candidate.state == FunctionState.VERIFIED:
+            score += 1
+        if score <= best_score:
+            continue
+
+        candidate_fields = (candidate.FunctionArgs or []) + (
+            [candidate.FunctionReturn] if candidate.FunctionReturn else []
+        )
+        if not all(is_field_compatible(f, objects) for f in candidate_fields):
+            continue
+
+        route = candidate.CompiledRoute
+        spec = (
+            route.CompletedApp.Specification if route and route.CompletedApp else None
+        )
+        candidate_schema = "\n\n".join(
+            t.definition
+            for t in (
+                spec.DatabaseSchema.DatabaseTables or []
+                if spec and spec.DatabaseSchema
+                else []
+            )
+        )
+        candidate_code = "\n".join(candidate.importStatements)
+        candidate_code += "\n" + candidate.functionCode
+        if not is_schema_compatible(candidate_code, database_schema, candidate_schema):
+            continue
+
+        best_match, best_score = candidate, score
+
+    if best_match:
+        logger.info(
+            f"♻️ Found reusable function for {function.functionName}: "
+            f"{best_match.functionName} - {best_match.id} (score: {best_score})"
+        )
+    return best_match
+
+
+async def index_functions(batch_size: int = 500) -> int:
+    """
+    Compute the signature hash of the functions created before the reuse index.
+
+    Returns:
+        int: The number of indexed functions.
+    """
+    indexed = 0
+    while True:
+        functions = await Function.prisma().find_many(
+            where={"signatureHash": None},  # type: ignore
+            include=INCLUDE_FUNC["include"],  # type: ignore
+            take=batch_size,
+        )
+        if not functions:
+            return indexed
+
+        for function in functions:
+            await Function.prisma().update(
+                where={"id": function.id},
+                data={"signatureHash": get_function_signature_hash(function)},
+            )
+        indexed += len(functions)
+        logger.info(f"Indexed {indexed} functions")
+
+
+class SharedFunctions:
+    """
+    The helper functions being developed by the routes of an application,
+    by name and signature.
+    """
+
+    def __init__(self):
+        self._functions: dict[tuple[str, str], asyncio.Future[Function | None]] = {}
+        self._owners: dict[str, tuple[str, str]] = {}
+        self.shared = 0
+
+    @staticmethod
+    def get_key(function: Function) -> tuple[str, str]:
+        return (
+            function.functionName,
+            function.signatureHash or get_function_signature_hash(function),
+        )
+
+    async def acquire(self, function: Function) -> Function | None:
+        """
+        Get the implementation of the function developed by another route,
+        waiting for it if it's being developed.
+
+        Returns:
+            Function | None: The implemented function, None if the caller has to
+                             develop the function and `release` it afterwards.
+        """
+        key = self.get_key(function)
+        future = self._functions.get(key)
+        if future is None:
+            self._functions[key] = asyncio.get_running_loop().create_future()
+            self._owners[function.id] = key
+            return None
+
+        # A waiting route being cancelled must not cancel the shared development
+        shared = await asyncio.shield(future)
+        if shared:
+            self.shared += 1
+        return shared
+
+    def release(self, function: Function, developed: Function | None) -> None:
+        """
+        Share the implementation of a function acquired by the caller, or let the
+        next routes develop it when it failed (developed is None).
+
+        Only leaf functions are shared: the child functions of a function are
+        developed in the tree of the route that wrote it.
+        """
+        key = self._owners.pop(function.id, None)
+        if key is None:
+            return
+        future = self._functions[key]
+        if developed is None:
+            del self._functions[key]
+        if not future.done():
+            future.set_result(
+                None if developed is None or developed.ChildFunctions else developed
+            )
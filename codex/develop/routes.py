@@ -220,6 +220,34 @@ async def create_user_interface(
     )
 
 
+@delivery_router.post(
+    "/user/{user_id}/apps/{app_id}/specs/{spec_id}/deliverables/{deliverable_id}/resume",
+    response_model=DeliverableResponse,
+    tags=["deliverables"],
+)
+async def resume_deliverable(
+    user_id: str, app_id: str, spec_id: str, deliverable_id: str
+):
+    """
+    Resume the development of a deliverable, only developing the functions
+    that were not written yet.
+    """
+    user = await codex.database.get_user(user_id)
+    ids = Identifiers(
+        user_id=user_id,
+        cloud_services_id=user.cloudServicesId if user else "",
+        app_id=app_id,
+        spec_id=spec_id,
+    )
+    completed_app = await architect_agent.resume_application(ids, deliverable_id)
+    return DeliverableResponse(
+        id=completed_app.id,
+        created_at=completed_app.createdAt,
+        name=completed_app.name,
+        description=completed_app.description,
+    )
+
+
 @delivery_router.get(
     "/user/{user_id}/apps/{app_id}/specs/{spec_id}/deliverables/{deliverable_id}",
     response_model=DeliverableResponse,
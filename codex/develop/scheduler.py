@@ -0,0 +1,138 @@
+import asyncio
+import contextlib
+import heapq
+import itertools
+import logging
+import os
+from typing import Any, AsyncIterator, Coroutine
+
+logger = logging.getLogger(__name__)
+
+DEVELOP_MAX_CONCURRENCY = int(os.environ.get("DEVELOP_MAX_CONCURRENCY", 20))
+
+
+class WorkScheduler:
+    """
+    Schedules the development work of a deliverable (LLM calls and code validation).
+
+    The routes and their function trees form a DAG where a function can only be
+    developed after its parent wrote it as a stub. The scheduler bounds the amount
+    of work in flight, so large applications don't trip the provider rate limits,
+    and hands the free slots to the work with the longest remaining path first
+    (highest-level-first list scheduling), which keeps the makespan of the whole
+    deliverable close to its critical path. The remaining path of a function is
+    estimated from its depth, its child functions are unknown until it is written.
+
+    Usage:
+    ```
+    scheduler = WorkScheduler(max_concurrency=10)
+    task = scheduler.spawn(develop(...))
+
+    # Inside develop
+    async with scheduler.slot(priority=remaining_depth):
+        await ai_block.invoke(...)
+    ```
+    """
+
+    def __init__(self, max_concurrency: int = DEVELOP_MAX_CONCURRENCY):
+        if max_concurrency < 1:
+            raise ValueError("max_concurrency should be at least 1")
+        self.max_concurrency = max_concurrency
+        self.running = 0
+        self.completed = 0
+        self.cancelled = False
+        # Units of work (LLM calls, validations) in flight and queued when cancelled
+        self.interrupted = 0
+        self.skipped = 0
+        self._waiting: list[tuple[int, int, asyncio.Future]] = []
+        self._counter = itertools.count()
+        self._tasks: set[asyncio.Task] = set()
+
+    @property
+    def waiting(self) -> int:
+        return sum(1 for _, _, fut in self._waiting if not fut.done())
+
+    @contextlib.asynccontextmanager
+    async def slot(self, priority: int = 0) -> AsyncIterator[None]:
+        """
+        Hold one of the work slots for the duration of the block.
+
+        Args:
+            priority (int): The length of the longest path of work remaining
+                            after this one, higher runs first.
+
+        Raises:
+            asyncio.CancelledError: If the scheduler has been cancelled.
+        """
+        await self._acquire(priority)
+        try:
+            yield
+        finally:
+            self._release()
+            self.completed += 1
+
+    async def _acquire(self, priority: int) -> None:
+        if self.cancelled:
+            raise asyncio.CancelledError("Work scheduler has been cancelled")
+
+        if self.running < self.max_concurrency and not self.waiting:
+            self.running += 1
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiting, (-priority, next(self._counter), future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # The slot was handed over right before the cancellation
+                self._release()
+            raise
+
+    def _release(self) -> None:
+        self.running -= 1
+        while self._waiting and self.running < self.max_concurrency:
+            _, _, future = heapq.heappop(self._waiting)
+            if future.done():
+                # The waiting task has been cancelled
+                continue
+            self.running += 1
+            future.set_result(None)
+
+    def spawn(self, coro: Coroutine[Any, Any, Any]) -> asyncio.Task:
+        """
+        Run the coroutine as a task tracked by the scheduler, so it can be cancelled.
+        """
+        task = asyncio.ensure_future(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        if self.cancelled:
+            task.cancel()
+        return task
+
+    def cancel(self) -> int:
+        """
+        Cancel all the work spawned by the scheduler and still pending,
+        and refuse any new work.
+
+        Returns:
+            int: The number of cancelled tasks.
+        """
+        self.cancelled = True
+        self.interrupted = self.running
+        self.skipped = self.waiting
+        for _, _, future in self._waiting:
+            future.cancel()
+        self._waiting.clear()
+
+        cancelled = 0
+        for task in list(self._tasks):
+            if not task.done():
+                task.cancel()
+                cancelled += 1
+        logger.warning(
+            f"Cancelled {cancelled} pending development tasks: "
+            f"{self.interrupted} units of work interrupted, {self.skipped} queued "
+            f"units of work skipped, {self.completed} completed"
+        )
+        return cancelled
@@ -8,6 +8,7 @@ from codex.common.ai_block import (
     ValidatedResponse,
     ValidationError,
 )
+from codex.common.cascade import CASCADE_MODEL
 from codex.interview.model import UpdateUnderstanding
 
 logger = logging.getLogger(__name__)
@@ -20,6 +21,7 @@ class InterviewUpdateBlock(AIBlock):
 
     :param prompt_template_name: The template name for the prompt.
     :param model: The model used for processing.
+    :param cascade_model: The cheaper model tried before the processing model.
     :param is_json_response: A boolean indicating if the response is in JSON format.
     :param pydantic_object: The Pydantic object associated with the block.
 
@@ -31,6 +33,7 @@ class InterviewUpdateBlock(AIBlock):
 
     prompt_template_name = "interview/update"
     model = "gpt-4o"
+    cascade_model = CASCADE_MODEL
     is_json_response = True
     pydantic_object = UpdateUnderstanding
 
@@ -0,0 +1,836 @@
+import asyncio
+import os
+import shutil
+import tempfile
+from pathlib import Path
+
+import click
+
+
+@click.group()
+def perf():
+    """
+    Benchmarks for the performance critical parts of the codex system.
+    """
+    pass
+
+
+def disk_usage(path: Path, exclude_inodes: set[int] | None = None) -> int:
+    """
+    Bytes allocated on disk for the files under `path`,
+    not counting the inodes in `exclude_inodes` (e.g. shared hardlinks).
+    """
+    exclude_inodes = exclude_inodes or set()
+    seen: set[int] = set()
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            stat = os.lstat(os.path.join(root, name))
+            if stat.st_ino in seen or stat.st_ino in exclude_inodes:
+                continue
+            seen.add(stat.st_ino)
+            total += stat.st_blocks * 512
+    return total
+
+
+def inodes(path: Path) -> set[int]:
+    return {
+        os.lstat(os.path.join(root, name)).st_ino
+        for root, _, files in os.walk(path)
+        for name in files
+    }
+
+
+@perf.command()
+@click.option(
+    "--source",
+    "-s",
+    default=None,
+    help="Virtual environment to clone, defaults to the code analysis venv",
+)
+@click.option("--runs", "-r", default=3, help="Number of clones per mode")
+def venv_clone(source: str | None, runs: int):
+    """
+    Compare clone time and disk usage of the virtual environment cloning modes.
+    """
+    from codex.common.exec_external_tool import (
+        PROJECT_PARENT_DIR,
+        VenvCloneMode,
+        clone_virtual_env,
+        setup_if_required,
+    )
+
+    loop = asyncio.new_event_loop()
+    if source:
+        src = Path(source)
+    else:
+        loop.run_until_complete(setup_if_required(PROJECT_PARENT_DIR))
+        src = PROJECT_PARENT_DIR / "venv"
+    python_path = src / "bin"
+    src_inodes = inodes(src)
+
+    click.echo(f"Source: {src} ({disk_usage(src) / 2**20:.1f} MiB)")
+    click.echo(f"{'mode':<18} | {'time (s)':>9} | {'disk (MiB)':>10} | files")
+    click.echo("-" * 60)
+    # Keep the clones on the same filesystem as the source so links are possible
+    with tempfile.TemporaryDirectory(dir=src.parent) as tmp:
+        for mode in VenvCloneMode:
+            durations = []
+            for run in range(runs):
+                dst = Path(tmp) / f"{mode.value}-{run}"
+                stats = loop.run_until_complete(
+                    clone_virtual_env(src, dst, python_path, mode)
+                )
+                durations.append(stats.duration)
+                usage = disk_usage(dst, src_inodes)
+                shutil.rmtree(dst)
+            click.echo(
+                f"{mode.value:<18} | {min(durations):>9.2f} | "
+                f"{usage / 2**20:>10.1f} | "
+                f"reflinked={stats.reflinked} hardlinked={stats.hardlinked} "
+                f"copied={stats.copied} rewritten={stats.rewritten}"
+            )
+    click.echo("\nReflinked blocks are shared by the filesystem but reported as used.")
+
+
+SAMPLE_TYPES = [
+    "str",
+    "int",
+    "bool",
+    "Optional[str]",
+    "str | None",
+    "list[str]",
+    "List[int]",
+    "dict[str, Any]",
+    "Dict[str, List[int]]",
+    "Optional[datetime]",
+    "list[UserProfile]",
+    "Optional[List[Appointment]]",
+    "Dict[str, Union[int, float, str]]",
+    "tuple[str, dict[str, int | float]]",
+    "List[Tuple[datetime, Optional[prisma.models.Appointment]]]",
+    "prisma.enums.Role",
+    "Optional[Dict[str, List[prisma.models.OrderItem]]]",
+    "Union[SuccessResponse, ErrorResponse, None]",
+]
+
+
+async def load_type_names(limit: int) -> list[str]:
+    import prisma
+    from prisma.models import ObjectField
+
+    client = prisma.Prisma(auto_register=True)
+    await client.connect()
+    try:
+        fields = await ObjectField.prisma().find_many(
+            distinct=["typeName"], take=limit, order={"createdAt": "desc"}
+        )
+    finally:
+        await client.disconnect()
+    return [f.typeName for f in fields]
+
+
+@perf.command()
+@click.option(
+    "--from-db",
+    is_flag=True,
+    default=False,
+    help="Benchmark the object field types of the database instead of samples",
+)
+@click.option("--limit", "-l", default=5000, help="Maximum number of DB types")
+@click.option("--runs", "-r", default=5, help="Number of runs per operation")
+def type_parsing(from_db: bool, limit: int, runs: int):
+    """
+    Compare the type operations with cold (cleared) and warm caches.
+    """
+    import time
+
+    from codex.common.types import (
+        clear_type_caches,
+        extract_field_type,
+        is_type_equal,
+        normalize_type,
+        parse_type,
+    )
+
+    if from_db:
+        types = asyncio.run(load_type_names(limit))
+    else:
+        types = SAMPLE_TYPES
+    pairs = list(zip(types, types[1:] + types[:1])) + [
+        (t, normalize_type(t)) for t in types
+    ]
+    operations = {
+        "parse_type": lambda: [parse_type(t) for t in types],
+        "normalize_type": lambda: [normalize_type(t) for t in types],
+        "extract_field_type": lambda: [extract_field_type(t) for t in types],
+        "is_type_equal": lambda: [is_type_equal(a, b) for a, b in pairs],
+    }
+
+    def measure(operation, cold: bool) -> float:
+        durations = []
+        for _ in range(runs):
+            if cold:
+                clear_type_caches()
+            start = time.perf_counter()
+            operation()
+            durations.append(time.perf_counter() - start)
+        return min(durations)
+
+    click.echo(f"{len(types)} types, {len(pairs)} pairs, best of {runs} runs")
+    click.echo(f"{'operation':<20} | {'cold (ms)':>9} | {'warm (ms)':>9} | speedup")
+    click.echo("-" * 56)
+    for name, operation in operations.items():
+        cold = measure(operation, cold=True)
+        operation()
+        warm = measure(operation, cold=False)
+        click.echo(
+            f"{name:<20} | {cold * 1000:>9.2f} | {warm * 1000:>9.2f} | "
+            f"{cold / warm:>6.1f}x"
+        )
+
+
+async def load_llm_code(limit: int) -> list[str]:
+    import prisma
+    from prisma.models import LLMCallAttempt
+
+    client = prisma.Prisma(auto_register=True)
+    await client.connect()
+    try:
+        attempts = await LLMCallAttempt.prisma().find_many(
+            where={"response": {"contains": "```python"}},
+            take=limit,
+            order={"createdAt": "desc"},
+        )
+    finally:
+        await client.disconnect()
+    return [a.response.split("```python")[-1].split("```")[0] for a in attempts]
+
+
+@perf.command()
+@click.option(
+    "--from-db",
+    is_flag=True,
+    default=False,
+    help="Benchmark the code of the recorded LLM responses of the database",
+)
+@click.option(
+    "--path",
+    "-p",
+    default=None,
+    help="Directory of recorded code files, defaults to the codex sources",
+)
+@click.option("--limit", "-l", default=500, help="Maximum number of DB responses")
+@click.option("--runs", "-r", default=5, help="Number of runs per mode")
+def function_visitor(from_db: bool, path: str | None, limit: int, runs: int):
+    """
+    Compare the FunctionVisitor unparsing the AST with slicing the source code.
+    """
+    import ast
+    import time
+
+    from codex.develop.function_visitor import FunctionVisitor
+
+    if from_db:
+        sources = asyncio.run(load_llm_code(limit))
+    else:
+        root = Path(path) if path else Path(__file__).parent.parent
+        sources = [p.read_text() for p in sorted(root.rglob("*.py"))]
+
+    trees = []
+    for source in sources:
+        try:
+            trees.append((source, ast.parse(source)))
+        except SyntaxError:
+            continue
+
+    def measure(use_source: bool) -> float:
+        durations = []
+        for _ in range(runs):
+            start = time.perf_counter()
+            for source, tree in trees:
+                FunctionVisitor(source if use_source else None).visit(tree)
+            durations.append(time.perf_counter() - start)
+        return min(durations)
+
+    functions = 0
+    for source, tree in trees:
+        visitor = FunctionVisitor(source)
+        visitor.visit(tree)
+        functions += len(visitor.functions)
+
+    unparsed, sliced = measure(use_source=False), measure(use_source=True)
+    click.echo(f"{len(trees)} code samples, {functions} functions")
+    click.echo(f"unparse: {unparsed * 1000:.1f} ms, best of {runs} runs")
+    click.echo(f"source:  {sliced * 1000:.1f} ms, best of {runs} runs")
+    click.echo(f"speedup: {unparsed / sliced:.1f}x")
+
+
+SAMPLE_PAGES = [
+    (
+        "/todos",
+        "todo_list_page",
+        "async def todo_list_page(client: nicegui.Client):\n"
+        '    """Show the tasks of the user in a list with a checkbox to mark them as '
+        'done, an input field and a button to add a task."""',
+    ),
+    (
+        "/login",
+        "login_page",
+        "async def login_page(client: nicegui.Client):\n"
+        '    """Login form with username and password inputs, redirecting to the '
+        'home page on success and showing a notification on failure."""',
+    ),
+    (
+        "/dashboard",
+        "dashboard_page",
+        "async def dashboard_page(client: nicegui.Client):\n"
+        '    """Dashboard with a chart of the monthly sales, a table of the latest '
+        'orders and cards with the key figures, refreshed every minute."""',
+    ),
+    (
+        "/chat",
+        "chat_page",
+        "async def chat_page(client: nicegui.Client):\n"
+        '    """Chat room showing the messages with the avatar of their author '
+        'and a text input to send a message."""',
+    ),
+    (
+        "/upload",
+        "upload_page",
+        "async def upload_page(client: nicegui.Client):\n"
+        '    """Upload an image, display it and let the user draw annotations '
+        'on it before saving them."""',
+    ),
+]
+
+
+async def load_nicegui_pages(limit: int) -> list[tuple[str, str, str]]:
+    import prisma
+    from prisma.models import CompiledRoute
+
+    client = prisma.Prisma(auto_register=True)
+    await client.connect()
+    try:
+        routes = await CompiledRoute.prisma().find_many(
+            # The user interface deliverables have a companion backend deliverable
+            where={"CompletedApp": {"is": {"companionCompletedAppId": {"not": None}}}},  # type: ignore
+            include={"RootFunction": True, "ApiRouteSpec": True},
+            take=limit,
+            order={"createdAt": "desc"},
+        )
+    finally:
+        await client.disconnect()
+    return [
+        (r.ApiRouteSpec.path, r.RootFunction.functionName, r.RootFunction.template)
+        for r in routes
+        if r.ApiRouteSpec and r.RootFunction
+    ]
+
+
+@perf.command()
+@click.option(
+    "--from-db",
+    is_flag=True,
+    default=False,
+    help="Benchmark the pages of the user interface deliverables of the database",
+)
+@click.option("--limit", "-l", default=50, help="Maximum number of DB pages")
+@click.option(
+    "--llm",
+    is_flag=True,
+    default=False,
+    help="Also call the LLM with both prompts to compare latency and pass rate",
+)
+def nicegui_docs(from_db: bool, limit: int, llm: bool):
+    """
+    Compare the NiceGUI develop prompt with the full and the retrieved documentation.
+    """
+    import time
+    import uuid
+
+    from codex.common.ai_block import ValidationError
+    from codex.common.ai_model import MAX_COMPLETION_TOKENS, OpenAIChatClient
+    from codex.develop.context import count_tokens
+    from codex.develop.develop import NiceGUIDevelopAIBlock
+    from codex.develop.nicegui_docs import get_nicegui_docs, get_nicegui_indexes
+
+    pages = asyncio.run(load_nicegui_pages(limit)) if from_db else SAMPLE_PAGES
+    OpenAIChatClient.configure({})
+    block = NiceGUIDevelopAIBlock()
+
+    start = time.perf_counter()
+    get_nicegui_indexes(block.templates_dir)
+    click.echo(f"Index built in {(time.perf_counter() - start) * 1000:.1f} ms")
+
+    def get_invoke_params(page: tuple[str, str, str], sliced: bool) -> dict:
+        route_path, function_name, function_signature = page
+        params = {
+            "route_path": route_path,
+            "function_name": function_name,
+            "function_signature": function_signature,
+            "goal": "",
+            "database_schema": "",
+            "provided_functions": [],
+            "compiled_route_id": f"perf-{uuid.uuid4()}",
+            "function_id": None,
+            "available_objects": {},
+            "available_functions": {},
+        }
+        if sliced:
+            params.update(
+                get_nicegui_docs(block.templates_dir, " ".join(page)),
+            )
+        return params
+
+    def get_messages(invoke_params: dict) -> list[dict]:
+        return block.get_messages(
+            block.load_template("system", invoke_params),
+            block.load_template("context", invoke_params, optional=True),
+            block.load_template("user", invoke_params),
+        )
+
+    async def develop(invoke_params: dict) -> tuple[float, bool]:
+        messages = get_messages(invoke_params)
+        start = time.perf_counter()
+        response = await block.call_llm(
+            {
+                "model": block.model,
+                "messages": messages,
+                "max_tokens": MAX_COMPLETION_TOKENS,
+            }
+        )
+        latency = time.perf_counter() - start
+        try:
+            await block.validate(invoke_params, response)
+            return latency, True
+        except ValidationError:
+            return latency, False
+
+    results = {}
+    for sliced in [False, True]:
+        tokens, retrieval, latencies, passed = 0, 0.0, [], 0
+        for page in pages:
+            start = time.perf_counter()
+            invoke_params = get_invoke_params(page, sliced)
+            retrieval += time.perf_counter() - start
+            tokens += sum(
+                count_tokens(message["content"])
+                for message in get_messages(invoke_params)
+            )
+            if llm:
+                latency, valid = asyncio.run(develop(invoke_params))
+                latencies.append(latency)
+                passed += valid
+        results["retrieved" if sliced else "full"] = (
+            tokens / len(pages),
+            retrieval * 1000 / len(pages),
+            sum(latencies) / len(latencies) if latencies else None,
+            passed / len(pages) if llm else None,
+        )
+
+    click.echo(f"{len(pages)} pages")
+    click.echo(
+        f"{'docs':<10} | {'prompt tokens':>13} | {'retrieval (ms)':>14} | "
+        f"{'LLM latency (s)':>15} | pass rate"
+    )
+    click.echo("-" * 70)
+    for name, (tokens, retrieval, latency, pass_rate) in results.items():
+        click.echo(
+            f"{name:<10} | {tokens:>13.0f} | {retrieval:>14.2f} | "
+            f"{f'{latency:.1f}' if latency is not None else '-':>15} | "
+            f"{f'{pass_rate:.0%}' if pass_rate is not None else '-'}"
+        )
+
+
+SAMPLE_SCHEMA = """model User {
+  id        String   @id @default(uuid())
+  email     String   @unique
+  password  String
+  role      Role     @default(USER)
+  Tasks     Task[]
+}
+
+model Task {
+  id        String   @id @default(uuid())
+  title     String
+  done      Boolean  @default(false)
+  dueDate   DateTime?
+  userId    String
+  User      User     @relation(fields: [userId], references: [id])
+}
+
+enum Role {
+  ADMIN
+  USER
+}"""
+
+SAMPLE_FUNCTIONS = [
+    (
+        "create_task",
+        "async def create_task(user_id: str, title: str, due_date: Optional[datetime]) "
+        '-> Task:\n    """Create a task for the user."""',
+    ),
+    (
+        "list_tasks",
+        "async def list_tasks(user_id: str, done: Optional[bool]) -> list[Task]:\n"
+        '    """List the tasks of the user, optionally filtered by status."""',
+    ),
+    (
+        "complete_task",
+        "async def complete_task(task_id: str) -> Task:\n"
+        '    """Mark a task as done."""',
+    ),
+    (
+        "hash_password",
+        "def hash_password(password: str) -> str:\n"
+        '    """Hash a password with a random salt."""',
+    ),
+]
+
+# OpenAI caches prompts from 1024 tokens, by increments of 128 tokens
+PROMPT_CACHE_MIN_TOKENS = 1024
+PROMPT_CACHE_INCREMENT = 128
+
+
+def render_develop_prompts(lang: str) -> list[list[dict]]:
+    """
+    The messages of the develop calls of the sample application.
+    """
+    from codex.common.ai_model import OpenAIChatClient
+    from codex.develop.develop import DevelopAIBlock, NiceGUIDevelopAIBlock
+    from codex.develop.nicegui_docs import get_nicegui_docs
+
+    OpenAIChatClient.configure({})
+    if lang == "nicegui":
+        block = NiceGUIDevelopAIBlock()
+        calls = [(path, name, signature) for path, name, signature in SAMPLE_PAGES]
+    else:
+        block = DevelopAIBlock()
+        calls = [("", name, signature) for name, signature in SAMPLE_FUNCTIONS]
+
+    prompts = []
+    for route_path, function_name, function_signature in calls:
+        invoke_params = {
+            "route_path": route_path,
+            "function_name": function_name,
+            "function_signature": function_signature,
+            "goal": "A todo list application where users manage their tasks",
+            "database_schema": SAMPLE_SCHEMA if lang == "python" else "",
+            "provided_functions": [],
+            "allow_stub": True,
+        }
+        if lang == "nicegui":
+            invoke_params.update(
+                get_nicegui_docs(block.templates_dir, f"{route_path} {function_name}")
+            )
+        prompts.append(
+            block.get_messages(
+                block.load_template("system", invoke_params),
+                block.load_template("context", invoke_params, optional=True),
+                block.load_template("user", invoke_params),
+            )
+        )
+    return prompts
+
+
+@perf.command()
+@click.option(
+    "--lang",
+    type=click.Choice(["python", "nicegui"]),
+    default="python",
+    help="The develop prompts to render",
+)
+def prompt_prefix(lang: str):
+    """
+    Measure the prompt prefix shared by the consecutive develop calls of an
+    application, which the provider reads from its prompt cache.
+    """
+    import os.path
+
+    from codex.develop.context import count_tokens
+
+    prompts = [
+        "\n".join(message["content"] for message in messages)
+        for messages in render_develop_prompts(lang)
+    ]
+
+    click.echo(f"{len(prompts)} {lang} develop calls of the same application")
+    click.echo(f"{'call':<4} | {'prompt':>7} | {'shared':>7} | {'cached':>7} | share")
+    click.echo("-" * 46)
+    total_tokens, total_cached = 0, 0
+    for i, prompt in enumerate(prompts):
+        tokens = count_tokens(prompt)
+        shared = (
+            count_tokens(os.path.commonprefix([prompts[i - 1], prompt])) if i else 0
+        )
+        cached = 0
+        if shared >= PROMPT_CACHE_MIN_TOKENS:
+            cached = shared // PROMPT_CACHE_INCREMENT * PROMPT_CACHE_INCREMENT
+        total_tokens += tokens
+        total_cached += cached
+        click.echo(
+            f"{i:<4} | {tokens:>7} | {shared:>7} | {cached:>7} | {cached / tokens:.0%}"
+        )
+    click.echo(
+        f"Cached prompt tokens: {total_cached / total_tokens:.0%} of {total_tokens}"
+    )
+
+
+async def load_template_completion_tokens() -> dict[tuple, list[int]]:
+    import prisma
+
+    from codex.common.completion_stats import MAX_TOKENS_SAMPLES
+
+    client = prisma.Prisma(auto_register=True)
+    await client.connect()
+    try:
+        rows = await client.query_raw(
+            r"""
+            SELECT "templateName", model, language, tokens
+            FROM (
+                SELECT t."templateName", t.model, c.language,
+                       a."completionTokens" AS tokens,
+                       row_number() OVER (
+                           PARTITION BY t."templateName", t.model, c.language
+                           ORDER BY a."createdAt" DESC
+                       ) AS rank
+                FROM "LLMCallAttempt" a
+                JOIN "LLMCallTemplate" t ON t.id = a."llmCallTemplateId"
+                CROSS JOIN LATERAL (
+                    SELECT substring(
+                        t."systemPrompt" FROM t."templateName" || '/(\w+)\.system'
+                    ) AS language
+                ) c
+            ) calls
+            WHERE rank <= $1
+            """,
+            MAX_TOKENS_SAMPLES,
+        )
+    finally:
+        await client.disconnect()
+
+    completion_tokens: dict[tuple, list[int]] = {}
+    for row in rows:
+        key = (row["templateName"], row["model"], row["language"])
+        completion_tokens.setdefault(key, []).append(int(row["tokens"]))
+    return completion_tokens
+
+
+@perf.command()
+def max_tokens():
+    """
+    Show the adaptive max_tokens of the call templates from their recorded calls.
+    """
+    from codex.common.ai_model import MAX_COMPLETION_TOKENS
+    from codex.common.completion_stats import (
+        MAX_TOKENS_PERCENTILE,
+        get_adaptive_max_tokens,
+        get_percentile,
+    )
+
+    completion_tokens = asyncio.run(load_template_completion_tokens())
+    click.echo(
+        f"{'template':<40} | {'calls':>6} | {'P50':>5} | "
+        f"{f'P{MAX_TOKENS_PERCENTILE:g}':>5} | {'max':>5} | max_tokens"
+    )
+    click.echo("-" * 84)
+    for (template, model, language), tokens in sorted(
+        completion_tokens.items(), key=lambda item: str(item[0])
+    ):
+        name = f"{template} ({language or '-'}, {model})"
+        click.echo(
+            f"{name:<40} | {len(tokens):>6} | {get_percentile(tokens, 50):>5} | "
+            f"{get_percentile(tokens, MAX_TOKENS_PERCENTILE):>5} | {max(tokens):>5} | "
+            f"{get_adaptive_max_tokens(tokens)} / {MAX_COMPLETION_TOKENS}"
+        )
+
+
+async def load_template_escalations() -> list[dict]:
+    import prisma
+
+    client = prisma.Prisma(auto_register=True)
+    await client.connect()
+    try:
+        return await client.query_raw(
+            r"""
+            SELECT t."templateName", t.model, a.model AS "firstModel",
+                   substring(
+                       t."systemPrompt" FROM t."templateName" || '/(\w+)\.system'
+                   ) AS language,
+                   COUNT(*) AS calls,
+                   COUNT(*) FILTER (WHERE EXISTS (
+                       SELECT 1 FROM "LLMCallAttempt" r WHERE r."firstCallId" = a.id
+                   )) AS escalated
+            FROM "LLMCallAttempt" a
+            JOIN "LLMCallTemplate" t ON t.id = a."llmCallTemplateId"
+            WHERE a.attempt = 0
+            GROUP BY 1, 2, 3, 4
+            """
+        )
+    finally:
+        await client.disconnect()
+
+
+@perf.command()
+def cascade():
+    """
+    Show the retry rate of the first calls of the call templates by model, and
+    whether the cheap model is tried first by the cascade.
+    """
+    from codex.common.cascade import should_cascade
+
+    rows = asyncio.run(load_template_escalations())
+    click.echo(
+        f"{'template':<40} | {'first model':<12} | {'calls':>6} | "
+        f"{'retried':>7} | cascade"
+    )
+    click.echo("-" * 84)
+    for row in sorted(rows, key=lambda r: str(list(r.values()))):
+        calls, escalated = int(row["calls"]), int(row["escalated"])
+        name = f"{row['templateName']} ({row['language'] or '-'}, {row['model']})"
+        # The calls to the template model are retried, not escalated
+        cascaded = row["firstModel"] != row["model"]
+        click.echo(
+            f"{name:<40} | {row['firstModel']:<12} | {calls:>6} | "
+            f"{escalated / calls:>7.1%} | "
+            f"{(should_cascade(calls, escalated, draw=1) if cascaded else '-')}"
+        )
+
+
+@perf.command()
+@click.option(
+    "--lang",
+    type=click.Choice(["python", "nicegui"]),
+    default="python",
+    help="The develop prompts to count",
+)
+@click.option("--runs", "-r", default=5, help="Number of runs per mode")
+def token_counting(lang: str, runs: int):
+    """
+    Compare the token counting of the rate limiter admission before and after
+    the memoization of the prompt segments.
+    """
+    import time
+
+    import tiktoken
+
+    from codex.common.ai_model import clear_token_counts, num_tokens_from_messages
+
+    requests = render_develop_prompts(lang)
+
+    def count_uncached(messages: list[dict]) -> int:
+        # The counting before the memoization: the encoder is looked up and
+        # every message is encoded for every request
+        encoding = tiktoken.encoding_for_model("gpt-4o")
+        return sum(
+            3 + sum(len(encoding.encode(value)) for value in message.values())
+            for message in messages
+        )
+
+    # fresh: the requests of an application with an empty cache, the static
+    # segments are encoded once; repeated: the same requests again
+    def measure(count, cold: bool) -> float:
+        durations = []
+        for _ in range(runs):
+            if cold:
+                clear_token_counts()
+            start = time.perf_counter()
+            for messages in requests:
+                count(messages)
+            durations.append(time.perf_counter() - start)
+        return min(durations) / len(requests)
+
+    count_uncached(requests[0])
+    modes = {
+        "uncached": measure(count_uncached, cold=False),
+        "fresh": measure(num_tokens_from_messages, cold=True),
+        "repeated": measure(num_tokens_from_messages, cold=False),
+    }
+    tokens = sum(num_tokens_from_messages(messages) for messages in requests)
+    click.echo(
+        f"{len(requests)} {lang} develop requests, "
+        f"{tokens // len(requests)} tokens per request, best of {runs} runs"
+    )
+    for mode, duration in modes.items():
+        click.echo(
+            f"{mode:<9}: {duration * 1000:>7.3f} ms per request "
+            f"({modes['uncached'] / duration:.1f}x)"
+        )
+
+
+@perf.command()
+@click.option("--calls", "-n", default=2000, help="Number of simulated calls")
+@click.option("--tail", default=0.05, help="Share of the calls in the slow tail")
+@click.option("--budget", default=0.05, help="Hedge budget, share of the tokens")
+def hedging(calls: int, tail: float, budget: float):
+    """
+    Simulate the latency of LLM calls with a slow tail, with and without hedging.
+    The latencies are scaled down, 1 simulated second lasts 10ms.
+    """
+    import random
+
+    from openai.types.chat import ChatCompletion
+
+    from codex.common.completion_stats import get_percentile
+    from codex.common.hedging import Hedger
+
+    response = ChatCompletion.model_validate(
+        {
+            "id": "chatcmpl-perf",
+            "object": "chat.completion",
+            "created": 0,
+            "model": "gpt-4o",
+            "choices": [],
+            "usage": {
+                "prompt_tokens": 2000,
+                "completion_tokens": 500,
+                "total_tokens": 2500,
+            },
+        }
+    )
+
+    async def call() -> ChatCompletion:
+        # Typical calls take about 20s, the calls of the tail 3 to 10 times longer
+        latency = random.lognormvariate(3, 0.3)
+        if random.random() < tail:
+            latency *= random.uniform(3, 10)
+        await asyncio.sleep(latency / 100)
+        return response
+
+    async def simulate(hedger: Hedger | None) -> list[float]:
+        loop = asyncio.get_running_loop()
+
+        async def timed() -> float:
+            start = loop.time()
+            if hedger:
+                await hedger.run("perf", 2500, call)
+            else:
+                await call()
+            return (loop.time() - start) * 100
+
+        # Waves of concurrent calls, like the functions of the routes
+        latencies = []
+        for _ in range(calls // 100):
+            latencies += await asyncio.gather(*[timed() for _ in range(100)])
+        return latencies
+
+    random.seed(0)
+    hedger = Hedger(budget=budget)
+    modes = {
+        "plain": asyncio.run(simulate(None)),
+        "hedged": asyncio.run(simulate(hedger)),
+    }
+    click.echo(f"{calls} calls, {tail:.0%} in the slow tail, hedge budget {budget:.0%}")
+    for mode, latencies in modes.items():
+        scaled = [round(latency * 1000) for latency in latencies]
+        click.echo(
+            f"{mode:<7}: P50 {get_percentile(scaled, 50) / 1000:>5.1f}s | "
+            f"P95 {get_percentile(scaled, 95) / 1000:>5.1f}s | "
+            f"P99 {get_percentile(scaled, 99) / 1000:>5.1f}s | "
+            f"max {max(scaled) / 1000:>5.1f}s"
+        )
+    click.echo(
+        f"hedged {hedger.hedged} calls, {hedger.hedges_won} won, extra tokens "
+        f"{hedger.hedged_tokens / hedger.total_tokens:.1%}"
+    )
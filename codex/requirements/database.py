@@ -23,7 +23,12 @@ from codex.api_model import (
     SpecificationsListResponse,
 )
 from codex.common.database import INCLUDE_API_ROUTE
-from codex.common.model import APIRouteSpec, ObjectType, create_object_type
+from codex.common.model import (
+    APIRouteSpec,
+    ObjectType,
+    create_object_type,
+    create_object_types,
+)
 
 
 async def create_single_function_spec(
@@ -66,9 +71,7 @@ async def create_specification(
     ]
     all_models = request_models + response_models
 
-    created_objects = {}
-    for model in all_models:
-        created_objects = await create_object_type(model, created_objects)
+    created_objects = await create_object_types(all_models, {})
 
     create_db: prisma.types.DatabaseSchemaCreateInput | None = None
 
@@ -375,10 +378,14 @@ async def add_route_to_module(
     module_id: str,
     api_route_spec: SpecificationAddRouteToModule,
 ):
-    created_objects = {}
-    for model in [api_route_spec.requestObject, api_route_spec.responseObject]:
-        if model:
-            created_objects = await create_object_type(model, created_objects)
+    created_objects = await create_object_types(
+        [
+            model
+            for model in [api_route_spec.requestObject, api_route_spec.responseObject]
+            if model
+        ],
+        {},
+    )
 
     create_route = APIRouteSpecCreateInput(
         **{
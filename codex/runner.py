@@ -9,7 +9,7 @@ from enum import Enum
 from prisma import Prisma
 from prisma.models import Application
 
-from codex.common.codex_client import CodexClient
+from codex.common.codex_client import CodexClient, LocalCodexClient
 from codex.common.model import ResumePoint
 from codex.interview.model import InterviewResponse
 
@@ -24,13 +24,24 @@ class ResumeStep(Enum):
     DOWNLOAD = 4
 
 
-async def create_benchmark_user(prisma_client: Prisma, base_url: str):
+def get_codex_client(
+    prisma_client: Prisma, base_url: str, local: bool = False
+) -> CodexClient:
+    if local:
+        return LocalCodexClient(client=prisma_client)
+    return CodexClient(client=prisma_client, base_url=base_url)
+
+
+async def create_benchmark_user(
+    prisma_client: Prisma, base_url: str, local: bool = False
+):
     """
     Creates a benchmark user in the database.
 
     Args:
         prisma_client (Prisma): The Prisma client used for database operations.
         base_url (str): The base URL for the Codex client.
+        local (bool): Call the Codex API in this process instead of at the base URL.
 
     Returns:
         str: The ID of the user.
@@ -38,7 +49,7 @@ async def create_benchmark_user(prisma_client: Prisma, base_url: str):
     if not prisma_client.is_connected():
         await prisma_client.connect()
     try:
-        codex_client = CodexClient(client=prisma_client, base_url=base_url)
+        codex_client = get_codex_client(prisma_client, base_url, local)
         timestamp = datetime.datetime.now(datetime.timezone.utc).strftime(
             "%Y-%m-%d %H:%M:%S"
         )
@@ -58,7 +69,8 @@ async def run_task(
     prisma_client: Prisma,
     base_url: str,
     requirements_only: bool = False,
-):
+    local: bool = False,
+) -> bool:
     """
     Runs a task end-to-end.
 
@@ -68,14 +80,15 @@ async def run_task(
         user_id (str): The ID of the user.
         prisma_client (Prisma): The Prisma client.
         base_url (str): The base URL.
+        local (bool): Call the Codex API in this process instead of at the base URL.
 
     Returns:
-        None
+        bool: Whether the task succeeded.
     """
     if not prisma_client.is_connected():
         await prisma_client.connect()
     try:
-        codex_client = CodexClient(client=prisma_client, base_url=base_url)
+        codex_client = get_codex_client(prisma_client, base_url, local)
 
         await codex_client.init(codex_user_id=user_id)
 
@@ -114,12 +127,18 @@ async def run_task(
             )
 
             await get_deployment(codex_client=codex_client, task_name=task_name)
+        return True
     except Exception as e:
         logger.exception(f"Error running task: {e}")
+        return False
 
 
 async def resume(
-    step: ResumeStep, resume_point: ResumePoint, prisma_client: Prisma, base_url: str
+    step: ResumeStep,
+    resume_point: ResumePoint,
+    prisma_client: Prisma,
+    base_url: str,
+    from_checkpoint: bool = False,
 ):
     """
     Resumes the task at the specified step.
@@ -129,6 +148,8 @@ async def resume(
         resume_point (ResumePoint): The resume point containing the task information.
         prisma_client (Prisma): The Prisma client used for database operations.
         base_url (str): The base URL for the Codex client.
+        from_checkpoint (bool): Resume the development of the completed app
+                                from the functions already written.
 
     Raises:
         AssertionError: If the application ID is missing in the resume point.
@@ -166,6 +187,8 @@ async def resume(
             case ResumeStep.DEVELOPMENT:
                 codex_client.interview_id = resume_point.interviewId
                 codex_client.specification_id = resume_point.specificationId
+                if from_checkpoint:
+                    codex_client.deliverable_id = resume_point.completedAppId
             case ResumeStep.COMPILE:
                 codex_client.interview_id = resume_point.interviewId
                 codex_client.specification_id = resume_point.specificationId
@@ -196,6 +219,7 @@ async def resume(
                 codex_client=codex_client,
                 task_name=task_name,
                 resume_point=resume_point,
+                from_checkpoint=from_checkpoint,
             )
 
         if step.value <= ResumeStep.COMPILE.value:
@@ -275,7 +299,10 @@ async def run_specification(
 
 
 async def run_development(
-    codex_client: CodexClient, task_name: str, resume_point: ResumePoint
+    codex_client: CodexClient,
+    task_name: str,
+    resume_point: ResumePoint,
+    from_checkpoint: bool = False,
 ):
     """
     Run the development process.
@@ -284,6 +311,7 @@ async def run_development(
         codex_client (CodexClient): The Codex client object.
         task_name (str): The name of the task.
         resume_point (ResumePoint): The resume point object.
+        from_checkpoint (bool): Resume the development of the existing deliverable.
 
     Raises:
         Exception: If an error occurs during the development process.
@@ -292,8 +320,12 @@ async def run_development(
         None
     """
     try:
-        logger.info(f"[{task_name}] Running Development")
-        await codex_client.generate_deliverable()
+        if from_checkpoint:
+            logger.info(f"[{task_name}] Resuming Development")
+            await codex_client.resume_deliverable()
+        else:
+            logger.info(f"[{task_name}] Running Development")
+            await codex_client.generate_deliverable()
         logger.info(f"[{task_name}] Development Finished")
     except Exception as e:
         logger.exception(f"Error running development: {e}")
@@ -0,0 +1,192 @@
+from pathlib import Path
+
+import pytest
+import regex
+import tiktoken
+from jinja2 import Environment, FileSystemLoader
+from openai.types import CompletionUsage
+from tiktoken_ext import openai_public
+
+from codex.common import ai_model, cascade
+from codex.common.ai_block import AIBlock, ValidatedResponse, get_cached_tokens
+from codex.common.ai_model import MAX_COMPLETION_TOKENS
+from codex.common.completion_stats import (
+    MIN_COMPLETION_TOKENS,
+    get_adaptive_max_tokens,
+    get_percentile,
+)
+
+TEMPLATES_DIR = Path(__file__).parent.parent / "prompts" / "gpt-4o"
+
+
+@pytest.mark.unit
+def test_messages_start_with_the_shared_segments():
+    messages = AIBlock.get_messages("static", "per app", "per call")
+    assert messages == [
+        {"role": "system", "content": "static"},
+        {"role": "user", "content": "per app\n\nper call"},
+    ]
+    assert AIBlock.get_messages("static", "", "per call")[1]["content"] == "per call"
+
+
+@pytest.mark.unit
+def test_develop_prompts_share_their_prefix():
+    env = Environment(loader=FileSystemLoader(TEMPLATES_DIR))
+    app_params = {"goal": "A todo list", "database_schema": "model Task {}"}
+
+    def render(function_name: str) -> str:
+        params = {
+            **app_params,
+            "function_name": function_name,
+            "function_signature": f"def {function_name}() -> None:",
+            "allow_stub": True,
+        }
+        return "\n".join(
+            env.get_template(f"develop/python.{template}.j2").render(**params)
+            for template in ["system", "context", "user"]
+        )
+
+    first, second = render("create_task"), render("list_tasks")
+    prefix_end = first.index("create_task")
+    assert first[:prefix_end] == second[:prefix_end]
+    assert "model Task {}" in first[:prefix_end]
+
+
+@pytest.mark.unit
+def test_cached_tokens():
+    usage = CompletionUsage(
+        completion_tokens=10,
+        prompt_tokens=2000,
+        total_tokens=2010,
+        prompt_tokens_details={"cached_tokens": 1792},
+    )
+    assert get_cached_tokens(usage) == 1792
+    assert (
+        get_cached_tokens(
+            CompletionUsage(completion_tokens=1, prompt_tokens=1, total_tokens=2)
+        )
+        == 0
+    )
+
+
+@pytest.mark.unit
+def test_adaptive_max_tokens():
+    assert get_percentile([300, 100, 200, 400], 50) == 200
+    assert get_percentile([300, 100, 200, 400], 99) == 400
+
+    # Not enough recorded calls
+    assert get_adaptive_max_tokens([300] * 10) == MAX_COMPLETION_TOKENS
+
+    completions = [300] * 95 + [800] * 5
+    max_tokens = get_adaptive_max_tokens(completions)
+    assert 800 <= max_tokens < MAX_COMPLETION_TOKENS
+    assert get_adaptive_max_tokens([3900] * 100) == MAX_COMPLETION_TOKENS
+    assert get_adaptive_max_tokens([10] * 100) == MIN_COMPLETION_TOKENS
+
+
+@pytest.mark.unit
+def test_token_counts_are_memoized(monkeypatch):
+    encoded = []
+
+    class Encoding:
+        def encode(self, text: str, disallowed_special=()) -> list[str]:
+            encoded.append(text)
+            return text.split()
+
+    monkeypatch.setattr(ai_model, "get_encoding", Encoding)
+    ai_model.clear_token_counts()
+
+    system = {"role": "system", "content": "static rules\n\nstatic examples"}
+    first = [system, {"role": "user", "content": "first call"}]
+    second = [system, {"role": "user", "content": "second call"}]
+    # 2 tokens per paragraph, 1 per role, 3 per message and reply
+    assert ai_model.num_tokens_from_messages(first) == 17
+    assert ai_model.num_tokens_from_messages(second) == 17
+    assert encoded.count("static rules\n\n") == 1
+    assert "second call" in encoded
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize("encoding", ["o200k_base", "cl100k_base"])
+def test_token_counts_match_the_whole_prompt(monkeypatch, encoding):
+    env = Environment(loader=FileSystemLoader(TEMPLATES_DIR))
+    params = {
+        "goal": "A todo list",
+        "database_schema": "model Task {\n  id Int @id\n}",
+        "function_name": "create_task",
+        "function_signature": "def create_task(name: str) -> Task:\n    pass",
+        "allow_stub": True,
+    }
+    prompt = "\n\n".join(
+        env.get_template(f"develop/python.{template}.j2").render(**params)
+        for template in ["system", "context", "user", "retry"]
+    )
+
+    # The split pattern of the encoding, with a word per token of the prompt
+    # instead of the downloaded ranks
+    monkeypatch.setattr(openai_public, "load_tiktoken_bpe", lambda *args, **kwargs: {})
+    constructor = openai_public.ENCODING_CONSTRUCTORS[encoding]()
+    ranks = {bytes([i]): i for i in range(256)}
+    for word in regex.findall(constructor["pat_str"], prompt):
+        for end in range(2, len(word.encode()) + 1):
+            ranks.setdefault(word.encode()[:end], len(ranks))
+    constructor["mergeable_ranks"] = ranks
+    tokenizer = tiktoken.Encoding(**constructor)
+    monkeypatch.setattr(ai_model, "get_encoding", lambda: tokenizer)
+    ai_model.clear_token_counts()
+
+    assert ai_model.count_tokens(prompt) == len(tokenizer.encode(prompt))
+
+
+@pytest.mark.asyncio
+async def test_cascade_skips_the_models_escalating_too_often(monkeypatch):
+    escalations = {"gpt-4o-mini": (100, 10), "gpt-3.5-turbo": (100, 80)}
+
+    async def load_escalations(template_name, model, language, cascade_model):
+        return escalations[cascade_model]
+
+    monkeypatch.setattr(cascade, "load_escalations", load_escalations)
+    monkeypatch.setattr(cascade, "CASCADE_EXPLORATION_RATE", 0)
+
+    async def get_first_model(cascade_model):
+        return await cascade.get_first_model("validate", "gpt-4o", None, cascade_model)
+
+    assert await get_first_model(None) == "gpt-4o"
+    assert await get_first_model("gpt-4o-mini") == "gpt-4o-mini"
+    assert await get_first_model("gpt-3.5-turbo") == "gpt-4o"
+
+    # Too few calls to measure the escalation rate
+    assert cascade.should_cascade(5, 5)
+    # The cheap model is still tried on a few calls
+    monkeypatch.setattr(cascade, "CASCADE_EXPLORATION_RATE", 0.05)
+    assert cascade.should_cascade(100, 80, draw=0.01)
+    assert not cascade.should_cascade(100, 80, draw=0.5)
+
+
+@pytest.mark.asyncio
+async def test_truncated_completions_are_called_again(monkeypatch):
+    requests = []
+
+    async def call_llm(request_params: dict) -> ValidatedResponse:
+        requests.append(request_params["max_tokens"])
+        truncated = request_params["max_tokens"] < MAX_COMPLETION_TOKENS
+        return ValidatedResponse(
+            response="cut" if truncated else "complete",
+            usage_statistics=CompletionUsage(
+                completion_tokens=500, prompt_tokens=100, total_tokens=600
+            ),
+            message="",
+            finish_reason="length" if truncated else "stop",
+        )
+
+    block = AIBlock.__new__(AIBlock)
+    monkeypatch.setattr(block, "call_llm", call_llm)
+
+    response = await block.call_llm_untruncated({"max_tokens": 500})
+    assert response.response == "complete"
+    assert requests == [500, MAX_COMPLETION_TOKENS]
+
+    # Completions ending within the limit are kept
+    requests.clear()
+    response = await block.call_llm_untruncated({"max_tokens": MAX_COMPLETION_TOKENS})
+    assert requests == [MAX_COMPLETION_TOKENS]
@@ -482,3 +482,27 @@ def test_visiting_function_with_pass_body():
 
 def get_pydantic_classes(visitor):
     return [c.name for c in visitor.objects if c.is_pydantic]
+
+
+def test_visiting_function_with_source():
+    code = (
+        "@decorator\n"
+        "async def my_function(arg: int) -> str:  # entry point\n"
+        '    """\n'
+        "    Say hello.\n\n"
+        "    Args:\n"
+        "        arg (int): The argument.\n"
+        '    """\n'
+        "    # Comments are kept\n"
+        "    return await hello(arg)\n"
+    )
+    visitor = FunctionVisitor(code)
+    visitor.visit(ast.parse(code))
+
+    function_def = visitor.functions[0]
+    assert function_def.arg_descs == {"arg": "The argument."}
+    assert function_def.function_desc == "Say hello."
+    assert function_def.function_code == code.rstrip()
+    assert function_def.function_template == code.split("    # Comments")[0] + (
+        "    pass"
+    )
@@ -0,0 +1,125 @@
+import asyncio
+import json
+
+import pytest
+
+from codex.common.batch import (
+    BatchError,
+    LLMBatcher,
+    LocalBatchBackend,
+    get_custom_id,
+    read_jsonl,
+    write_jsonl,
+)
+from codex.tests.stubs import completion
+
+
+def request(content: str) -> dict:
+    return {"model": "gpt-4o", "messages": [{"role": "user", "content": content}]}
+
+
+async def echo(body: dict) -> dict:
+    content = body["messages"][0]["content"]
+    if content == "fail":
+        raise ValueError("Invalid request")
+    return completion(content.upper())
+
+
+def get_batcher(
+    tmp_path, backend: LocalBatchBackend, recovery_seconds: float = 60
+) -> LLMBatcher:
+    return LLMBatcher(
+        backend,
+        tmp_path / "state",
+        batch_size=10,
+        flush_seconds=0.05,
+        poll_seconds=0.01,
+        recovery_seconds=recovery_seconds,
+    )
+
+
+def complete_job(job_input, content: str):
+    job_id = job_input.name.split(".")[0]
+    (job_input.parent / f"{job_id}.output.jsonl").write_text(
+        write_jsonl(
+            [
+                {
+                    "custom_id": line["custom_id"],
+                    "response": {"status_code": 200, "body": completion(content)},
+                }
+                for line in read_jsonl(job_input.read_text())
+            ]
+        )
+    )
+
+
+@pytest.mark.asyncio
+async def test_calls_are_collected_into_batch_jobs(tmp_path):
+    backend = LocalBatchBackend(tmp_path / "jobs", echo)
+    batcher = get_batcher(tmp_path, backend)
+
+    responses = await asyncio.gather(
+        *[batcher.chat(request(c)) for c in ["a", "b", "a"]]
+    )
+    assert [r.choices[0].message.content for r in responses] == ["A", "B", "A"]
+
+    # Identical calls are sent once, in a single job
+    (job_input,) = (tmp_path / "jobs").glob("*.input.jsonl")
+    lines = read_jsonl(job_input.read_text())
+    assert [line["body"]["messages"][0]["content"] for line in lines] == ["a", "b"]
+    assert {line["url"] for line in lines} == {"/v1/chat/completions"}
+    assert json.loads((tmp_path / "state" / "jobs.json").read_text()) == {}
+
+    with pytest.raises(BatchError, match="Invalid request"):
+        await batcher.chat(request("fail"))
+
+
+@pytest.mark.asyncio
+async def test_batch_jobs_are_resumed_after_a_restart(tmp_path):
+    # No responder: the job results are written by another process
+    backend = LocalBatchBackend(tmp_path / "jobs")
+    batcher = get_batcher(tmp_path, backend)
+    call = asyncio.create_task(batcher.chat(request("a")))
+    await asyncio.sleep(0.1)
+    call.cancel()
+
+    (job_input,) = (tmp_path / "jobs").glob("*.input.jsonl")
+    job_id = job_input.name.split(".")[0]
+    assert json.loads((tmp_path / "state" / "jobs.json").read_text()) == {
+        job_id: [line["custom_id"] for line in read_jsonl(job_input.read_text())]
+    }
+
+    # The model and max_tokens of a call made again can differ
+    restarted = get_batcher(tmp_path, backend)
+    resumed = asyncio.create_task(
+        restarted.chat({**request("a"), "model": "gpt-4o-mini", "max_tokens": 100})
+    )
+    await asyncio.sleep(0.1)
+    assert not resumed.done()
+
+    complete_job(job_input, "done")
+    assert (await resumed).choices[0].message.content == "done"
+    # No job was submitted again
+    assert len(list((tmp_path / "jobs").glob("*.input.jsonl"))) == 1
+
+
+@pytest.mark.asyncio
+async def test_results_not_asked_for_again_expire(tmp_path):
+    backend = LocalBatchBackend(tmp_path / "jobs")
+    batcher = get_batcher(tmp_path, backend)
+    call = asyncio.create_task(batcher.chat(request("a"), template="develop"))
+    await asyncio.sleep(0.1)
+    call.cancel()
+    (job_input,) = (tmp_path / "jobs").glob("*.input.jsonl")
+
+    restarted = get_batcher(tmp_path, backend, recovery_seconds=0.1)
+    # Polls the job submitted before the restart
+    restarted._start()
+    complete_job(job_input, "done")
+    await asyncio.sleep(0.05)
+    assert len(restarted._recovered) == 1
+
+    # The same messages of another template are another call
+    assert get_custom_id(request("a"), "develop") != get_custom_id(request("a"))
+    await asyncio.sleep(0.1)
+    assert not restarted._recovered and not restarted._unclaimed
@@ -0,0 +1,147 @@
+from datetime import datetime
+
+import pytest
+from prisma.models import Function, ObjectField, ObjectType
+
+import codex.develop.context
+from codex.common.model import ObjectTypeRegistry
+from codex.develop.code_validation import CodeValidator
+from codex.develop.context import select_provided_functions
+from codex.develop.model import GeneratedFunctionResponse
+
+
+def field(name: str, type_name: str) -> ObjectField:
+    return ObjectField(id=name, createdAt=datetime.now(), name=name, typeName=type_name)
+
+
+def function(name: str, args: list[tuple[str, str]], ret: str) -> Function:
+    arg_list = ", ".join(f"{n}: {t}" for n, t in args)
+    return Function.model_construct(
+        id=name,
+        functionName=name,
+        template=f"def {name}({arg_list}) -> {ret}:\n    pass",
+        description=None,
+        FunctionArgs=[field(n, t) for n, t in args],
+        FunctionReturn=field("return", ret),
+    )
+
+
+def object_type(name: str, fields: list[tuple[str, str]]) -> ObjectType:
+    return ObjectType(
+        id=name,
+        createdAt=datetime.now(),
+        name=name,
+        isPydantic=True,
+        isEnum=False,
+        importStatements=[],
+        Fields=[field(n, t) for n, t in fields],
+    )
+
+
+@pytest.mark.unit
+def test_select_provided_functions(monkeypatch):
+    # One token per line, the objects are 3 lines long
+    monkeypatch.setattr(
+        codex.develop.context, "count_tokens", lambda text: len(text.splitlines())
+    )
+    target = function("create_user", [("request", "UserRequest")], "User")
+    target.template = target.template.replace(
+        "pass", '"""Hash the password with hash_password."""\n    pass'
+    )
+    functions = [
+        function("list_orders", [("user_id", "str")], "list[Order]"),
+        function("hash_password", [("password", "str")], "str"),
+        function("get_user", [("user_id", "str")], "User"),
+    ]
+    objects = {
+        "Order": object_type("Order", [("id", "str")]),
+        "User": object_type("User", [("role", "Role")]),
+        "Role": object_type("Role", [("name", "str")]),
+        "UserRequest": object_type("UserRequest", [("email", "str")]),
+    }
+
+    everything, saved_tokens = select_provided_functions(target, functions, objects)
+    assert len(everything) == 7 and saved_tokens == 0
+
+    # The signature objects are always provided, then the referred function
+    selected, saved_tokens = select_provided_functions(
+        target, functions, objects, token_budget=13
+    )
+    assert [t.split("\n")[0] for t in selected] == [
+        "def hash_password(password: str) -> str:",
+        "def get_user(user_id: str) -> User:",
+        "class User(BaseModel):",
+        "class Role(BaseModel):",
+        "class UserRequest(BaseModel):",
+    ]
+    # list_orders and Order are left out
+    assert saved_tokens == 2 + 3
+
+
+@pytest.mark.unit
+def test_functions_are_provided_with_their_objects(monkeypatch):
+    monkeypatch.setattr(
+        codex.develop.context, "count_tokens", lambda text: len(text.splitlines())
+    )
+    target = function("get_user", [("user_id", "str")], "User")
+    target.template = target.template.replace(
+        "pass", '"""Includes the user orders, see get_user_orders."""\n    pass'
+    )
+    functions = [function("get_user_orders", [("user_id", "str")], "list[Order]")]
+    objects = {
+        "User": object_type("User", [("id", "str")]),
+        "Order": object_type("Order", [("item", "Item")]),
+        "Item": object_type("Item", [("name", "str")]),
+    }
+
+    # get_user_orders fits the budget, but not along with Order & Item
+    selected, saved_tokens = select_provided_functions(
+        target, functions, objects, token_budget=3 + 2
+    )
+    assert [t.split("\n")[0] for t in selected] == ["class User(BaseModel):"]
+    assert saved_tokens == 2 + 3 + 3
+
+    selected, saved_tokens = select_provided_functions(
+        target, functions, objects, token_budget=3 + 2 + 3 + 3
+    )
+    assert [t.split("\n")[0] for t in selected] == [
+        "def get_user_orders(user_id: str) -> list[Order]:",
+        "class User(BaseModel):",
+        "class Order(BaseModel):",
+        "class Item(BaseModel):",
+    ]
+    assert saved_tokens == 0
+
+
+@pytest.mark.unit
+def test_the_object_registry_of_the_route_is_not_copied():
+    registry = ObjectTypeRegistry({"User": object_type("User", [("role", "Role")])})
+    validator = CodeValidator(
+        compiled_route_id="route",
+        database_schema="",
+        available_objects=registry,
+    )
+    assert validator.available_objects is registry
+    # Even while the route has no objects yet
+    empty = ObjectTypeRegistry()
+    assert (
+        CodeValidator("route", "", available_objects=empty).available_objects is empty
+    )
+
+    response = GeneratedFunctionResponse(
+        function_name="get_user",
+        compiled_route_id="route",
+        available_objects=registry,
+        available_functions={},
+        template="",
+        rawCode="",
+        packages=[],
+        imports=[],
+        functionCode="",
+        functions=[],
+        objects=[],
+        db_schema="",
+    )
+    # The objects created by the function are added to the registry of the route
+    assert response.available_objects is registry
+    assert set(registry.references["Role"]) == {"role"}
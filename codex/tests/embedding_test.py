@@ -0,0 +1,90 @@
+import numpy as np
+import pytest
+from prisma.models import APIRouteSpec, CompiledRoute
+
+from codex.develop.embedding import HashingEmbedder, NumpyVectorIndex
+
+
+@pytest.mark.asyncio
+async def test_hashing_embedder_is_deterministic():
+    embedder = HashingEmbedder()
+    first = await embedder.embed(["POST /users createUser", "GET /orders"])
+    second = await embedder.embed(["POST /users createUser", "GET /orders"])
+    assert first.shape == (2, embedder.dimensions)
+    assert np.array_equal(first, second)
+    assert np.allclose(np.linalg.norm(first, axis=1), 1)
+
+
+@pytest.mark.asyncio
+async def test_numpy_index_returns_most_similar_routes():
+    embedder = HashingEmbedder()
+    texts = {
+        "create-user": "POST /users create_user Create a new user account",
+        "list-orders": "GET /orders list_orders List the orders of a customer",
+        "delete-user": "DELETE /users/{id} delete_user Delete a user account",
+    }
+    index = NumpyVectorIndex(embedder.dimensions, path=None)
+    for route_id, embedding in zip(texts, await embedder.embed(list(texts.values()))):
+        await index.add(route_id, embedding)
+
+    query = await embedder.embed(["POST /accounts registerUser Create user account"])
+    matches = await index.search(query[0], k=2)
+    assert [route_id for route_id, _ in matches] == ["create-user", "delete-user"]
+    assert matches[0][1] > matches[1][1]
+    assert await index.search(query[0], k=10) and len(index) == 3
+
+
+class CountingEmbedder(HashingEmbedder):
+    def __init__(self):
+        self.embedded: list[str] = []
+
+    async def embed(self, texts: list[str]) -> np.ndarray:
+        self.embedded.extend(texts)
+        return await super().embed(texts)
+
+
+def compiled_route(name: str) -> CompiledRoute:
+    return CompiledRoute.model_construct(
+        id=name,
+        ApiRouteSpec=APIRouteSpec.model_construct(
+            method="GET",
+            path=f"/{name}",
+            functionName=name,
+            description=f"Get the {name}",
+            RequestObject=None,
+            ResponseObject=None,
+        ),
+    )
+
+
+@pytest.mark.asyncio
+async def test_numpy_index_only_embeds_new_routes(tmp_path):
+    path = tmp_path / "routes.npz"
+    embedder = CountingEmbedder()
+    await NumpyVectorIndex(embedder.dimensions, path).add_routes(
+        [compiled_route("users"), compiled_route("orders")], embedder
+    )
+    assert len(embedder.embedded) == 2
+
+    # After a restart
+    embedder = CountingEmbedder()
+    index = NumpyVectorIndex(embedder.dimensions, path)
+    await index.add_routes(
+        [compiled_route(name) for name in ["items", "users", "orders"]], embedder
+    )
+    assert embedder.embedded == [
+        "GET /items items\nGet the items\nRequest: None\nResponse: None"
+    ]
+    assert index.ids == ["users", "orders", "items"]
+    query = await embedder.embed(["GET /orders orders Get the orders"])
+    assert (await index.search(query[0], k=1))[0][0] == "orders"
+
+    # The embeddings of another embedder are not comparable
+    class OtherEmbedder(CountingEmbedder):
+        pass
+
+    other = OtherEmbedder()
+    await NumpyVectorIndex(other.dimensions, path).add_routes(
+        [compiled_route("users")], other
+    )
+    assert len(other.embedded) == 1
@@ -1,8 +1,16 @@
+import asyncio
+import os
 from shutil import which
 
 import pytest
 
-from codex.common.exec_external_tool import OutputType, exec_external_on_contents
+from codex.common.exec_external_tool import (
+    OutputType,
+    VenvCloneMode,
+    clone_virtual_env,
+    exec_external_on_contents,
+    execute_command,
+)
 
 
 @pytest.mark.asyncio
@@ -88,3 +96,47 @@ async def test_exec_external_with_prisma():
         command_arguments, file_contents, output_type=OutputType.STD_ERR
     )
     assert result == expected_output
+
+
+@pytest.mark.asyncio
+async def test_clone_virtual_env_hardlink(tmp_path):
+    src = tmp_path / "src"
+    site_packages = src / "lib" / "python3.11" / "site-packages"
+    (src / "bin").mkdir(parents=True)
+    (site_packages / "prisma").mkdir(parents=True)
+    (src / "bin" / "pip").write_text(f"#!{src}/bin/python\nimport pip\n")
+    (src / "pyvenv.cfg").write_text("include-system-site-packages = false\n")
+    (site_packages / "six.py").write_text("print('six')\n")
+    (site_packages / "prisma" / "client.py").write_text("# generated\n")
+    os.symlink("lib", src / "lib64")
+
+    dst = tmp_path / "dst"
+    stats = await clone_virtual_env(src, dst, mode=VenvCloneMode.HARDLINK)
+
+    assert stats.hardlinked == 1
+    assert stats.rewritten == 1
+    assert (dst / "bin" / "pip").read_text().startswith(f"#!{dst}/bin/python")
+    assert os.readlink(dst / "lib64") == "lib"
+
+    dst_site_packages = dst / "lib" / "python3.11" / "site-packages"
+    assert (dst_site_packages / "six.py").samefile(site_packages / "six.py")
+    # Mutable packages are regenerated in place, so they must not share inodes
+    assert not (dst_site_packages / "prisma" / "client.py").samefile(
+        site_packages / "prisma" / "client.py"
+    )
+
+
+@pytest.mark.asyncio
+async def test_execute_command_cancel_kills_process(tmp_path):
+    pid_file = tmp_path / "pid"
+    task = asyncio.ensure_future(
+        execute_command(["sh", "-c", f"echo $$ > {pid_file}; exec sleep 30"], tmp_path)
+    )
+    while not pid_file.exists() or not pid_file.read_text().strip():
+        await asyncio.sleep(0.01)
+
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+    with pytest.raises(ProcessLookupError):
+        os.kill(int(pid_file.read_text()), 0)
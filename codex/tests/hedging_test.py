@@ -0,0 +1,94 @@
+import asyncio
+
+import pytest
+from openai.types.chat import ChatCompletion
+
+from codex.common.hedging import Hedger
+from codex.tests.stubs import completion
+
+KEY = "develop/python (gpt-4o)"
+
+
+def calls(*delays: float, failing: frozenset[int] = frozenset()):
+    """
+    Calls answering after the given delays in turn with their index,
+    or failing for the given indexes.
+    """
+    started = []
+
+    async def call() -> ChatCompletion:
+        index = len(started)
+        started.append(index)
+        await asyncio.sleep(delays[index])
+        if index in failing:
+            raise ConnectionError("Call failed")
+        return ChatCompletion.model_validate(completion(str(index)))
+
+    return call, started
+
+
+def get_hedger(budget: float = 0.5) -> Hedger:
+    hedger = Hedger(percentile=95, budget=budget, min_samples=20)
+    for _ in range(20):
+        hedger.record(KEY, 0.05, 100)
+    return hedger
+
+
+@pytest.mark.asyncio
+async def test_slow_calls_are_hedged():
+    hedger = get_hedger()
+    assert hedger.get_hedge_delay(KEY) == 0.05
+    assert hedger.get_hedge_delay("other") is None
+
+    call, started = calls(1.0, 0.01)
+    response = await hedger.run(KEY, 100, call)
+    assert response.choices[0].message.content == "1"
+    assert started == [0, 1]
+    assert hedger.hedged == hedger.hedges_won == 1
+    # The reserved tokens are replaced by the tokens the winner used
+    assert hedger.hedged_tokens == response.usage.total_tokens
+
+    # Fast calls are not duplicated
+    call, started = calls(0.01)
+    assert (await hedger.run(KEY, 100, call)).choices[0].message.content == "0"
+    assert started == [0]
+
+
+@pytest.mark.asyncio
+async def test_hedges_are_bounded_by_the_budget():
+    hedger = get_hedger(budget=0.05)
+    call, started = calls(0.2, 0.01)
+    assert (await hedger.run(KEY, 200, call)).choices[0].message.content == "0"
+    assert started == [0]
+    assert hedger.hedged == 0
+
+
+@pytest.mark.asyncio
+async def test_failed_calls_wait_for_their_hedge():
+    hedger = get_hedger()
+    call, _ = calls(0.1, 0.2, failing={0})
+    assert (await hedger.run(KEY, 100, call)).choices[0].message.content == "1"
+
+    call, _ = calls(0.2, 0.01, failing={1})
+    assert (await hedger.run(KEY, 100, call)).choices[0].message.content == "0"
+
+    hedger.budget = 0
+    call, _ = calls(0.1, failing={0})
+    with pytest.raises(ConnectionError):
+        await hedger.run(KEY, 100, call)
+
+
+@pytest.mark.asyncio
+async def test_hedged_calls_are_recorded_as_slow():
+    hedger = get_hedger()
+    call, _ = calls(0.2, 0.01)
+    await hedger.run(KEY, 100, call)
+    assert hedger.latencies[KEY][-1] >= 0.05
+
+    # The tokens reserved for a hedge are released when both calls fail
+    call, _ = calls(0.1, 0.1, failing=frozenset({0, 1}))
+    hedged_tokens = hedger.hedged_tokens
+    with pytest.raises(ConnectionError):
+        await hedger.run(KEY, 100, call)
+    assert hedger.hedged == 2
+    assert hedger.hedged_tokens == hedged_tokens
@@ -0,0 +1,169 @@
+import asyncio
+import contextlib
+
+import httpx
+import openai
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+from openai import AsyncOpenAI
+
+from codex.common import llm_router
+from codex.common.llm_router import LLMEndpoint, LLMRouter
+from codex.tests.stubs import completion
+
+REQUEST = {"model": "gpt-4o", "messages": [{"role": "user", "content": "Hello"}]}
+
+
+class StubEndpoint:
+    """
+    Local OpenAI-compatible server answering with the given statuses in turn,
+    then successfully after the given delay.
+    """
+
+    def __init__(self, name: str, statuses: tuple[int, ...] = (), delay: float = 0):
+        self.name = name
+        self.statuses = list(statuses)
+        self.delay = delay
+        self.calls = 0
+
+    async def handle(self, request: web.Request) -> web.Response:
+        self.calls += 1
+        if self.statuses:
+            status = self.statuses.pop(0)
+            return web.json_response(
+                {"error": {"message": f"{self.name} failed", "type": "error"}},
+                status=status,
+                headers={"retry-after-ms": "200"} if status == 429 else {},
+            )
+        await asyncio.sleep(self.delay)
+        return web.json_response(completion(self.name))
+
+
+@contextlib.asynccontextmanager
+async def serve(*stubs: StubEndpoint):
+    servers = []
+    for stub in stubs:
+        app = web.Application()
+        app.router.add_post("/v1/chat/completions", stub.handle)
+        server = TestServer(app)
+        await server.start_server()
+        servers.append(server)
+    try:
+        yield LLMRouter(
+            [
+                LLMEndpoint(
+                    stub.name,
+                    AsyncOpenAI(
+                        base_url=str(server.make_url("/v1")),
+                        api_key="test",
+                        max_retries=0,
+                    ),
+                )
+                for stub, server in zip(stubs, servers)
+            ]
+        )
+    finally:
+        for server in servers:
+            await server.close()
+
+
+async def chat(router: LLMRouter) -> str:
+    response = await router.chat(dict(REQUEST), tokens=100)
+    return response.choices[0].message.content or ""
+
+
+@pytest.mark.asyncio
+async def test_router_fails_over_rate_limited_endpoints():
+    limited, healthy = StubEndpoint("limited", (429,)), StubEndpoint("healthy")
+    async with serve(limited, healthy) as router:
+        assert await chat(router) == "healthy"
+        # The rate limited endpoint is not used until its Retry-After delay
+        assert await chat(router) == "healthy"
+        assert limited.calls == 1
+        assert router.endpoints[0].failures == 0
+
+        await asyncio.sleep(0.2)
+        router.endpoints[1].latency = 1.0
+        assert await chat(router) == "limited"
+
+
+@pytest.mark.asyncio
+async def test_router_opens_the_circuit_of_failing_endpoints(monkeypatch):
+    monkeypatch.setattr(llm_router, "CIRCUIT_FAILURE_THRESHOLD", 2)
+    monkeypatch.setattr(llm_router, "CIRCUIT_OPEN_SECONDS", 0.3)
+    monkeypatch.setattr(llm_router, "BACKOFF_BASE_SECONDS", 0)
+    failing, healthy = StubEndpoint("failing", (500, 502, 503)), StubEndpoint("healthy")
+    async with serve(failing, healthy) as router:
+        endpoint = router.endpoints[0]
+        healthy_endpoint = router.endpoints[1]
+        for _ in range(2):
+            healthy_endpoint.latency = None
+            assert await chat(router) == "healthy"
+        assert endpoint.circuit_open and failing.calls == 2
+
+        # Not called while its circuit is open, then probed by a single call
+        for _ in range(3):
+            assert await chat(router) == "healthy"
+        assert failing.calls == 2
+        await asyncio.sleep(0.3)
+        assert await chat(router) == "healthy"
+        assert failing.calls == 3 and endpoint.circuit_open
+
+        await asyncio.sleep(0.3)
+        healthy_endpoint.latency = 1.0
+        assert await chat(router) == "failing"
+        assert not endpoint.circuit_open
+
+
+@pytest.mark.asyncio
+async def test_router_prefers_the_fastest_endpoint():
+    slow, fast = StubEndpoint("slow", delay=0.2), StubEndpoint("fast")
+    async with serve(slow, fast) as router:
+        # The endpoints without observed latency are tried first
+        assert [await chat(router) for _ in range(4)] == [
+            "slow",
+            "fast",
+            "fast",
+            "fast",
+        ]
+        assert router.endpoints[0].latency > router.endpoints[1].latency
+
+
+@pytest.mark.asyncio
+async def test_router_raises_the_request_errors():
+    invalid, healthy = StubEndpoint("invalid", (400,)), StubEndpoint("healthy")
+    async with serve(invalid, healthy) as router:
+        with pytest.raises(openai.BadRequestError):
+            await chat(router)
+        assert healthy.calls == 0
+        assert router.endpoints[0].in_flight == 0
+
+
+@pytest.mark.unit
+def test_backoff_is_jittered_and_bounded():
+    delays = [llm_router.get_backoff(failures) for failures in range(1, 20)]
+    assert all(0 <= d <= llm_router.BACKOFF_MAX_SECONDS for d in delays)
+    assert len(set(delays)) > 1
+
+
+@pytest.mark.unit
+def test_malformed_retry_after_headers_are_ignored():
+    def error(headers: dict[str, str]) -> openai.RateLimitError:
+        request = httpx.Request("POST", "http://stub/v1/chat/completions")
+        response = httpx.Response(429, headers=headers, request=request)
+        return openai.RateLimitError("Rate limited", response=response, body=None)
+
+    assert llm_router.get_retry_after(error({"retry-after-ms": "250"})) == 0.25
+    assert llm_router.get_retry_after(error({"retry-after-ms": "soon"})) is None
+    assert (
+        llm_router.get_retry_after(error({"retry-after-ms": "x", "retry-after": "2"}))
+        == 2
+    )
+    assert llm_router.get_retry_after(error({"retry-after": "tomorrow"})) is None
+    assert (
+        llm_router.get_retry_after(
+            error({"retry-after": "Wed, 21 Oct 2015 07:28:00 GMT"})
+        )
+        == 0
+    )
@@ -1,11 +1,18 @@
+from datetime import datetime
+
 import pytest
 from dotenv import load_dotenv
+from prisma.models import ObjectField, ObjectType
 
 from codex.api_model import ObjectFieldModel, ObjectTypeModel
 from codex.app import db_client
 from codex.common.ai_model import OpenAIChatClient
 from codex.common.logging_config import setup_logging
-from codex.common.model import create_object_type
+from codex.common.model import (
+    ObjectTypeRegistry,
+    create_object_type,
+    flatten_object_types,
+)
 
 load_dotenv()
 setup_logging()
@@ -13,11 +20,21 @@ setup_logging()
 
 @pytest.mark.asyncio
 @pytest.mark.integration_test
-async def test_create_nested_object_type():
+async def test_create_nested_object_type(monkeypatch):
     if not OpenAIChatClient._configured:
         OpenAIChatClient.configure({})
     await db_client.connect()
 
+    # Count the round trips to the query engine, a batch counting as one
+    queries = []
+    query = db_client._engine.query
+
+    async def counted_query(*args, **kwargs):
+        queries.append(args)
+        return await query(*args, **kwargs)
+
+    monkeypatch.setattr(db_client._engine, "query", counted_query)
+
     object_type = ObjectTypeModel(
         name="SyncExternalCalendarRequest",
         description="Request model for synchronizing a professional's schedule with an external calendar service. Includes credentials for accessing the external calendar, as well as the ID of the professional's schedule to be synchronized.",
@@ -59,6 +76,8 @@ async def test_create_nested_object_type():
     )
     created_objects = await create_object_type(object_type, {})
     assert created_objects is not None
+    # The objects, their fields and their links are written in a single batch
+    assert len(queries) == 1
     assert len(created_objects) == 2
 
     assert "SyncExternalCalendarRequest" in created_objects
@@ -70,3 +89,80 @@ async def test_create_nested_object_type():
 
     assert "SyncOptions" in created_objects
     assert created_objects["SyncOptions"] is not None
+
+
+@pytest.mark.unit
+def test_flatten_object_types():
+    role = ObjectTypeModel(
+        name="Role", Fields=[ObjectFieldModel(name="name", type="str")]
+    )
+    user = ObjectTypeModel(
+        name="User",
+        Fields=[
+            ObjectFieldModel(name="role", type="Role", related_types=[role]),
+            ObjectFieldModel(name="friends", type="list[User]"),
+        ],
+    )
+    team = ObjectTypeModel(
+        name="Team",
+        Fields=[
+            ObjectFieldModel(name="members", type="list[User]", related_types=[user]),
+            ObjectFieldModel(name="roles", type="list[Role]", related_types=[role]),
+        ],
+    )
+
+    flattened = flatten_object_types([team, user], {})
+    assert [o.name for o in flattened] == ["Role", "User", "Team"]
+
+    available = {
+        "Role": ObjectType(
+            id="role",
+            createdAt=datetime.now(),
+            name="Role",
+            isPydantic=True,
+            isEnum=False,
+            importStatements=[],
+        )
+    }
+    flattened = flatten_object_types([team], available)
+    assert [o.name for o in flattened] == ["User", "Team"]
+
+
+@pytest.mark.unit
+def test_object_type_registry_references():
+    def object_type(name: str, fields: dict[str, str]) -> ObjectType:
+        return ObjectType(
+            id=name.lower(),
+            createdAt=datetime.now(),
+            name=name,
+            isPydantic=True,
+            isEnum=False,
+            importStatements=[],
+            Fields=[
+                ObjectField(
+                    id=f"{name}.{field}",
+                    createdAt=datetime.now(),
+                    name=field,
+                    typeName=type_name,
+                )
+                for field, type_name in fields.items()
+            ],
+        )
+
+    registry = ObjectTypeRegistry(
+        {"Team": object_type("Team", {"members": "list[User]", "lead": "User"})}
+    )
+    registry["Order"] = object_type("Order", {"owner": "Optional[User]"})
+    assert set(registry.references["User"]) == {
+        "Team.members",
+        "Team.lead",
+        "Order.owner",
+    }
+
+    registry["Team"] = object_type("Team", {"roles": "dict[str, Role]"})
+    assert set(registry.references["User"]) == {"Order.owner"}
+    assert set(registry.references["Role"]) == {"Team.roles"}
+
+    del registry["Order"]
+    assert not registry.references["User"]
+    assert list(registry) == ["Team"]
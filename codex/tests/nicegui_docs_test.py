@@ -0,0 +1,66 @@
+from pathlib import Path
+
+import pytest
+
+from codex.develop.nicegui_docs import (
+    BM25Index,
+    get_nicegui_docs,
+    split_doc_components,
+    split_sections,
+)
+
+TEMPLATES_DIR = Path(__file__).parent.parent / "prompts" / "gpt-4o"
+
+
+@pytest.mark.unit
+def test_split_doc_components_ignores_code_comments():
+    doc = """Introduction
+
+# *Controls*
+
+## Button
+```python
+# a comment, not a section
+ui.button('Click')
+```
+
+## Checkbox
+A checkbox.
+
+# *Layout*
+
+## Card
+A card.
+"""
+    assert split_doc_components(doc) == [
+        "# *Controls*\n\n## Button\n```python\n# a comment, not a section\n"
+        "ui.button('Click')\n```",
+        "# *Controls*\n\n## Checkbox\nA checkbox.",
+        "# *Layout*\n\n## Card\nA card.",
+    ]
+    assert len(split_sections(doc, 1)) == 2
+
+
+@pytest.mark.unit
+def test_bm25_ranks_matching_documents():
+    index = BM25Index(
+        [
+            "## Button\nA clickable button with an on_click handler.",
+            "## Table\nDisplay rows in a table with columns.",
+            "## Checkbox\nA checkbox bound to a value.",
+        ]
+    )
+    assert index.search("show the orders in a table of rows", 2) == [1]
+    assert index.search("onClick button & checkbox", 3)[0] == 0
+    assert index.search("unrelated", 3) == []
+
+
+@pytest.mark.unit
+def test_nicegui_docs_are_sliced():
+    params = get_nicegui_docs(
+        TEMPLATES_DIR, "/todos todo_list_page Add tasks with an input and a checkbox"
+    )
+    docs, examples = params["nicegui_docs"], params["nicegui_examples"]
+    assert "## Checkbox" in docs and "## Text Input" in docs
+    assert "# Todo list" in examples
+    assert len(docs) < len((TEMPLATES_DIR / "develop" / "nicegui.doc.j2").read_text())
@@ -0,0 +1,89 @@
+import pytest
+
+from codex.common.ai_block import (
+    LineValidationError,
+    ListValidationError,
+    ValidationError,
+)
+from codex.develop.retry import apply_patch, get_compact_retry, patch_generation
+
+CODE = "\n".join(
+    [
+        "def add(a: int, b: int) -> int:",
+        "    return a + c",
+        "",
+        "",
+        "def sub(a: int, b: int) -> int:",
+        "    return a - c",
+        "",
+        "",
+        "def mul(a: int, b: int) -> int:",
+        "    return a * b",
+    ]
+)
+
+
+@pytest.mark.unit
+def test_compact_retry_shows_failing_regions():
+    # The validated code has the imports added before the generated code
+    validated = "import math\n\n" + CODE
+    error = ListValidationError(
+        "Error developing `add`",
+        [
+            LineValidationError('"c" is not defined', validated, 4),
+            LineValidationError('"c" is not defined', validated, 8),
+            ValidationError("Main function is missing"),
+        ],
+    )
+    regions, errors = get_compact_retry(CODE, error, context_lines=1)
+    assert regions == [
+        " 1 | def add(a: int, b: int) -> int:\n 2 |     return a + c\n 3 | ",
+        " 5 | def sub(a: int, b: int) -> int:\n 6 |     return a - c\n 7 | ",
+    ]
+    assert errors == ['line 2, 6: "c" is not defined', "Main function is missing"]
+    assert get_compact_retry(CODE, ValidationError("Main function is missing")) is None
+
+
+@pytest.mark.unit
+def test_apply_patch():
+    reply = """The variable `c` is not defined.
+
+```replace 6-6
+ 6 |     return a - b
+```
+
+```replace 2-2
+    return a + b
+```
+"""
+    patched = apply_patch(CODE, reply)
+    assert patched == CODE.replace(" c", " b")
+    assert apply_patch(CODE, "No fix") is None
+
+    with pytest.raises(ValidationError):
+        apply_patch(CODE, "```replace 2-12\npass\n```")
+    with pytest.raises(ValidationError):
+        apply_patch(CODE, "```replace 1-2\npass\n```\n```replace 2-3\npass\n```")
+
+
+@pytest.mark.unit
+def test_patch_generation_keeps_requirements():
+    generation = f"```requirements\nrequests\n```\n```python\n{CODE}\n```"
+    patched = patch_generation(generation, CODE, "```replace 2-2\n    return a\n```")
+    assert patched.startswith("```requirements\nrequests\n```")
+    assert "    return a\n" in patched
+
+    rewrite = "```python\ndef add(a: int, b: int) -> int:\n    return a + b\n```"
+    assert patch_generation(generation, CODE, rewrite) == rewrite
+    with pytest.raises(ValidationError):
+        patch_generation(generation, CODE, "I fixed it")
+
+
+@pytest.mark.unit
+def test_develop_blocks_send_the_compact_retries():
+    # Imports the whole develop phase
+    import codex.develop.agent  # noqa: F401
+    from codex.develop.develop import DevelopAIBlock, NiceGUIDevelopAIBlock
+
+    assert issubclass(NiceGUIDevelopAIBlock, DevelopAIBlock)
+    assert "load_retry_prompt" in vars(DevelopAIBlock)
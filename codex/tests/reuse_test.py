@@ -0,0 +1,81 @@
+import asyncio
+
+import pytest
+from prisma.models import Function
+
+from codex.develop.reuse import (
+    SharedFunctions,
+    get_database_definitions,
+    get_database_entities,
+    get_signature_hash,
+)
+
+
+@pytest.mark.unit
+def test_signature_hash_normalizes_types():
+    assert get_signature_hash([("ids", "List[str]")], "Optional[int]") == (
+        get_signature_hash([("ids", "list[str]")], "int | None")
+    )
+    assert get_signature_hash([("ids", "list[str]")], None) != (
+        get_signature_hash([("names", "list[str]")], None)
+    )
+
+
+@pytest.mark.unit
+def test_database_definitions():
+    schema = """
+    model User {
+      id    Int    @id
+      email String
+    }
+
+    enum Role {
+      ADMIN
+      USER
+    }
+    """
+    definitions = get_database_definitions(schema)
+    assert set(definitions) == {"User", "Role"}
+    assert definitions["Role"] == "enum Role { ADMIN USER }"
+
+
+@pytest.mark.unit
+def test_database_entities():
+    code = """
+from prisma.models import User, Order as UserOrder
+from prisma.enums import (
+    Role,
+    Status,
+)
+import prisma.models
+
+async def get_items():
+    return await prisma.models.Item.prisma().find_many()
+"""
+    assert get_database_entities(code) == {"User", "Order", "Role", "Status", "Item"}
+
+
+@pytest.mark.asyncio
+async def test_shared_functions_are_developed_once():
+    def function(id: str, name: str = "hash_password") -> Function:
+        return Function.model_construct(
+            id=id, functionName=name, signatureHash="signature", ChildFunctions=[]
+        )
+
+    shared_functions = SharedFunctions()
+    assert await shared_functions.acquire(function("route-1")) is None
+    assert await shared_functions.acquire(function("route-1-other", "other")) is None
+
+    waiting = asyncio.create_task(shared_functions.acquire(function("route-2")))
+    await asyncio.sleep(0)
+    assert not waiting.done()
+
+    developed = function("route-1")
+    shared_functions.release(function("route-1"), developed)
+    assert await waiting is developed
+    assert await shared_functions.acquire(function("route-3")) is developed
+    assert shared_functions.shared == 2
+
+    # Failed functions are developed again by the next route
+    shared_functions.release(function("route-1-other", "other"), None)
+    assert await shared_functions.acquire(function("route-4", "other")) is None
@@ -0,0 +1,69 @@
+import asyncio
+
+import pytest
+
+from codex.develop.scheduler import WorkScheduler
+
+
+@pytest.mark.asyncio
+async def test_scheduler_bounds_concurrency():
+    scheduler = WorkScheduler(max_concurrency=2)
+    max_running = 0
+
+    async def work():
+        nonlocal max_running
+        async with scheduler.slot():
+            max_running = max(max_running, scheduler.running)
+            await asyncio.sleep(0.01)
+
+    await asyncio.gather(*[scheduler.spawn(work()) for _ in range(6)])
+    assert max_running == 2
+    assert scheduler.completed == 6
+    assert scheduler.running == 0
+
+
+@pytest.mark.asyncio
+async def test_scheduler_runs_longest_path_first():
+    scheduler = WorkScheduler(max_concurrency=1)
+    order = []
+    blocker = asyncio.Event()
+
+    async def work(name: str, priority: int):
+        async with scheduler.slot(priority):
+            if name == "blocker":
+                await blocker.wait()
+            order.append(name)
+
+    first = scheduler.spawn(work("blocker", 0))
+    await asyncio.sleep(0)
+    tasks = [
+        scheduler.spawn(work(name, priority))
+        for name, priority in [("leaf", 1), ("root", 3), ("child", 2), ("leaf2", 1)]
+    ]
+    await asyncio.sleep(0)
+    blocker.set()
+    await asyncio.gather(first, *tasks)
+    assert order == ["blocker", "root", "child", "leaf", "leaf2"]
+
+
+@pytest.mark.asyncio
+async def test_scheduler_cancel():
+    scheduler = WorkScheduler(max_concurrency=1)
+
+    async def work():
+        async with scheduler.slot():
+            await asyncio.sleep(10)
+
+    tasks = [scheduler.spawn(work()) for _ in range(3)]
+    await asyncio.sleep(0)
+    assert scheduler.cancel() == 3
+    assert scheduler.interrupted == 1
+    assert scheduler.skipped == 2
+
+    results = await asyncio.gather(*tasks, return_exceptions=True)
+    assert all(isinstance(r, asyncio.CancelledError) for r in results)
+    assert scheduler.running == 0
+
+    with pytest.raises(asyncio.CancelledError):
+        async with scheduler.slot():
+            pass
@@ -1,6 +1,7 @@
 import pytest
 
 from codex.common.model import extract_field_type, is_type_equal
+from codex.common.types import normalize_type, parse_type
 
 
 @pytest.mark.unit
@@ -41,3 +42,21 @@ def test_is_type_equal():
         )
         is False
     )
+
+
+@pytest.mark.unit
+def test_parse_type_interns_expressions():
+    assert parse_type("list[str]") is parse_type("[ str ]")
+    assert parse_type("Optional[User]") is parse_type("User | None")
+    assert parse_type("Dict[str, int]") is not parse_type("Dict[int, str]")
+    assert parse_type("tuple[str, int]").children == (
+        parse_type("str"),
+        parse_type("int"),
+    )
+
+
+@pytest.mark.unit
+def test_normalize_type():
+    assert normalize_type("dict[str, int | float]") == "Dict[str, Union[int, float]]"
+    assert normalize_type("list[User] | None") == "Optional[List[User]]"
+    assert normalize_type("List[User]", {"User": "models.User"}) == "List[models.User]"
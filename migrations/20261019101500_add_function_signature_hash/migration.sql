@@ -0,0 +1,5 @@
+-- AlterTable
+ALTER TABLE "Function" ADD COLUMN     "signatureHash" TEXT;
+
+-- CreateIndex
+CREATE INDEX "Function_signatureHash_idx" ON "Function"("signatureHash");
@@ -0,0 +1,2 @@
+-- AlterTable
+ALTER TABLE "CompiledRoute" ADD COLUMN     "specHash" TEXT;
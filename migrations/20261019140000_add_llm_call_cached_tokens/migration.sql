@@ -0,0 +1,2 @@
+-- AlterTable
+ALTER TABLE "LLMCallAttempt" ADD COLUMN     "cachedPromptTokens" INTEGER NOT NULL DEFAULT 0;